@@ -5,128 +5,456 @@ With Basic Auth protection
 """
 
 import os
-import base64
+import sys
+import math
+import time
+import asyncio
+import heapq
+import contextlib
+import itertools
+import contextvars
+import collections
 import httpx
-from fastmcp import FastMCP
-
-# Auth credentials from env or defaults
-AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "ackizit")
-AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "!Lam3ute!75")
+import msgspec
+from typing import Any
+from fastmcp import FastMCP, Context
+from fastmcp.exceptions import ToolError
+
+# Shared runtime (common/runtime.py), copied next to this file in the image
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+import runtime  # noqa: E402
+from runtime import (  # noqa: E402
+    create_authenticated_app, Hedger, setup, SharedTransport, Warmup, HEDGE_ENABLED
+)
 
 mcp = FastMCP("Annuaire Entreprises")
+setup(mcp, "mcp-annuaire")
+
+# Public API (overridable for local mocks and benchmarks)
+ANNUAIRE_API_URL = os.environ.get("ANNUAIRE_API_URL", "https://recherche-entreprises.api.gouv.fr")
+ANNUAIRE_MAX_PER_PAGE = 25
+ANNUAIRE_MAX_RESULTS = 10000
+# Results annuaire_recherche_all returns in its body; beyond, they are only streamed
+ANNUAIRE_MAX_RETURNED = 500
+# Response blocks the API only returns in minimal mode when asked with `include`
+ANNUAIRE_INCLUDE_FIELDS = ("siege", "dirigeants", "matching_etablissements", "finances", "complements", "score")
+ANNUAIRE_DEFAULT_INCLUDE = ["siege", "dirigeants"]
+
+
+# Rate governor: recherche-entreprises.api.gouv.fr allows 7 requests/second per
+# client. Every request waits for a token from a process-wide bucket, served by
+# priority (interactive lookups before batch traffic). The rate is halved on 429
+# (pausing for Retry-After) and recovers additively on success (AIMD).
+ANNUAIRE_RATE_LIMIT = float(os.environ.get("ANNUAIRE_RATE_LIMIT", "7"))
+ANNUAIRE_RATE_MIN = 0.5
+ANNUAIRE_RATE_STEP = 0.1
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+_request_priority = contextvars.ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextlib.contextmanager
+def request_priority(priority: int):
+    """Run a block whose annuaire requests queue at the given priority."""
+    token = _request_priority.set(priority)
+    try:
+        yield
+    finally:
+        _request_priority.reset(token)
+
+
+class RateGovernor:
+    """Async token bucket with a priority wait queue and AIMD rate adaptation."""
+
+    def __init__(self, max_rate: float):
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.dispatcher = None
+        self.stats = {"granted": 0, "throttled": 0, "wait_total_s": 0.0, "wait_max_s": 0.0}
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> float:
+        """Wait for a request slot; returns the time spent waiting."""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        heapq.heappush(self.waiters, (priority, next(self.sequence), future))
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = loop.create_task(self._dispatch(), context=contextvars.Context())
+        await future
+
+        waited = time.monotonic() - started
+        self.stats["granted"] += 1
+        self.stats["wait_total_s"] += waited
+        self.stats["wait_max_s"] = max(self.stats["wait_max_s"], waited)
+        return waited
+
+    async def _dispatch(self):
+        while self.waiters:
+            now = time.monotonic()
+            # Burst capacity is one second of traffic at the current rate
+            self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(self.paused_until - now, (1 - self.tokens) / self.rate)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            _, _, future = heapq.heappop(self.waiters)
+            if future.done():
+                # Waiter was cancelled while queued
+                continue
+            self.tokens -= 1
+            future.set_result(None)
+
+    def observe(self, status: int, retry_after: str = None):
+        if status == 429:
+            self.stats["throttled"] += 1
+            self.rate = max(ANNUAIRE_RATE_MIN, self.rate / 2)
+            pause = float(retry_after) if retry_after and retry_after.isdigit() else 1 / self.rate
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.tokens = 0.0
+        elif status < 500:
+            self.rate = min(self.max_rate, self.rate + ANNUAIRE_RATE_STEP)
+
+    def snapshot(self) -> dict:
+        granted = self.stats["granted"]
+        return {
+            "rate_per_s": round(self.rate, 2),
+            "max_rate_per_s": self.max_rate,
+            "queue_depth": sum(1 for *_, f in self.waiters if not f.done()),
+            "paused_for_s": round(max(0.0, self.paused_until - time.monotonic()), 2),
+            "granted": granted,
+            "throttled_429": self.stats["throttled"],
+            "wait_mean_ms": round(self.stats["wait_total_s"] / granted * 1000, 1) if granted else 0.0,
+            "wait_max_ms": round(self.stats["wait_max_s"] * 1000, 1)
+        }
 
 
-class BasicAuthMiddleware:
-    """ASGI middleware for Basic Auth."""
+annuaire_governor = RateGovernor(ANNUAIRE_RATE_LIMIT)
 
-    def __init__(self, app):
-        self.app = app
 
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
-            await self.app(scope, receive, send)
-            return
+class GovernedTransport(httpx.AsyncBaseTransport):
+    """Transport sending each request only once the rate governor allows it."""
 
-        # Allow healthcheck on root path without auth
-        path = scope.get("path", "")
-        if path == "/" or path == "":
-            await self._send_health(send)
-            return
+    def __init__(self, governor: RateGovernor, transport: httpx.AsyncBaseTransport = None):
+        self.governor = governor
+        self.transport = transport or SharedTransport()
 
-        headers = dict(scope.get("headers", []))
-        auth_header = headers.get(b"authorization", b"").decode("utf-8")
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        waited = await self.governor.acquire(_request_priority.get())
+        span = getattr(request.extensions.get("trace"), "span", None)
+        if span is not None and waited > 0.001:
+            span.event("rate_limited", wait_ms=round(waited * 1000, 1))
+        response = await self.transport.handle_async_request(request)
+        self.governor.observe(response.status_code, response.headers.get("retry-after"))
+        return response
 
-        if not auth_header.startswith("Basic "):
-            await self._send_401(send)
-            return
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+annuaire_hedger = Hedger("annuaire", os.environ.get("ANNUAIRE_HEDGE_API_URL", ""), initial_delay=0.5) if HEDGE_ENABLED else None
+warmup = Warmup([ANNUAIRE_API_URL, os.environ.get("ANNUAIRE_HEDGE_API_URL", "")])
+
+
+def http_client(timeout: float, idempotent: bool = None, hedger: Hedger = None) -> httpx.AsyncClient:
+    """httpx client with tracing, retries, circuit breaking and rate governing.
+
+    Clients opened at batch priority are never hedged: their requests queue
+    behind interactive ones at the governor, and the hedge timer would take
+    that wait for a slow upstream.
+    """
+    if _request_priority.get() >= PRIORITY_BATCH:
+        hedger = None
+    return runtime.http_client(timeout, idempotent, hedger, GovernedTransport(annuaire_governor), paced=True)
+
+
+# Typed views of the /search payload: decoding skips every field not declared
+# here instead of building dicts for the whole (large) response.
+class Etablissement(msgspec.Struct):
+    siret: str | None = None
+    adresse: str | None = None
+    code_postal: str | None = None
+    libelle_commune: str | None = None
+
+
+class Entreprise(msgspec.Struct):
+    siren: str | None = None
+    nom_complet: str | None = None
+    nom_raison_sociale: str | None = None
+    activite_principale: str | None = None
+    tranche_effectif_salarie: str | None = None
+    etat_administratif: str | None = None
+    siege: Etablissement | None = None
+    dirigeants: list[Any] | None = None
+    matching_etablissements: list[Any] | None = None
+    finances: Any = None
+    complements: Any = None
+    score: float | None = None
+
+
+class SearchResponse(msgspec.Struct):
+    results: list[Entreprise] = []
+    total_results: int = 0
+    page: int = 1
+    total_pages: int = 1
+
+
+search_decoder = msgspec.json.Decoder(SearchResponse)
+json_encoder = msgspec.json.Encoder()
+
+
+def search_params(
+    query: str = "",
+    code_postal: str = None,
+    departement: str = None,
+    activite_principale: str = None,
+    tranche_effectif_salarie: str = None,
+    etat_administratif: str = None,
+    include: list = None
+) -> tuple:
+    """
+    (params, error) of a search: structured filters are applied upstream and the
+    response is minimal, carrying only the `include` blocks we format. Invalid
+    arguments give an error dict for the tool to return.
+    """
+    include = ANNUAIRE_DEFAULT_INCLUDE if include is None else include
+    unknown = set(include) - set(ANNUAIRE_INCLUDE_FIELDS)
+    if unknown:
+        valid = ", ".join(ANNUAIRE_INCLUDE_FIELDS)
+        return None, {"error": f"include inconnu: {', '.join(sorted(unknown))} (valeurs: {valid})"}
+
+    filters = {
+        "q": query,
+        "code_postal": code_postal,
+        "departement": departement,
+        "activite_principale": activite_principale,
+        "tranche_effectif_salarie": tranche_effectif_salarie,
+        "etat_administratif": etat_administratif
+    }
+    params = {key: value for key, value in filters.items() if value}
+    if not params:
+        return None, {"error": "Préciser une requête ou au moins un filtre"}
+    params["minimal"] = "true"
+    if include:
+        params["include"] = ",".join(include)
+    return params, None
+
+
+def format_entreprise(r: Entreprise, include: list = ()) -> dict:
+    """Keep the fields agents use from an API search result."""
+    siege = r.siege or Etablissement()
+    record = {
+        "siren": r.siren,
+        "siret": siege.siret,
+        "nom_complet": r.nom_complet,
+        "nom_raison_sociale": r.nom_raison_sociale,
+        "adresse": siege.adresse,
+        "code_postal": siege.code_postal,
+        "libelle_commune": siege.libelle_commune,
+        "activite_principale": r.activite_principale,
+        "tranche_effectif_salarie": r.tranche_effectif_salarie,
+        "dirigeants": r.dirigeants or []
+    }
+    for field in ("matching_etablissements", "finances", "complements", "score"):
+        if field in include:
+            record[field] = getattr(r, field)
+    return record
 
-        try:
-            encoded = auth_header[6:]
-            decoded = base64.b64decode(encoded).decode("utf-8")
-            username, password = decoded.split(":", 1)
 
-            if username != AUTH_USERNAME or password != AUTH_PASSWORD:
-                await self._send_401(send)
+async def search_page(params: dict, page: int, per_page: int, priority: int = PRIORITY_INTERACTIVE) -> SearchResponse:
+    """Fetch one page of /search, raising ToolError on HTTP errors."""
+    with request_priority(priority):
+        async with http_client(timeout=10.0, hedger=annuaire_hedger) as client:
+            response = await client.get(
+                f"{ANNUAIRE_API_URL}/search",
+                params={**params, "page": page, "per_page": per_page}
+            )
+
+    if response.status_code != 200:
+        raise ToolError(f"HTTP {response.status_code}: {response.text[:200]}")
+    return search_decoder.decode(response.content)
+
+
+async def iter_annuaire(params: dict, max_results: int, per_page: int = ANNUAIRE_MAX_PER_PAGE, concurrency: int = 3):
+    """
+    Yield formatted results page by page, in order, up to max_results.
+
+    Up to `concurrency` following pages are fetched ahead at batch priority, so
+    memory stays bounded by a few pages whatever the number of matches.
+    """
+    per_page = max(1, min(per_page, ANNUAIRE_MAX_PER_PAGE))
+    include = params.get("include", "").split(",")
+    data = await search_page(params, 1, per_page, PRIORITY_BATCH)
+    total_results = data.total_results
+    last_page = min(data.total_pages, math.ceil(max_results / per_page))
+
+    pending = collections.deque()
+    next_page = 2
+    emitted = 0
+    try:
+        while True:
+            while next_page <= last_page and len(pending) < concurrency:
+                pending.append(asyncio.ensure_future(search_page(params, next_page, per_page, PRIORITY_BATCH)))
+                next_page += 1
+
+            results = data.results
+            records = [format_entreprise(r, include) for r in results[:max_results - emitted]]
+            emitted += len(records)
+            yield {"page": data.page, "total_results": total_results, "results": records}
+
+            if not results or emitted >= max_results or not pending:
                 return
-        except Exception:
-            await self._send_401(send)
-            return
-
-        await self.app(scope, receive, send)
-
-    async def _send_401(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 401,
-            "headers": [
-                [b"content-type", b"application/json"],
-                [b"www-authenticate", b'Basic realm="MCP Server"']
-            ]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"error": "Unauthorized"}'
-        })
-
-    async def _send_health(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 200,
-            "headers": [[b"content-type", b"application/json"]]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"status": "ok"}'
-        })
+            data = await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
 
 
 @mcp.tool
-async def annuaire_recherche(query: str, per_page: int = 5) -> dict:
+async def annuaire_recherche(
+    query: str = "",
+    per_page: int = 5,
+    page: int = 1,
+    code_postal: str | None = None,
+    departement: str | None = None,
+    activite_principale: str | None = None,
+    tranche_effectif_salarie: str | None = None,
+    etat_administratif: str | None = None,
+    include: list[str] | None = None
+) -> dict:
     """
     Recherche une entreprise dans l'Annuaire des Entreprises (API Gouv).
 
-    API gratuite, sans authentification.
+    API gratuite, sans authentification. Les filtres sont appliqués par l'API
+    et acceptent plusieurs valeurs séparées par des virgules.
 
     Args:
-        query: Requête de recherche (nom, SIREN, SIRET, adresse...)
-        per_page: Nombre de résultats (défaut: 5)
+        query: Requête de recherche (nom, SIREN, SIRET, adresse...), optionnelle si un filtre est donné
+        per_page: Nombre de résultats (défaut: 5, max: 25)
+        page: Numéro de page (défaut: 1)
+        code_postal: Code(s) postal(aux) du siège ou d'un établissement (ex: 75002)
+        departement: Département(s) (ex: 75, 2A)
+        activite_principale: Code(s) NAF (ex: 62.01Z)
+        tranche_effectif_salarie: Tranche(s) d'effectif INSEE (ex: 11,12)
+        etat_administratif: A (active) ou C (cessée)
+        include: Blocs renvoyés par l'API parmi siege, dirigeants,
+            matching_etablissements, finances, complements, score
+            (défaut: siege, dirigeants)
 
     Returns:
         Liste des entreprises trouvées avec SIRET, adresse, dirigeants
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        url = f"https://recherche-entreprises.api.gouv.fr/search?q={query}&per_page={per_page}"
-
-        response = await client.get(url)
+    params, error = search_params(
+        query, code_postal, departement, activite_principale,
+        tranche_effectif_salarie, etat_administratif, include
+    )
+    if error:
+        return error
+    per_page = max(1, min(per_page, ANNUAIRE_MAX_PER_PAGE))
+
+    async with http_client(timeout=10.0, hedger=annuaire_hedger) as client:
+        response = await client.get(
+            f"{ANNUAIRE_API_URL}/search",
+            params={**params, "per_page": per_page, "page": page}
+        )
 
         if response.status_code != 200:
             return {"error": f"HTTP {response.status_code}", "details": response.text}
 
-        data = response.json()
-        results = data.get("results", [])
-
-        formatted = []
-        for r in results:
-            siege = r.get("siege", {})
-            formatted.append({
-                "siren": r.get("siren"),
-                "siret": siege.get("siret"),
-                "nom_complet": r.get("nom_complet"),
-                "nom_raison_sociale": r.get("nom_raison_sociale"),
-                "adresse": siege.get("adresse"),
-                "code_postal": siege.get("code_postal"),
-                "libelle_commune": siege.get("libelle_commune"),
-                "activite_principale": r.get("activite_principale"),
-                "tranche_effectif_salarie": r.get("tranche_effectif_salarie"),
-                "dirigeants": r.get("dirigeants", [])
-            })
+        data = search_decoder.decode(response.content)
+        include = params.get("include", "").split(",")
+
+        return {
+            "query": query,
+            "total": data.total_results,
+            "page": data.page,
+            "total_pages": data.total_pages,
+            "results": [format_entreprise(r, include) for r in data.results]
+        }
+
 
+@mcp.tool
+async def annuaire_recherche_all(
+    ctx: Context,
+    query: str = "",
+    max_results: int = 100,
+    per_page: int = 25,
+    stream_only: bool = False,
+    code_postal: str | None = None,
+    departement: str | None = None,
+    activite_principale: str | None = None,
+    tranche_effectif_salarie: str | None = None,
+    etat_administratif: str | None = None,
+    include: list[str] | None = None
+) -> dict:
+    """
+    Parcourt toutes les pages de résultats d'une recherche Annuaire.
+
+    Les pages sont récupérées en parallèle sous la limite de débit de l'API.
+    Chaque page formatée est envoyée dès réception via une notification de
+    progression (message JSON: page, results).
+
+    Args:
+        query: Requête de recherche (nom, commune...), optionnelle si un filtre est donné
+        max_results: Nombre maximum de résultats (défaut: 100, max: 10000)
+        per_page: Résultats par page (défaut: 25, max: 25)
+        stream_only: Ne renvoyer que le résumé, les résultats n'étant
+            transmis que par les notifications (défaut: False)
+        code_postal, departement, activite_principale, tranche_effectif_salarie,
+        etat_administratif, include: comme pour annuaire_recherche
+
+    Returns:
+        Total de l'API, nombre de résultats émis et les 500 premiers résultats
+        (sauf stream_only) ; truncated indique que la suite n'a été transmise que
+        par les notifications. Si une page échoue : error, pages_done et
+        results_so_far (résultats des pages précédentes)
+    """
+    max_results = max(1, min(max_results, ANNUAIRE_MAX_RESULTS))
+    params, error = search_params(
+        query, code_postal, departement, activite_principale,
+        tranche_effectif_salarie, etat_administratif, include
+    )
+    if error:
+        return error
+    results = []
+    emitted = 0
+    pages_done = 0
+    total = 0
+    try:
+        async for page in iter_annuaire(params, max_results, per_page):
+            total = page["total_results"]
+            pages_done += 1
+            emitted += len(page["results"])
+            if not stream_only:
+                results.extend(page["results"][:ANNUAIRE_MAX_RETURNED - len(results)])
+            await ctx.report_progress(
+                progress=emitted,
+                total=min(total, max_results),
+                message=json_encoder.encode({"page": page["page"], "results": page["results"]}).decode()
+            )
+    except (ToolError, httpx.HTTPError, msgspec.DecodeError) as e:
+        # A page that failed even after the client's retries ends the walk; what
+        # came before it has already been streamed and is kept
         return {
             "query": query,
-            "total": data.get("total_results", 0),
-            "results": formatted
+            "error": str(e) or type(e).__name__,
+            "pages_done": pages_done,
+            "emitted": emitted,
+            "results_so_far": results
         }
 
+    summary = {"query": query, "total": total, "emitted": emitted}
+    if not stream_only:
+        summary["truncated"] = emitted > len(results)
+        summary["results"] = results
+    return summary
+
 
 @mcp.tool
 async def check_holding(siren: str) -> dict:
@@ -143,42 +471,279 @@ async def check_holding(siren: str) -> dict:
         is_holding: True si holding sans salariés
         warning: Message d'alerte si c'est une holding
     """
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        url = f"https://recherche-entreprises.api.gouv.fr/search?q={siren}&per_page=1"
-
-        response = await client.get(url)
+    async with http_client(timeout=10.0, hedger=annuaire_hedger) as client:
+        # Only top-level fields are needed: skip every optional block
+        response = await client.get(
+            f"{ANNUAIRE_API_URL}/search",
+            params={"q": siren, "per_page": 1, "minimal": "true"}
+        )
 
         if response.status_code != 200:
             return {"error": f"HTTP {response.status_code}", "details": response.text}
 
-        data = response.json()
-        results = data.get("results", [])
+        results = search_decoder.decode(response.content).results
 
         if not results:
             return {"error": "SIREN non trouvé"}
 
         entreprise = results[0]
-        activite = entreprise.get("activite_principale", "")
-        effectif = entreprise.get("tranche_effectif_salarie")
+        activite = entreprise.activite_principale or ""
+        effectif = entreprise.tranche_effectif_salarie
 
         is_holding = activite == "64.20Z"
-        has_employees = effectif and effectif not in ["NN", "00", None, ""]
+        employees = has_employees(effectif)
 
         result = {
             "siren": siren,
-            "nom": entreprise.get("nom_complet"),
+            "nom": entreprise.nom_complet,
             "activite": activite,
             "effectif": effectif,
             "is_holding": is_holding,
-            "has_employees": has_employees
+            "has_employees": employees
         }
 
-        if is_holding and not has_employees:
-            result["warning"] = "HOLDING sans salariés détectée. Chercher l'entité opérationnelle du groupe."
+        if is_holding and not employees:
+            result["warning"] = "HOLDING sans salariés détectée. Utiliser resolve_group pour trouver l'entité opérationnelle du groupe."
 
         return result
 
 
+# Group resolution: a bounded breadth-first walk of the corporate graph around a
+# company, following legal-entity directors both ways, shared natural-person
+# directors and (from the starting company only) companies at the same address.
+# Every link is checked on the returned record, lookups are memoized per walk and
+# queue at batch priority behind interactive calls. A failed lookup (HTTP status,
+# network, bad body) is recorded and only prunes its branch.
+GROUP_MAX_DEPTH = 3
+GROUP_MAX_LOOKUPS = 100
+GROUP_FANOUT = 10
+GROUP_MAX_DIRECTORS = 5
+GROUP_INCLUDE = "siege,dirigeants"
+# INSEE headcount tranches: codes sort by size
+EFFECTIF_TRANCHES = {
+    "00": "0", "01": "1-2", "02": "3-5", "03": "6-9", "11": "10-19", "12": "20-49",
+    "21": "50-99", "22": "100-199", "31": "200-249", "32": "250-499", "41": "500-999",
+    "42": "1000-1999", "51": "2000-4999", "52": "5000-9999", "53": "10000+"
+}
+# Strongest evidence first, used to break ties between equal headcounts
+GROUP_RELATIONS = ("filiale", "dirigeant_morale", "dirigeant_commun", "meme_adresse")
+
+
+def has_employees(tranche: str | None) -> bool:
+    return bool(tranche) and tranche not in ("NN", "00")
+
+
+def same_person(a: dict, b: dict) -> bool:
+    """Same natural person: name, first first name and, when both are known, birth date."""
+    if (a.get("nom") or "").upper() != (b.get("nom") or "").upper():
+        return False
+    if (a.get("prenoms") or "").upper().split()[:1] != (b.get("prenoms") or "").upper().split()[:1]:
+        return False
+    for field in ("date_de_naissance", "annee_de_naissance"):
+        if a.get(field) and b.get(field):
+            return str(a[field]) == str(b[field])
+    return True
+
+
+def _directors(r: Entreprise, kind: str) -> list:
+    return [d for d in r.dirigeants or [] if isinstance(d, dict) and d.get("type_dirigeant") == kind]
+
+
+class GroupWalk:
+    """Memoized, budgeted annuaire lookups of one group resolution."""
+
+    def __init__(self, max_lookups: int):
+        self.max_lookups = max_lookups
+        self.lookups = {}
+        self.errors = {}
+        self.truncated = False
+
+    async def search(self, **params) -> list:
+        key = tuple(sorted(params.items()))
+        task = self.lookups.get(key)
+        if task is None:
+            if len(self.lookups) >= self.max_lookups:
+                self.truncated = True
+                return []
+            query = {**params, "minimal": "true", "include": GROUP_INCLUDE}
+            task = self.lookups[key] = asyncio.ensure_future(search_page(query, 1, GROUP_FANOUT, PRIORITY_BATCH))
+        try:
+            return (await task).results
+        except (ToolError, httpx.HTTPError, msgspec.DecodeError) as e:
+            # Memoized: every caller of a failed lookup sees it, it is recorded once
+            self.errors[key] = str(e) or type(e).__name__
+            return []
+
+    def error_details(self) -> list:
+        return [{"lookup": dict(key), "error": error} for key, error in self.errors.items()]
+
+    async def neighbours(self, node: Entreprise, with_address: bool) -> list:
+        """(entreprise, relation, detail) linked to node, every link checked on the returned record."""
+
+        async def directing(d: dict) -> list:
+            return [
+                (r, "dirigeant_morale", f"{d.get('qualite') or 'dirigeant'} de {node.siren}")
+                for r in await self.search(q=d["siren"]) if r.siren == d["siren"]
+            ]
+
+        async def directed() -> list:
+            name = node.nom_raison_sociale or node.nom_complet
+            if not name:
+                return []
+            return [
+                (r, "filiale", f"dirigée par {node.siren}")
+                for r in await self.search(q=name)
+                if any(d.get("siren") == node.siren for d in _directors(r, "personne morale"))
+            ]
+
+        async def sharing(d: dict) -> list:
+            prenom = (d.get("prenoms") or "").split(" ")[0]
+            params = {"nom_personne": d["nom"], "type_personne": "dirigeant"}
+            if prenom:
+                params["prenoms_personne"] = prenom
+            return [
+                (r, "dirigeant_commun", f"{prenom} {d['nom']}".strip())
+                for r in await self.search(**params)
+                if any(same_person(d, other) for other in _directors(r, "personne physique"))
+            ]
+
+        async def same_address() -> list:
+            siege = node.siege
+            if siege is None or not siege.adresse:
+                return []
+            address = " ".join(siege.adresse.upper().split())
+            params = {"q": siege.adresse}
+            if siege.code_postal:
+                params["code_postal"] = siege.code_postal
+            return [
+                (r, "meme_adresse", siege.adresse)
+                for r in await self.search(**params)
+                if r.siege is not None and " ".join((r.siege.adresse or "").upper().split()) == address
+            ]
+
+        searches = [directing(d) for d in _directors(node, "personne morale")[:GROUP_MAX_DIRECTORS] if d.get("siren")]
+        searches.append(directed())
+        searches.extend(sharing(d) for d in _directors(node, "personne physique")[:GROUP_MAX_DIRECTORS] if d.get("nom"))
+        if with_address:
+            searches.append(same_address())
+        links = await asyncio.gather(*searches)
+        return [link for group in links for link in group if link[0].siren and link[0].siren != node.siren]
+
+
+def group_member(r: Entreprise, depth: int, via: str) -> dict:
+    return {
+        "siren": r.siren,
+        "nom": r.nom_complet,
+        "activite": r.activite_principale,
+        "effectif": r.tranche_effectif_salarie,
+        "effectif_salaries": EFFECTIF_TRANCHES.get(r.tranche_effectif_salarie or ""),
+        "etat_administratif": r.etat_administratif,
+        "code_postal": r.siege.code_postal if r.siege else None,
+        "depth": depth,
+        "via": via,
+        "relations": []
+    }
+
+
+def group_rank(member: dict) -> tuple:
+    tranche = member["effectif"] or ""
+    headcount = int(tranche) if tranche.isdigit() else -1
+    relation = min(GROUP_RELATIONS.index(rel["type"]) for rel in member["relations"])
+    return -headcount, relation, member["depth"]
+
+
+@mcp.tool
+async def resolve_group(siren: str, max_depth: int = 2, max_lookups: int = 30, max_candidates: int = 10) -> dict:
+    """
+    Cherche l'entité opérationnelle du groupe d'une entreprise (ex: holding sans salariés).
+
+    Parcourt en parallèle le graphe du groupe : sociétés dirigeantes (personnes
+    morales), sociétés dirigées par l'entreprise, sociétés partageant un dirigeant
+    personne physique, et sociétés à la même adresse que l'entreprise de départ.
+    Chaque lien est vérifié sur la fiche retournée. Les recherches passent après
+    les appels interactifs dans la limite de débit de l'API.
+
+    Args:
+        siren: SIREN de l'entreprise de départ (9 chiffres)
+        max_depth: Profondeur du parcours (défaut: 2, max: 3)
+        max_lookups: Nombre maximum de recherches API (défaut: 30, max: 100)
+        max_candidates: Nombre de candidats renvoyés (défaut: 10)
+
+    Returns:
+        operating_entity: meilleur candidat (actif, avec salariés, hors 64.20Z)
+        candidates: entités opérationnelles classées par tranche d'effectif puis
+            force du lien (filiale, dirigeant personne morale, dirigeant commun,
+            même adresse) et profondeur
+        group: nombre d'entités parcourues, recherches effectuées, recherches en
+            échec (errors, error_details : le classement reste celui des branches
+            parcourues), truncated si une limite a arrêté le parcours
+    """
+    siren = siren.replace(" ", "")
+    if len(siren) != 9 or not siren.isdigit():
+        return {"error": "SIREN invalide (doit être 9 chiffres)"}
+
+    started = time.monotonic()
+    walk = GroupWalk(max(1, min(max_lookups, GROUP_MAX_LOOKUPS)))
+    max_depth = max(1, min(max_depth, GROUP_MAX_DEPTH))
+
+    root = next((r for r in await walk.search(q=siren) if r.siren == siren), None)
+    if root is None:
+        if walk.errors:
+            return {"error": "Annuaire indisponible", "details": walk.error_details()}
+        return {"error": "SIREN non trouvé"}
+
+    members = {siren: group_member(root, 0, None)}
+    frontier = [root]
+    rate_limited = False
+    for depth in range(1, max_depth + 1):
+        expansions = await asyncio.gather(*(walk.neighbours(node, depth == 1) for node in frontier))
+        next_frontier = []
+        for node, links in zip(frontier, expansions):
+            for r, relation, detail in links:
+                member = members.get(r.siren)
+                if member is None:
+                    member = members[r.siren] = group_member(r, depth, node.siren)
+                    next_frontier.append(r)
+                if member["depth"] == depth and len(member["relations"]) < GROUP_MAX_DIRECTORS:
+                    link = {"type": relation, "detail": detail}
+                    if link not in member["relations"]:
+                        member["relations"].append(link)
+        frontier = next_frontier
+        # Under a 429 pause, further levels would only queue behind it
+        rate_limited = annuaire_governor.paused_until > time.monotonic()
+        if not frontier or walk.truncated or rate_limited:
+            break
+
+    candidates = sorted(
+        (
+            m for s, m in members.items()
+            if s != siren and has_employees(m["effectif"])
+            and m["activite"] != "64.20Z" and m["etat_administratif"] != "C"
+        ),
+        key=group_rank
+    )
+    start = members[siren]
+    return {
+        "siren": siren,
+        "nom": start["nom"],
+        "activite": start["activite"],
+        "effectif": start["effectif"],
+        "is_holding": start["activite"] == "64.20Z",
+        "operating_entity": candidates[0] if candidates else None,
+        "candidates": candidates[:max(1, max_candidates)],
+        "group": {
+            "entities": len(members),
+            "lookups": len(walk.lookups),
+            "errors": len(walk.errors),
+            "error_details": walk.error_details(),
+            "depth": max(m["depth"] for m in members.values()),
+            "truncated": walk.truncated or rate_limited,
+            "rate_limited": rate_limited,
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+    }
+
+
 @mcp.tool
 def calcul_tva(siren: str) -> dict:
     """
@@ -206,10 +771,12 @@ def calcul_tva(siren: str) -> dict:
     }
 
 
-def create_authenticated_app():
-    """Wrap FastMCP app with Basic Auth middleware."""
-    mcp_app = mcp.http_app(path="/mcp")
-    return BasicAuthMiddleware(mcp_app)
+def health() -> dict:
+    """Service entries of the / health body."""
+    body = {"rate_governor": annuaire_governor.snapshot()}
+    if annuaire_hedger is not None:
+        body["hedging"] = annuaire_hedger.snapshot()
+    return body
 
 
-app = create_authenticated_app()
+app = create_authenticated_app(mcp, warmup, health)
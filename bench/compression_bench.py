@@ -0,0 +1,162 @@
+"""
+Response compression micro-benchmark
+
+Compresses typical MCP responses (tool results wrapped in a JSON-RPC SSE event,
+as the streamable-HTTP transport sends them) with the StreamCompressor the
+servers use, and reports bytes saved and CPU cost per encoding and level.
+
+Usage:
+    python bench/compression_bench.py
+    python bench/compression_bench.py --levels gzip:6 br:4 zstd:3 --number 500
+"""
+
+import os
+import sys
+import random
+import timeit
+import argparse
+
+import zlib
+import brotli
+import msgspec
+import zstandard
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+sys.path.insert(0, os.path.join(ROOT, "common"))
+
+import runtime  # noqa: E402
+from decode_bench import load_server, annuaire_payload  # noqa: E402
+from mock_upstreams import fake_siren  # noqa: E402
+
+DEFAULT_LEVELS = ["gzip:1", "gzip:6", "gzip:9", "br:1", "br:4", "br:6", "zstd:1", "zstd:3", "zstd:9"]
+LEVEL_SETTINGS = {"gzip": "COMPRESS_GZIP_LEVEL", "br": "COMPRESS_BROTLI_QUALITY", "zstd": "COMPRESS_ZSTD_LEVEL"}
+DECOMPRESS = {
+    "gzip": lambda data: zlib.decompress(data, 31),
+    "br": brotli.decompress,
+    "zstd": lambda data: zstandard.ZstdDecompressor().decompressobj().decompress(data)
+}
+VOCABULARY = (
+    "société conseil transformation digitale cloud données client projet équipe "
+    "direction commerciale développement logiciel expertise paris lyon marseille "
+    "solutions services accompagnement stratégie croissance innovation marché "
+    "entreprise gestion produit industrie formation recrutement finance juridique"
+).split()
+
+
+def words(rng: random.Random, count: int) -> str:
+    """Text with a realistic entropy (repeating lorem ipsum compresses far too well)."""
+    return " ".join(rng.choice(VOCABULARY) for _ in range(count))
+
+
+def sse_event(result, request_id: int = 1) -> bytes:
+    """A tool result as FastMCP streams it: text content plus structuredContent."""
+    message = {"jsonrpc": "2.0", "id": request_id, "result": {
+        "content": [{"type": "text", "text": msgspec.json.encode(result).decode()}],
+        "structuredContent": result,
+        "isError": False
+    }}
+    return b"event: message\r\ndata: " + msgspec.json.encode(message) + b"\r\n\r\n"
+
+
+def progress_event(progress: int, total: int) -> bytes:
+    message = {"jsonrpc": "2.0", "method": "notifications/progress", "params": {
+        "progressToken": 2, "progress": progress, "total": total, "message": f"{progress}/{total} requêtes"
+    }}
+    return b"event: message\r\ndata: " + msgspec.json.encode(message) + b"\r\n\r\n"
+
+
+def serp_results(rng: random.Random, count: int) -> list:
+    return [
+        {
+            "title": f"Société {i} - {words(rng, 5)}",
+            "url": f"https://www.pappers.fr/entreprise/societe-{i}-{fake_siren(i)}" if i % 3 == 0 else f"https://example{i}.com/{rng.randrange(10**6)}",
+            "snippet": words(rng, 30)
+        }
+        for i in range(count)
+    ]
+
+
+def payloads(annuaire) -> list:
+    """(name, chunks) pairs; each chunk is one ASGI body message."""
+    rng = random.Random(42)
+
+    def recherche(count: int) -> dict:
+        response = annuaire.search_decoder.decode(annuaire_payload(count))
+        return {
+            "results": [annuaire.format_entreprise(r) for r in response.results],
+            "total_results": response.total_results,
+            "page": 1
+        }
+
+    serp = serp_results(rng, 10)
+    profile = {
+        "name": "Jean Dupont",
+        "headline": words(rng, 12),
+        "location": "Paris, Île-de-France",
+        "about": words(rng, 120),
+        "experience": [
+            {"title": words(rng, 3), "company": f"Société {k}", "dates": "2015 - 2019", "description": words(rng, 60)}
+            for k in range(12)
+        ],
+        "education": [{"school": f"École {k}", "degree": words(rng, 4)} for k in range(3)],
+        "skills": [rng.choice(VOCABULARY) for _ in range(30)]
+    }
+    rows = [
+        {"id": i, "email": f"contact{i}@societe{i}.fr", "name": f"Société {i}", "siren": fake_siren(i),
+         "created_at": f"2024-0{1 + i % 9}-1{i % 10}T10:{i % 60:02d}:00+00:00", "score": rng.random()}
+        for i in range(50)
+    ]
+    many = [progress_event(k, 20) for k in range(1, 21)]
+    many.append(sse_event({"succeeded": 20, "failed": 0, "results": [
+        {"query": f"q{k}", "results": serp_results(rng, 10)} for k in range(20)
+    ]}, 2))
+
+    return [
+        ("rdap_whois", [sse_event({"domain": "societe.fr", "registrant_organization": "SOCIETE", "registrar": "OVH",
+                                   "creation_date": "2010-01-01", "expiration_date": "2030-01-01"})]),
+        ("annuaire 5 results", [sse_event(recherche(5))]),
+        ("annuaire 25 results", [sse_event(recherche(25))]),
+        ("serp_pappers", [sse_event({"query": "societe pappers", "pappers_results": [], "all_results": serp})]),
+        ("linkedin raw profile", [sse_event({"url": "https://linkedin.com/in/x", "raw": profile})]),
+        ("execute_sql 50 rows", [sse_event(rows)]),
+        ("serp_search_many 20", many)
+    ]
+
+
+def compress(encoding: str, chunks: list) -> bytes:
+    """One response through StreamCompressor, flushing after every chunk like the middleware."""
+    compressor = runtime.StreamCompressor(encoding)
+    last = len(chunks) - 1
+    return b"".join(compressor.compress(chunk, final=i == last) for i, chunk in enumerate(chunks))
+
+
+def measure(fn, number: int) -> float:
+    """Best-of-5 microseconds per call."""
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure bytes saved and CPU cost of response compression")
+    parser.add_argument("--levels", nargs="+", default=DEFAULT_LEVELS, help="encoding:level pairs")
+    parser.add_argument("--number", type=int, default=200, help="calls per timing run")
+    args = parser.parse_args()
+
+    annuaire = load_server("annuaire")
+
+    print(f"{'payload':<24}{'bytes':>9}{'encoding':>10}{'wire':>9}{'saved':>8}{'comp µs':>10}{'decomp µs':>11}")
+    for name, chunks in payloads(annuaire):
+        raw = b"".join(chunks)
+        print(f"{name:<24}{len(raw):>9}")
+        for spec in args.levels:
+            encoding, _, level = spec.partition(":")
+            setattr(runtime, LEVEL_SETTINGS[encoding], int(level))
+            wire = compress(encoding, chunks)
+            assert DECOMPRESS[encoding](wire) == raw, f"{name}: {spec} round-trip failed"
+            comp = measure(lambda: compress(encoding, chunks), args.number)
+            decomp = measure(lambda: DECOMPRESS[encoding](wire), args.number)
+            print(f"{'':<24}{'':>9}{spec:>10}{len(wire):>9}{1 - len(wire) / len(raw):>8.0%}{comp:>10.1f}{decomp:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Decode micro-benchmark
+
+Compares the stdlib path (json.loads of the whole body, then plucking fields
+from dicts) with the typed msgspec decoders the servers use, on full-size
+Annuaire and SERP payloads built from the mock upstreams.
+
+Usage:
+    python bench/decode_bench.py
+    python bench/decode_bench.py --results 25 --number 2000
+"""
+
+import os
+import sys
+import json
+import timeit
+import argparse
+import importlib.util
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from mock_upstreams import fake_company, fake_siren  # noqa: E402
+
+
+def load_server(service: str):
+    """Import <service>/server.py as a standalone module."""
+    spec = importlib.util.spec_from_file_location(f"{service}_server", os.path.join(ROOT, service, "server.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def annuaire_payload(count: int) -> bytes:
+    return json.dumps({
+        "results": [fake_company(i) for i in range(count)],
+        "total_results": 1000,
+        "page": 1,
+        "per_page": count,
+        "total_pages": 1000 // count
+    }).encode()
+
+
+def serp_payload(count: int) -> bytes:
+    # Real SERP results carry much more than title/url/snippet
+    return json.dumps({"results": [
+        {
+            "position": i + 1,
+            "title": f"societe {i} - résultat",
+            "url": f"https://www.pappers.fr/entreprise/societe-{i}-{fake_siren(i)}",
+            "displayed_link": f"www.pappers.fr › entreprise › societe-{i}",
+            "snippet": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+            "sitelinks": [{"title": f"Lien {k}", "url": f"https://example{i}.com/{k}"} for k in range(4)],
+            "rich_snippet": {"rating": 4.5, "reviews": 120, "extensions": ["SAS", "Paris", "2010"]}
+        }
+        for i in range(count)
+    ]}).encode()
+
+
+def stdlib_annuaire(body: bytes) -> list:
+    results = []
+    for r in json.loads(body).get("results", []):
+        siege = r.get("siege") or {}
+        results.append({
+            "siren": r.get("siren"),
+            "siret": siege.get("siret"),
+            "nom_complet": r.get("nom_complet"),
+            "nom_raison_sociale": r.get("nom_raison_sociale"),
+            "adresse": siege.get("adresse"),
+            "code_postal": siege.get("code_postal"),
+            "libelle_commune": siege.get("libelle_commune"),
+            "activite_principale": r.get("activite_principale"),
+            "tranche_effectif_salarie": r.get("tranche_effectif_salarie"),
+            "dirigeants": r.get("dirigeants") or []
+        })
+    return results
+
+
+def stdlib_serp(body: bytes) -> list:
+    return json.loads(body).get("results", [])
+
+
+def measure(fn, body: bytes, number: int) -> float:
+    """Best-of-5 microseconds per call."""
+    return min(timeit.repeat(lambda: fn(body), number=number, repeat=5)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare stdlib and msgspec decoding of upstream payloads")
+    parser.add_argument("--results", type=int, default=25, help="results per payload")
+    parser.add_argument("--number", type=int, default=1000, help="calls per timing run")
+    args = parser.parse_args()
+
+    annuaire = load_server("annuaire")
+    serp = load_server("serp")
+
+    def msgspec_annuaire(body: bytes) -> list:
+        return [annuaire.format_entreprise(r) for r in annuaire.search_decoder.decode(body).results]
+
+    cases = [
+        ("annuaire /search", annuaire_payload(args.results), stdlib_annuaire, msgspec_annuaire),
+        ("serp /query", serp_payload(args.results), stdlib_serp, serp.decode_results)
+    ]
+
+    print(f"{'payload':<20}{'bytes':>10}{'json µs':>12}{'msgspec µs':>14}{'reduction':>12}")
+    for name, body, baseline, typed in cases:
+        assert baseline(body) == typed(body), f"{name}: decoders disagree"
+        before = measure(baseline, body, args.number)
+        after = measure(typed, body, args.number)
+        print(f"{name:<20}{len(body):>10}{before:>12.1f}{after:>14.1f}{1 - after / before:>11.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+Mock upstreams for benchmarks
+Emulates every API the MCP servers call, with configurable latency/error distributions
+
+Run: BENCH_PROFILE='{"serp": {"median_ms": 300}}' uvicorn mock_upstreams:app --port 9100
+"""
+
+import os
+import json
+import math
+import random
+import asyncio
+from starlette.applications import Starlette
+from starlette.responses import HTMLResponse, JSONResponse
+from starlette.routing import Route
+
+# Latency is log-normal: median_ms * exp(sigma * N(0, 1)).
+# A fraction error_rate of calls answers error_status instead of a payload.
+DEFAULT_PROFILE = {
+    "annuaire": {"median_ms": 120, "sigma": 0.5, "error_rate": 0.0, "error_status": 429, "results": 5},
+    "serp": {"median_ms": 800, "sigma": 0.6, "error_rate": 0.0, "error_status": 503, "results": 10},
+    "linkedin_profile": {"median_ms": 4000, "sigma": 0.4, "error_rate": 0.0, "error_status": 502},
+    "linkedin_company": {"median_ms": 8000, "sigma": 0.4, "error_rate": 0.0, "error_status": 502},
+    "rdap": {"median_ms": 250, "sigma": 0.5, "error_rate": 0.0, "error_status": 503},
+    "siret": {"median_ms": 3000, "sigma": 0.7, "error_rate": 0.0, "error_status": 502},
+    "site": {"median_ms": 150, "sigma": 0.5, "error_rate": 0.0, "error_status": 503},
+    "supabase": {"median_ms": 40, "sigma": 0.4, "error_rate": 0.0, "error_status": 503, "rows": 50}
+}
+
+
+def load_profile() -> dict:
+    """Merge BENCH_PROFILE (JSON) overrides into the default profile."""
+    profile = {name: dict(values) for name, values in DEFAULT_PROFILE.items()}
+    for name, overrides in json.loads(os.environ.get("BENCH_PROFILE", "{}")).items():
+        profile.setdefault(name, {}).update(overrides)
+    return profile
+
+
+PROFILE = load_profile()
+
+
+async def simulate(upstream: str):
+    """Sleep for a sampled latency; return an error response or None."""
+    conf = PROFILE[upstream]
+    delay = conf["median_ms"] * math.exp(conf["sigma"] * random.gauss(0, 1)) / 1000
+    await asyncio.sleep(delay)
+    if random.random() < conf["error_rate"]:
+        headers = {"Retry-After": "1"} if conf["error_status"] == 429 else {}
+        return JSONResponse({"error": "mock failure"}, status_code=conf["error_status"], headers=headers)
+    return None
+
+
+def luhn_digit(base: str) -> str:
+    """Check digit making base + digit Luhn-valid."""
+    total = 0
+    for pos, digit in enumerate(reversed(base)):
+        d = int(digit) * (2 if pos % 2 == 0 else 1)
+        total += d - 9 if d > 9 else d
+    return str((10 - total % 10) % 10)
+
+
+def fake_siren(i: int) -> str:
+    base = f"{(123456780 + i * 7) % 10**8:08d}"
+    # Luhn check digit so generated SIRENs are valid
+    return base + luhn_digit(base)
+
+
+def fake_siret(i: int) -> str:
+    base = fake_siren(i) + "0001"
+    return base + luhn_digit(base)
+
+
+def fake_company(i: int) -> dict:
+    """A result shaped like recherche-entreprises.api.gouv.fr, full payload."""
+    siren = fake_siren(i)
+    etablissement = {
+        "siret": fake_siret(1),
+        "adresse": f"{i} RUE DE LA PAIX 75002 PARIS",
+        "code_postal": "75002",
+        "libelle_commune": "PARIS",
+        "activite_principale": "62.01Z",
+        "date_creation": "2010-01-01",
+        "etat_administratif": "A",
+        "tranche_effectif_salarie": "12",
+        "latitude": "48.8686",
+        "longitude": "2.3312",
+        "liste_enseignes": None,
+        "liste_finess": None,
+        "liste_idcc": ["1486"],
+        "liste_rge": None,
+        "liste_uai": None
+    }
+    return {
+        "siren": siren,
+        "nom_complet": f"SOCIETE {i}",
+        "nom_raison_sociale": f"SOCIETE {i}",
+        "sigle": None,
+        "activite_principale": "64.20Z" if i % 5 == 0 else "62.01Z",
+        "tranche_effectif_salarie": "NN" if i % 5 == 0 else "12",
+        "categorie_entreprise": "PME",
+        "etat_administratif": "A",
+        "nature_juridique": "5710",
+        "nombre_etablissements": 3,
+        "nombre_etablissements_ouverts": 2,
+        "siege": etablissement,
+        "dirigeants": [
+            {"nom": f"DUPONT{j}", "prenoms": "JEAN", "qualite": "Président", "type_dirigeant": "personne physique"}
+            for j in range(4)
+        ] + [{"siren": fake_siren(i + 1), "denomination": f"HOLDING {i}", "qualite": "Président", "type_dirigeant": "personne morale"}],
+        "matching_etablissements": [dict(etablissement, siret=f"{siren}{k:05d}") for k in range(3)],
+        "finances": {"2022": {"ca": 1200000, "resultat_net": 80000}},
+        "complements": {"est_ess": False, "est_rge": False, "convention_collective_renseignee": True}
+    }
+
+
+async def annuaire_search(request):
+    error = await simulate("annuaire")
+    if error:
+        return error
+    per_page = int(request.query_params.get("per_page", 10))
+    page = int(request.query_params.get("page", 1))
+    count = min(per_page, PROFILE["annuaire"]["results"])
+    offset = (page - 1) * per_page
+    results = [fake_company(offset + i) for i in range(count)]
+    if request.query_params.get("minimal") == "true":
+        # Like the real API: optional blocks only come back when included
+        include = set(request.query_params.get("include", "").split(","))
+        optional = {"siege", "dirigeants", "matching_etablissements", "finances", "complements"}
+        results = [{k: v for k, v in r.items() if k not in optional or k in include} for r in results]
+    return JSONResponse({
+        "results": results,
+        "total_results": 1000,
+        "page": page,
+        "per_page": per_page,
+        "total_pages": 1000 // max(per_page, 1)
+    })
+
+
+async def serp_query(request):
+    error = await simulate("serp")
+    if error:
+        return error
+    query = (await request.json()).get("q", "")
+    results = [
+        {
+            "title": f"{query} - résultat {i}",
+            "url": f"https://www.pappers.fr/entreprise/societe-{i}-{fake_siren(i)}" if i % 3 == 0 else f"https://example{i}.com/page",
+            "snippet": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4
+        }
+        for i in range(PROFILE["serp"]["results"])
+    ]
+    results.append({"title": "LinkedIn", "url": "https://fr.linkedin.com/company/societe", "snippet": ""})
+    return JSONResponse({"results": results})
+
+
+async def linkedin_profile(request):
+    error = await simulate("linkedin_profile")
+    if error:
+        return error
+    return JSONResponse({"profile": {
+        "name": "Jean Dupont",
+        "company": "Societe",
+        "company_url": "https://www.linkedin.com/company/societe",
+        "location": "Paris",
+        "headline": "CEO",
+        "experience": [{"title": "CEO", "company": "Societe"}] * 10
+    }})
+
+
+async def linkedin_company(request):
+    error = await simulate("linkedin_company")
+    if error:
+        return error
+    return JSONResponse({
+        "company_name": "Societe",
+        "website": "https://societe.fr",
+        "postal_code": "75002",
+        "headquarters": "Paris",
+        "industry": "IT",
+        "company_size": "11-50",
+        "locations_secondary": ["Lyon"]
+    })
+
+
+async def siret_extract(request):
+    error = await simulate("siret")
+    if error:
+        return error
+    siren = fake_siren(1)
+    return JSONResponse({
+        "found": True,
+        "siret": fake_siret(1),
+        "siren": siren,
+        "tva": None,
+        "source_page": "https://societe.fr/mentions-legales"
+    })
+
+
+async def rdap_whois(request):
+    error = await simulate("rdap")
+    if error:
+        return error
+    return JSONResponse({
+        "domain": request.query_params.get("domain"),
+        "registrant_organization": "SOCIETE",
+        "registrant_name": None,
+        "registrant_address": "Paris",
+        "registrant_email": None,
+        "registrar": "OVH",
+        "creation_date": "2010-01-01",
+        "expiration_date": "2030-01-01"
+    })
+
+
+async def supabase_sql(request):
+    error = await simulate("supabase")
+    if error:
+        return error
+    rows = PROFILE["supabase"]["rows"]
+    return JSONResponse([{"id": i, "name": f"row {i}", "value": i * 1.5} for i in range(rows)])
+
+
+async def supabase_users(request):
+    error = await simulate("supabase")
+    if error:
+        return error
+    return JSONResponse({"users": [{"id": str(i), "email": f"user{i}@example.com"} for i in range(20)]})
+
+
+async def supabase_buckets(request):
+    error = await simulate("supabase")
+    if error:
+        return error
+    return JSONResponse([{"id": "exports", "name": "exports", "public": False}])
+
+
+def spaced(digits: str, groups: tuple) -> str:
+    out, pos = [], 0
+    for size in groups:
+        out.append(digits[pos:pos + size])
+        pos += size
+    return " ".join(out)
+
+
+async def site_page(request):
+    """Fixture company websites for the local SIRET extractor: /site/{n}/..."""
+    error = await simulate("site")
+    if error:
+        return error
+    n = request.path_params["n"]
+    page = request.path_params.get("page", "")
+    footer = '<footer><a href="contact">Contact</a> | <a href="infos-legales">Informations l&eacute;gales</a></footer>'
+    filler = "<p>" + "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 500 + "</p>"
+    if page == "":
+        body = f"<header><nav><a href='produits'>Produits</a></nav></header><h1>Societe {n}</h1>{filler}{footer}"
+    elif page == "infos-legales" and n % 3 != 2:
+        siren = fake_siren(n)
+        if n % 3 == 0:
+            identifiers = f"SIRET&nbsp;: {spaced(fake_siret(n), (3, 3, 3, 5))}"
+        else:
+            key = (12 + 3 * (int(siren) % 97)) % 97
+            identifiers = f"RCS Paris B {spaced(siren, (3, 3, 3))} - TVA intracommunautaire FR {key:02d} {siren}"
+        body = f"<h1>Mentions l&eacute;gales</h1><p>Societe {n}, SAS au capital de 10 000 &euro;. {identifiers}</p>{footer}"
+    elif page == "contact":
+        body = f"<p>T&eacute;l : 01 23 45 67 89</p>{footer}"
+    else:
+        return HTMLResponse("<h1>Not found</h1>", status_code=404)
+    return HTMLResponse(f"<html><head><script>var id = '12345678901234';</script></head><body>{body}</body></html>")
+
+
+async def health(request):
+    return JSONResponse({"status": "ok"})
+
+
+app = Starlette(routes=[
+    Route("/", health),
+    Route("/search", annuaire_search),
+    Route("/query", serp_query, methods=["POST"]),
+    Route("/api/extract", linkedin_profile, methods=["GET"]),
+    Route("/api/extract", siret_extract, methods=["POST"]),
+    Route("/api/scrape", linkedin_company, methods=["POST"]),
+    Route("/api/whois", rdap_whois),
+    Route("/rest/v1/rpc/{name}", supabase_sql, methods=["POST"]),
+    Route("/auth/v1/admin/users", supabase_users),
+    Route("/storage/v1/bucket", supabase_buckets),
+    Route("/site/{n:int}/", site_page),
+    Route("/site/{n:int}/{page}", site_page)
+])
@@ -0,0 +1,272 @@
+"""
+Load-test and latency benchmark for the MCP servers
+
+Starts the mock upstreams and each server (as real uvicorn processes), drives
+them through the streamable-HTTP endpoint at /mcp with concurrent MCP
+sessions, and reports throughput and p50/p95/p99 per tool.
+
+Usage:
+    python bench/run.py                                 # all servers, default profile
+    python bench/run.py --servers serp annuaire -c 50 -d 30
+    python bench/run.py --profile slow_serp.json --output results/today.json
+    python bench/run.py --baseline results/main.json    # exit 1 on regression
+"""
+
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import argparse
+import datetime
+import subprocess
+import httpx
+from fastmcp import Client
+from fastmcp.client.transports import StreamableHttpTransport
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.join(ROOT, "bench")
+
+AUTH = "Basic " + base64.b64encode(b"ackizit:!Lam3ute!75").decode()
+MOCK_PORT = 9100
+MOCK_URL = f"http://127.0.0.1:{MOCK_PORT}"
+
+# Environment pointing every server at the mock upstreams
+SERVER_ENV = {
+    "ANNUAIRE_API_URL": MOCK_URL,
+    "SERP_URL": f"{MOCK_URL}/query",
+    "LINKEDIN_PROFILE_API_URL": MOCK_URL,
+    "LINKEDIN_COMPANY_API_URL": MOCK_URL,
+    "RDAP_API_URL": MOCK_URL,
+    "SIRET_EXTRACTOR_API_URL": MOCK_URL,
+    "SUPABASE_URL": MOCK_URL,
+    "SUPABASE_ANON_KEY": "bench",
+    "SUPABASE_SERVICE_KEY": "bench",
+    # Measure the upstream path: the persistent SERP cache would answer every repeat
+    "SERP_CACHE_PATH": ""
+}
+
+# Tool calls issued against each server, picked at random by each worker
+SCENARIOS = {
+    "annuaire": [
+        ("annuaire_recherche", {"query": "boulangerie paris", "per_page": 5}),
+        ("check_holding", {"siren": "552032534"}),
+        ("calcul_tva", {"siren": "552032534"})
+    ],
+    "serp": [
+        ("serp_search", {"query": "boulangerie paris"}),
+        ("serp_pappers", {"company_name": "Societe Exemple"}),
+        ("serp_societe_com", {"company_name": "Societe Exemple"}),
+        ("serp_linkedin_company", {"company_name": "Societe Exemple"}),
+        ("serp_search_many", {"queries": ["boulangerie paris", "boulangerie lyon", "boulangerie lille"]})
+    ],
+    "linkedin": [
+        ("linkedin_profile", {"url": "https://www.linkedin.com/in/jean-dupont"}),
+        ("linkedin_company", {"url": "https://www.linkedin.com/company/societe"})
+    ],
+    "rdap": [
+        ("rdap_whois", {"domain": "example.fr"})
+    ],
+    "siret-extractor": [
+        # Fixture sites: SIRET, SIREN + TVA, or nothing published (n % 3)
+        ("siret_extractor", {"url": f"{MOCK_URL}/site/3/"}),
+        ("siret_extractor", {"url": f"{MOCK_URL}/site/4/"}),
+        ("siret_extractor", {"url": f"{MOCK_URL}/site/5/"})
+    ],
+    "supabase": [
+        ("execute_sql", {"query": "SELECT * FROM companies LIMIT 50"}),
+        ("list_tables", {}),
+        ("list_users", {}),
+        ("list_buckets", {})
+    ]
+}
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(p / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+def summarize(samples: list, elapsed: float) -> dict:
+    """Per-tool stats from (tool, latency_s, ok) samples."""
+    by_tool = {}
+    for tool, latency, ok in samples:
+        by_tool.setdefault(tool, []).append((latency, ok))
+
+    tools = {}
+    for tool, values in sorted(by_tool.items()):
+        latencies = sorted(v[0] * 1000 for v in values)
+        errors = sum(1 for v in values if not v[1])
+        tools[tool] = {
+            "calls": len(values),
+            "errors": errors,
+            "error_rate": round(errors / len(values), 4),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "mean_ms": round(sum(latencies) / len(latencies), 2),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(latencies[-1], 2)
+        }
+    return {
+        "elapsed_s": round(elapsed, 2),
+        "calls": len(samples),
+        "throughput_rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        "tools": tools
+    }
+
+
+def is_error(result) -> bool:
+    if result.is_error:
+        return True
+    data = result.structured_content or {}
+    return "error" in data or data.get("success") is False
+
+
+async def wait_healthy(url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=1.0) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become healthy")
+
+
+def start_process(args: list, cwd: str, env: dict) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", *args, "--log-level", "warning"],
+        cwd=cwd,
+        env={**os.environ, **env}
+    )
+
+
+async def worker(url: str, scenario: list, stop_at: float, max_calls: int, samples: list, rng: random.Random):
+    transport = StreamableHttpTransport(url, headers={"Authorization": AUTH})
+    async with Client(transport, timeout=120) as client:
+        while time.monotonic() < stop_at and (max_calls <= 0 or len(samples) < max_calls):
+            tool, arguments = rng.choice(scenario)
+            started = time.perf_counter()
+            try:
+                result = await client.call_tool(tool, arguments, raise_on_error=False)
+                ok = not is_error(result)
+            except Exception:
+                ok = False
+            samples.append((tool, time.perf_counter() - started, ok))
+
+
+async def bench_server(name: str, port: int, args) -> dict:
+    """Run one server against the mocks and load it for the configured duration."""
+    proc = start_process(["server:app", "--port", str(port)], os.path.join(ROOT, name), SERVER_ENV)
+    try:
+        await wait_healthy(f"http://127.0.0.1:{port}/ready")
+        url = f"http://127.0.0.1:{port}/mcp"
+        samples = []
+
+        # Warm-up calls are not recorded
+        await worker(url, SCENARIOS[name], time.monotonic() + args.warmup, 0, [], random.Random(0))
+
+        started = time.monotonic()
+        stop_at = started + args.duration
+        await asyncio.gather(*[
+            worker(url, SCENARIOS[name], stop_at, args.requests, samples, random.Random(args.seed + i))
+            for i in range(args.concurrency)
+        ])
+        return summarize(samples, time.monotonic() - started)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list:
+    """List regressions (p95 up or throughput down by more than threshold %)."""
+    regressions = []
+    for server, result in current["servers"].items():
+        base_tools = baseline.get("servers", {}).get(server, {}).get("tools", {})
+        for tool, stats in result["tools"].items():
+            base = base_tools.get(tool)
+            if not base:
+                continue
+            if base["p95_ms"] and stats["p95_ms"] > base["p95_ms"] * (1 + threshold / 100):
+                regressions.append(f"{server}.{tool}: p95 {base['p95_ms']} -> {stats['p95_ms']} ms")
+            if base["throughput_rps"] and stats["throughput_rps"] < base["throughput_rps"] * (1 - threshold / 100):
+                regressions.append(f"{server}.{tool}: throughput {base['throughput_rps']} -> {stats['throughput_rps']} rps")
+    return regressions
+
+
+def print_report(results: dict):
+    header = f"{'tool':<28}{'calls':>7}{'err%':>7}{'rps':>9}{'p50':>10}{'p95':>10}{'p99':>10}"
+    for server, result in results["servers"].items():
+        print(f"\n== {server} ({result['throughput_rps']} calls/s over {result['elapsed_s']} s)")
+        print(header)
+        for tool, s in result["tools"].items():
+            print(f"{tool:<28}{s['calls']:>7}{s['error_rate'] * 100:>6.1f}%{s['throughput_rps']:>9}"
+                  f"{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--servers", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("-c", "--concurrency", type=int, default=20, help="concurrent MCP sessions")
+    parser.add_argument("-d", "--duration", type=float, default=20.0, help="seconds of load per server")
+    parser.add_argument("-n", "--requests", type=int, default=0, help="stop after N calls per server (0 = duration only)")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds of unrecorded warm-up")
+    parser.add_argument("--profile", help="JSON file overriding mock latency/error distributions")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="results file (default: bench/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="previous results file to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="regression threshold in percent")
+    args = parser.parse_args()
+
+    profile = {}
+    if args.profile:
+        with open(args.profile) as f:
+            profile = json.load(f)
+
+    mock = start_process(["mock_upstreams:app", "--port", str(MOCK_PORT)], BENCH_DIR, {"BENCH_PROFILE": json.dumps(profile)})
+    try:
+        await wait_healthy(f"{MOCK_URL}/")
+        results = {
+            "meta": {
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                "git_rev": subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip(),
+                "concurrency": args.concurrency,
+                "duration_s": args.duration,
+                "requests": args.requests,
+                "profile": profile
+            },
+            "servers": {}
+        }
+        for port, name in enumerate(args.servers, start=MOCK_PORT + 1):
+            results["servers"][name] = await bench_server(name, port, args)
+    finally:
+        mock.terminate()
+        mock.wait()
+
+    print_report(results)
+
+    output = args.output or os.path.join(BENCH_DIR, "results", datetime.datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
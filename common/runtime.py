@@ -0,0 +1,1637 @@
+"""
+Shared runtime of the MCP servers
+
+Tracing, deadlines, upstream resilience (retries, circuit breakers, hedging,
+pooled connections and warm-up), response compression, background jobs,
+admission control, profiling and Basic Auth. Each Dockerfile copies this file
+next to server.py; a server calls setup() on its FastMCP instance and serves
+create_authenticated_app().
+"""
+
+import os
+import gc
+import sys
+import math
+import time
+import base64
+import random
+import asyncio
+import secrets
+import functools
+import contextlib
+import threading
+import contextvars
+import tracemalloc
+import collections
+import zlib
+import anyio
+import httpx
+import msgspec
+import brotli
+import zstandard
+from fastmcp import Context
+from fastmcp.exceptions import ToolError
+from fastmcp.server.dependencies import get_http_headers, get_http_request
+from fastmcp.server.middleware import Middleware
+from urllib.parse import parse_qs
+
+STARTED_AT = time.monotonic()
+
+AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "ackizit")
+AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "!Lam3ute!75")
+
+
+# Tracing: spans are exported as JSON lines to TRACE_FILE (TRACE_EXPORTER=jsonl)
+# or batched to an OTLP/HTTP JSON collector (TRACE_EXPORTER=otlp).
+TRACE_EXPORTER = os.environ.get("TRACE_EXPORTER", "")
+TRACE_FILE = os.environ.get("TRACE_FILE", "traces.jsonl")
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces")
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation within a trace, exported once when ended."""
+
+    def __init__(self, name, trace_id=None, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set(self, key, value):
+        self.attributes[key] = value
+
+    def event(self, name, **attributes):
+        self.events.append({"name": name, "time_ns": time.time_ns(), "attributes": attributes})
+
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def end(self, error=None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = time.time_ns()
+        if error is not None:
+            self.error = str(error) or type(error).__name__
+        span_exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "service": span_exporter.service_name,
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "end_ns": self.end_ns,
+            "duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+            "status": "error" if self.error else "ok",
+            "error": self.error,
+            "attributes": self.attributes,
+            "events": self.events
+        }
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_span(span: Span) -> dict:
+    return {
+        "traceId": span.trace_id,
+        "spanId": span.span_id,
+        "parentSpanId": span.parent_id or "",
+        "name": span.name,
+        "startTimeUnixNano": str(span.start_ns),
+        "endTimeUnixNano": str(span.end_ns),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in span.attributes.items()],
+        "events": [
+            {
+                "name": e["name"],
+                "timeUnixNano": str(e["time_ns"]),
+                "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in e["attributes"].items()]
+            }
+            for e in span.events
+        ],
+        "status": {"code": 2, "message": span.error} if span.error else {"code": 1}
+    }
+
+
+class SpanExporter:
+    """Exports finished spans to a JSONL file or an OTLP/HTTP JSON endpoint."""
+
+    def __init__(self, kind: str, path: str, endpoint: str, batch_size: int = 64, flush_interval: float = 5.0):
+        self.kind = kind
+        self.service_name = "mcp"
+        self.path = path
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._file = None
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._pending = set()
+
+    def export(self, span: Span):
+        if self.kind == "jsonl":
+            if self._file is None:
+                self._file = open(self.path, "a", buffering=1, encoding="utf-8")
+            self._file.write(msgspec.json.encode(span.to_dict(), enc_hook=str).decode() + "\n")
+        elif self.kind == "otlp":
+            self._buffer.append(span)
+            if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+                self.flush()
+
+    def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        self._last_flush = time.monotonic()
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [{"key": "service.name", "value": _otlp_value(self.service_name)}]},
+                "scopeSpans": [{"scope": {"name": "mcp-servers"}, "spans": [_otlp_span(s) for s in batch]}]
+            }]
+        }
+        try:
+            task = asyncio.get_running_loop().create_task(self._post(payload))
+        except RuntimeError:
+            return
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _post(self, payload: dict):
+        # Plain client on purpose: exporting must not produce spans itself.
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                await client.post(self.endpoint, json=payload)
+        except httpx.HTTPError:
+            pass
+
+
+span_exporter = SpanExporter(TRACE_EXPORTER, TRACE_FILE, TRACE_OTLP_ENDPOINT)
+
+
+def _parse_traceparent(value):
+    """Return (trace_id, parent_span_id) from a W3C traceparent header."""
+    parts = (value or "").split("-")
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    return None, None
+
+
+def start_span(name: str, traceparent: str = None, **attributes) -> Span:
+    """Start a span under the current one, or under an incoming traceparent."""
+    parent = _current_span.get()
+    if parent is not None:
+        return Span(name, parent.trace_id, parent.span_id, attributes)
+    trace_id, parent_id = _parse_traceparent(traceparent)
+    return Span(name, trace_id, parent_id, attributes)
+
+
+@contextlib.contextmanager
+def traced(name: str, traceparent: str = None, **attributes):
+    """Run a block inside a span that becomes the current span."""
+    span = start_span(name, traceparent, **attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(error=e)
+        raise
+    finally:
+        _current_span.reset(token)
+        span.end()
+
+
+# httpcore trace steps -> span attribute names
+_HTTP_PHASES = {
+    "connect_tcp": "http.connect_ms",
+    "start_tls": "http.tls_ms",
+    "send_request_body": "http.send_body_ms",
+    "receive_response_body": "http.body_ms"
+}
+
+
+async def _trace_request(request: httpx.Request):
+    span = start_span(
+        f"HTTP {request.method} {request.url.host}",
+        **{"http.method": request.method, "http.url": str(request.url.copy_with(query=None))}
+    )
+    request.headers["traceparent"] = span.traceparent()
+    started = {}
+
+    async def trace(event_name, info):
+        now = time.perf_counter()
+        step, _, stage = event_name.rpartition(".")
+        step = step.rpartition(".")[2]
+        if stage == "started":
+            started[step] = now
+        elif stage == "complete":
+            if step in _HTTP_PHASES and step in started:
+                span.set(_HTTP_PHASES[step], round((now - started[step]) * 1000, 3))
+            if step == "receive_response_headers" and "send_request_headers" in started:
+                span.set("http.ttfb_ms", round((now - started["send_request_headers"]) * 1000, 3))
+            if step == "response_closed":
+                span.set("http.connection_reused", "connect_tcp" not in started)
+                if not trace.held:
+                    span.end()
+        elif stage == "failed" and not trace.held:
+            span.end(error=info.get("exception") if isinstance(info, dict) else None)
+
+    trace.span = span
+    # Set while ResilientTransport may still retry: it then ends the span itself
+    trace.held = False
+    request.extensions["trace"] = trace
+
+
+async def _trace_response(response: httpx.Response):
+    span = getattr(response.request.extensions.get("trace"), "span", None)
+    if span is not None:
+        span.set("http.status_code", response.status_code)
+
+
+# Deadlines: a caller may bound a tool call with `_meta.timeout` (seconds),
+# `_meta.deadline` (unix time) or an X-Request-Timeout header. Upstream
+# timeouts and retries are cut to fit, and the call is cancelled when the
+# deadline passes or the client disconnects.
+CONNECT_TIMEOUT = float(os.environ.get("CONNECT_TIMEOUT", "5"))
+DEADLINE_MARGIN = 0.2
+
+_deadline = contextvars.ContextVar("deadline", default=None)
+
+
+class DeadlineExceeded(httpx.TimeoutException):
+    """Raised instead of starting an upstream request once the deadline has passed."""
+
+
+def deadline_remaining():
+    """Seconds left for upstream work in the current tool call, or None if unbounded."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+# httpx timeout exception -> the phase of request.extensions["timeout"] that expired
+_TIMEOUT_PHASES = {
+    httpx.ConnectTimeout: "connect",
+    httpx.ReadTimeout: "read",
+    httpx.WriteTimeout: "write",
+    httpx.PoolTimeout: "pool"
+}
+
+
+def _apply_deadline(request: httpx.Request) -> set:
+    """Cap every phase timeout of an upstream request to the remaining budget; returns the phases cut."""
+    remaining = deadline_remaining()
+    if remaining is None:
+        return set()
+    if remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded", request=request)
+    timeouts = request.extensions.get("timeout", {})
+    request.extensions["timeout"] = {
+        phase: remaining if value is None else min(value, remaining) for phase, value in timeouts.items()
+    }
+    return {phase for phase, value in timeouts.items() if value is None or value > remaining}
+
+
+def _deadline_timeout(error: Exception, cut: set) -> bool:
+    """Whether error is a timeout the caller's deadline caused, rather than the upstream."""
+    return _TIMEOUT_PHASES.get(type(error)) in cut
+
+
+def _fits_deadline(delay: float) -> bool:
+    remaining = deadline_remaining()
+    return remaining is None or delay < remaining
+
+
+def _requested_timeout(context):
+    """Timeout in seconds asked for by the caller, from request metadata or headers."""
+    try:
+        meta = context.fastmcp_context.request_context.meta
+    except (AttributeError, RuntimeError):
+        meta = None
+    if hasattr(meta, "model_dump"):
+        meta = meta.model_dump()
+    meta = meta or {}
+    try:
+        if meta.get("timeout") is not None:
+            return float(meta["timeout"])
+        if meta.get("deadline") is not None:
+            return float(meta["deadline"]) - time.time()
+        header = get_http_headers().get("x-request-timeout")
+        return float(header) if header else None
+    except (TypeError, ValueError):
+        return None
+
+
+class DeadlineMiddleware(Middleware):
+    """FastMCP middleware enforcing deadlines and client disconnects on tool calls."""
+
+    async def on_call_tool(self, context, call_next):
+        timeout = _requested_timeout(context)
+        token = _deadline.set(time.monotonic() + timeout - DEADLINE_MARGIN if timeout is not None else None)
+        try:
+            cancel_scopes = get_http_request().scope.get("mcp.cancel_scopes")
+        except RuntimeError:
+            cancel_scopes = None
+
+        try:
+            with anyio.CancelScope(deadline=anyio.current_time() + timeout if timeout is not None else math.inf) as scope:
+                if cancel_scopes is not None:
+                    cancel_scopes.add(scope)
+                return await call_next(context)
+        finally:
+            _deadline.reset(token)
+            if cancel_scopes is not None:
+                cancel_scopes.discard(scope)
+        if scope.cancel_called and timeout is not None and anyio.current_time() >= scope.deadline:
+            raise ToolError(f"Deadline of {timeout:.1f}s exceeded")
+        raise ToolError("Client disconnected")
+
+
+
+class CancelOnDisconnectMiddleware:
+    """ASGI middleware cancelling in-flight tool calls when their HTTP client goes away."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        cancel_scopes = set()
+        scope["mcp.cancel_scopes"] = cancel_scopes
+
+        async def watched_receive():
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                for cancel_scope in list(cancel_scopes):
+                    cancel_scope.cancel()
+            return message
+
+        await self.app(scope, watched_receive, send)
+
+
+# Resilience: idempotent requests are retried with jittered exponential backoff on
+# transient errors and 429/5xx; each upstream host gets a circuit breaker, unless the
+# request names its own in its "breaker" extension (several backends behind one host).
+# Over a paced transport (one slowing itself down on 429, like a rate governor), a 429
+# is retried without backoff and does not count against the breaker.
+RETRY_ATTEMPTS = int(os.environ.get("RETRY_ATTEMPTS", "3"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "0.2"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "2.0"))
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_TIMEOUT = float(os.environ.get("BREAKER_RESET_TIMEOUT", "30"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+
+
+class CircuitOpenError(httpx.TransportError):
+    """Raised without contacting the upstream while its breaker is open."""
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker: closed -> open -> half-open (one probe) -> closed."""
+
+    def __init__(self, host: str):
+        self.host = host
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def allow(self) -> bool:
+        if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_RESET_TIMEOUT:
+            self.state = "half_open"
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self.probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= BREAKER_FAILURE_THRESHOLD:
+            self.state = "open"
+            self.opened_at = time.monotonic()
+
+    def release(self):
+        """Free the probe slot of a request cancelled before the upstream answered."""
+        self.probing = False
+
+    def snapshot(self) -> dict:
+        snapshot = {"state": self.state, "consecutive_failures": self.failures}
+        if self.state == "open":
+            snapshot["retry_in_s"] = round(max(0.0, BREAKER_RESET_TIMEOUT - (time.monotonic() - self.opened_at)), 1)
+        return snapshot
+
+
+breakers = {}
+
+
+def breaker_for(host: str) -> CircuitBreaker:
+    if host not in breakers:
+        breakers[host] = CircuitBreaker(host)
+    return breakers[host]
+
+
+def _is_transient(error: Exception) -> bool:
+    # A read timeout means the upstream is slow, not gone: retrying would only
+    # multiply the wait, so only connection-level failures are retried.
+    return isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout, httpx.RemoteProtocolError))
+
+
+def _retry_after(response: httpx.Response) -> float:
+    """Seconds asked for by a Retry-After header, 0 without one."""
+    value = response.headers.get("retry-after", "")
+    return float(value) if value.isdigit() else 0.0
+
+
+def backoff(attempt: int, response: httpx.Response = None) -> float:
+    """Full-jitter exponential backoff, honouring Retry-After when present."""
+    retry_after = _retry_after(response) if response is not None else 0.0
+    if retry_after:
+        return min(retry_after, RETRY_MAX_DELAY)
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """Transport adding retries and per-host circuit breaking around httpx's own."""
+
+    def __init__(
+        self,
+        idempotent: bool = None,
+        transport: httpx.AsyncBaseTransport = None,
+        breakers: bool = True,
+        paced: bool = False
+    ):
+        self.transport = transport or SharedTransport()
+        self.idempotent = idempotent
+        self.breakers = breakers
+        self.paced = paced
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        name = request.extensions.get("breaker") or request.url.netloc.decode("ascii")
+        # Without breakers, a throwaway one: the host is neither tracked nor ever refused
+        breaker = breaker_for(name) if self.breakers else CircuitBreaker(name)
+        idempotent = self.idempotent if self.idempotent is not None else request.method in IDEMPOTENT_METHODS
+        attempts = RETRY_ATTEMPTS if idempotent else 1
+        trace = request.extensions.get("trace")
+        span = getattr(trace, "span", None)
+        if span is None:
+            return await self._send(request, breaker, attempts, None)
+        # One span covers every attempt: closing a retried answer or a failed attempt
+        # must not end it before the retry events are added
+        trace.held = True
+        try:
+            return await self._send(request, breaker, attempts, span)
+        except BaseException as e:
+            span.end(error=e)
+            raise
+        finally:
+            trace.held = False
+
+    async def _send(self, request: httpx.Request, breaker: CircuitBreaker, attempts: int, span) -> httpx.Response:
+        for attempt in range(attempts):
+            cut = _apply_deadline(request)
+            if not breaker.allow():
+                raise CircuitOpenError(f"Circuit open for {breaker.host}", request=request)
+            probe = breaker.state == "half_open"
+            last = attempt == attempts - 1
+            try:
+                response = await self.transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if _deadline_timeout(e, cut):
+                    # Only the configured timeouts speak for the upstream: a caller's short
+                    # deadline must not open the breaker for everyone else
+                    if probe:
+                        breaker.release()
+                    raise
+                breaker.record_failure()
+                delay = backoff(attempt)
+                if last or not _is_transient(e) or not _fits_deadline(delay):
+                    raise
+                reason = type(e).__name__
+            except BaseException:
+                # Cancelled (deadline, disconnect, lost hedge): says nothing about the
+                # upstream, but a half-open probe must not hold the slot forever
+                if probe:
+                    breaker.release()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.record_success()
+                    return response
+                if response.status_code == 429 and self.paced:
+                    # The upstream is up, only busy: the retry waits its turn in the
+                    # transport below, which has already slowed down for it
+                    if probe:
+                        breaker.release()
+                    delay = 0.0
+                    wait = _retry_after(response)
+                else:
+                    breaker.record_failure()
+                    delay = wait = backoff(attempt, response)
+                if last or not _fits_deadline(wait):
+                    return response
+                reason = f"HTTP {response.status_code}"
+                await response.aclose()
+            if span is not None:
+                span.event("retry", attempt=attempt + 1, reason=reason, delay_s=round(delay, 3))
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+# Hedging (opt-in): when the first attempt has not answered after the observed
+# HEDGE_PERCENTILE latency, a backup request is sent and the first answer wins.
+# Each request earns HEDGE_BUDGET of a hedge, so at most that fraction is duplicated.
+# Only first attempts are timed; one cancelled after losing counts with its elapsed
+# time (a lower bound), so slow answers keep weighing on the percentile once hedged.
+HEDGE_ENABLED = os.environ.get("HEDGE_ENABLED", "") in ("1", "true")
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.environ.get("HEDGE_BUDGET", "0.1"))
+# Delay before the first hedge while too few latencies are known (default per upstream)
+HEDGE_INITIAL_DELAY = os.environ.get("HEDGE_INITIAL_DELAY", "")
+HEDGE_MIN_DELAY = 0.05
+HEDGE_MIN_SAMPLES = 20
+HEDGE_WINDOW = 500
+HEDGE_MAX_TOKENS = 10.0
+
+
+def _discard_response(task: asyncio.Task):
+    """Done-callback for losing attempts: release their connection."""
+    if task.cancelled() or task.exception() is not None:
+        return
+    asyncio.ensure_future(task.result().aclose())
+
+
+class Hedger:
+    """Adaptive hedging policy and statistics for one upstream."""
+
+    def __init__(self, name: str, alternate_url: str = "", initial_delay: float = 1.5):
+        self.name = name
+        self.alternate = httpx.URL(alternate_url) if alternate_url else None
+        self.initial_delay = float(HEDGE_INITIAL_DELAY) if HEDGE_INITIAL_DELAY else initial_delay
+        self.latencies = collections.deque(maxlen=HEDGE_WINDOW)
+        self.tokens = HEDGE_MAX_TOKENS
+        self.stats = {"requests": 0, "hedged": 0, "hedge_wins": 0, "budget_exhausted": 0, "censored": 0}
+
+    def delay(self) -> float:
+        if len(self.latencies) < HEDGE_MIN_SAMPLES:
+            return self.initial_delay
+        ordered = sorted(self.latencies)
+        return max(HEDGE_MIN_DELAY, ordered[int(HEDGE_PERCENTILE / 100 * (len(ordered) - 1))])
+
+    def snapshot(self) -> dict:
+        return {**self.stats, "delay_s": round(self.delay(), 3), "tokens": round(self.tokens, 2)}
+
+    def _backup(self, request: httpx.Request) -> httpx.Request:
+        url = request.url
+        if self.alternate is not None:
+            url = url.copy_with(scheme=self.alternate.scheme, host=self.alternate.host, port=self.alternate.port)
+        extensions = {k: v for k, v in request.extensions.items() if k != "trace"}
+        return httpx.Request(request.method, url, headers=request.headers, content=request.content, extensions=extensions)
+
+    def _record(self, started: float, task: asyncio.Task):
+        """Done-callback of a first attempt: its latency, or time spent until cancelled."""
+        if task.cancelled():
+            self.stats["censored"] += 1
+        elif task.exception() is not None:
+            return
+        self.latencies.append(time.monotonic() - started)
+
+    async def send(self, transport, request: httpx.Request) -> httpx.Response:
+        self.stats["requests"] += 1
+        self.tokens = min(HEDGE_MAX_TOKENS, self.tokens + HEDGE_BUDGET)
+        attempts = [asyncio.ensure_future(transport.handle_async_request(request))]
+        attempts[0].add_done_callback(functools.partial(self._record, time.monotonic()))
+        winner = None
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=self.delay())
+            if not done:
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    self.stats["hedged"] += 1
+                    span = getattr(request.extensions.get("trace"), "span", None)
+                    if span is not None:
+                        span.event("hedge", delay_s=round(self.delay(), 3))
+                    attempts.append(asyncio.ensure_future(transport.handle_async_request(self._backup(request))))
+                else:
+                    self.stats["budget_exhausted"] += 1
+
+            pending = set(attempts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                winner = next((t for t in attempts if t in done and t.exception() is None), None)
+                if winner is not None:
+                    if winner is not attempts[0]:
+                        self.stats["hedge_wins"] += 1
+                    return winner.result()
+            return attempts[0].result()
+        finally:
+            for task in attempts:
+                if task is not winner:
+                    task.cancel()
+                    task.add_done_callback(_discard_response)
+
+
+class HedgingTransport(httpx.AsyncBaseTransport):
+    """Transport sending requests through a Hedger."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, hedger: Hedger):
+        self.transport = transport
+        self.hedger = hedger
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self.hedger.send(self.transport, request)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+# Upstream connections live in one process-wide pool, so they survive between
+# tool calls. At startup every upstream origin is resolved and connected
+# WARMUP_CONNECTIONS times, then re-warmed every WARMUP_INTERVAL seconds (0 disables);
+# /ready answers 503 until the first warm-up is over.
+POOL_MAX_CONNECTIONS = int(os.environ.get("POOL_MAX_CONNECTIONS", "100"))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get("POOL_KEEPALIVE_EXPIRY", "120"))
+WARMUP_CONNECTIONS = int(os.environ.get("WARMUP_CONNECTIONS", "2"))
+WARMUP_TIMEOUT = float(os.environ.get("WARMUP_TIMEOUT", "10"))
+WARMUP_INTERVAL = float(os.environ.get("WARMUP_INTERVAL", "60"))
+
+upstream_pool = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+    max_connections=POOL_MAX_CONNECTIONS,
+    max_keepalive_connections=POOL_MAX_CONNECTIONS,
+    keepalive_expiry=POOL_KEEPALIVE_EXPIRY
+))
+
+
+class SharedTransport(httpx.AsyncBaseTransport):
+    """A long-lived pool (the process-wide upstream one by default), left open when a client using it is closed."""
+
+    def __init__(self, pool: httpx.AsyncHTTPTransport = None):
+        self.pool = pool
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await (self.pool or upstream_pool).handle_async_request(request)
+
+    async def aclose(self):
+        pass
+
+
+class Warmup:
+    """Connection warm-up of the upstream origins, and readiness state."""
+
+    def __init__(self, urls: list, pools: list = ()):
+        self.origins = sorted({str(httpx.URL(url).copy_with(path="/", query=None)) for url in urls if url})
+        # Service-owned pools (crawled sites...), closed with the upstream one
+        self.pools = list(pools)
+        self.ready = False
+        self.startup_ms = None
+        self.warmup_ms = None
+        self.upstreams = {}
+        self._task = None
+
+    async def _connect(self, origin: str):
+        response = await upstream_pool.handle_async_request(httpx.Request("HEAD", origin))
+        # Reading the (empty) body lets the connection go back to the pool idle
+        await response.aread()
+        await response.aclose()
+
+    async def warm(self, origin: str) -> dict:
+        """Open WARMUP_CONNECTIONS pooled connections to origin (any HTTP answer counts)."""
+        start = time.perf_counter()
+        try:
+            with anyio.fail_after(WARMUP_TIMEOUT):
+                await asyncio.gather(*(self._connect(origin) for _ in range(WARMUP_CONNECTIONS)))
+            result = {"ok": True}
+        except Exception as e:
+            result = {"ok": False, "error": f"{type(e).__name__}: {e}"[:200]}
+        result["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return result
+
+    async def run(self):
+        with traced("startup.warmup", **{"warmup.upstreams": len(self.origins)}) as span:
+            start = time.perf_counter()
+            results = await asyncio.gather(*(self.warm(origin) for origin in self.origins))
+            self.upstreams = dict(zip(self.origins, results))
+            self.warmup_ms = round((time.perf_counter() - start) * 1000, 1)
+            self.startup_ms = round((time.monotonic() - STARTED_AT) * 1000, 1)
+            self.ready = True
+            span.set("startup_ms", self.startup_ms)
+
+        while WARMUP_INTERVAL > 0:
+            await asyncio.sleep(WARMUP_INTERVAL)
+            results = await asyncio.gather(*(self.warm(origin) for origin in self.origins))
+            self.upstreams = dict(zip(self.origins, results))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self.run(), context=contextvars.Context())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+        for pool in [upstream_pool, *self.pools]:
+            await pool.aclose()
+
+    def snapshot(self) -> dict:
+        return {
+            "status": "ready" if self.ready else "warming",
+            "startup_ms": self.startup_ms,
+            "warmup_ms": self.warmup_ms,
+            "upstreams": self.upstreams
+        }
+
+
+class LifespanMiddleware:
+    """ASGI middleware warming upstream connections on startup and closing the pool on shutdown."""
+
+    def __init__(self, app, warmup: Warmup):
+        self.app = app
+        self.warmup = warmup
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "lifespan":
+            await self.app(scope, receive, send)
+            return
+
+        async def lifespan_receive():
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.warmup.start()
+            elif message["type"] == "lifespan.shutdown":
+                await self.warmup.stop()
+            return message
+
+        await self.app(scope, lifespan_receive, send)
+
+
+# Compression: responses of at least COMPRESS_MIN_SIZE bytes (and every streamed
+# response, SSE included) are compressed with the client's preferred encoding among
+# COMPRESS_ENCODINGS (empty disables). Streams are flushed after each chunk so no
+# event is held back. Upstream calls advertise every encoding httpx can decode.
+COMPRESS_ENCODINGS = [e.strip() for e in os.environ.get("COMPRESS_ENCODINGS", "zstd,br,gzip").split(",") if e.strip()]
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "4"))
+COMPRESS_ZSTD_LEVEL = int(os.environ.get("COMPRESS_ZSTD_LEVEL", "3"))
+COMPRESSIBLE_TYPES = (b"application/json", b"text/")
+UPSTREAM_ACCEPT_ENCODING = "zstd, br, gzip, deflate"
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Pick the COMPRESS_ENCODINGS entry with the highest q-value, in our order on ties."""
+    weights = {}
+    for part in accept_encoding.split(","):
+        coding, _, params = part.partition(";")
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        weights[coding.strip().lower()] = q
+
+    best, best_q = None, 0.0
+    for encoding in COMPRESS_ENCODINGS:
+        q = weights.get(encoding, weights.get("*", 0.0))
+        if q > best_q:
+            best, best_q = encoding, q
+    return best
+
+
+class StreamCompressor:
+    """Incremental zstd/br/gzip compressor whose every output is decodable on its own."""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=COMPRESS_ZSTD_LEVEL).compressobj()
+        elif encoding == "br":
+            self._compressor = brotli.Compressor(quality=COMPRESS_BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(COMPRESS_GZIP_LEVEL, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool = False) -> bytes:
+        if self.encoding == "zstd":
+            mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            return self._compressor.compress(data) + self._compressor.flush(mode)
+        if self.encoding == "br":
+            out = self._compressor.process(data)
+            return out + (self._compressor.finish() if final else self._compressor.flush())
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with the best encoding the client accepts."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        encoding = negotiate_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start = None
+        compressor = None
+
+        async def compressing_send(message):
+            nonlocal start, compressor
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if start is not None and self._compressible(start, body, more_body):
+                compressor = StreamCompressor(encoding)
+            if compressor is not None:
+                body = compressor.compress(body, final=not more_body)
+                message = {**message, "body": body}
+            if start is not None:
+                if compressor is not None:
+                    start = {**start, "headers": self._encoded_headers(start, encoding, None if more_body else len(body))}
+                await send(start)
+                start = None
+            await send(message)
+
+        await self.app(scope, receive, compressing_send)
+
+    @staticmethod
+    def _compressible(start: dict, body: bytes, more_body: bool) -> bool:
+        """Decided on the first body chunk: only unstreamed bodies have a known size."""
+        headers = {bytes(k).lower(): bytes(v) for k, v in start.get("headers", [])}
+        return (
+            200 <= start["status"] and start["status"] not in (204, 304)
+            and b"content-encoding" not in headers
+            and headers.get(b"content-type", b"").lower().startswith(COMPRESSIBLE_TYPES)
+            and (more_body or len(body) >= COMPRESS_MIN_SIZE)
+        )
+
+    @staticmethod
+    def _encoded_headers(start: dict, encoding: str, length: int = None) -> list:
+        headers = [(bytes(k), bytes(v)) for k, v in start.get("headers", []) if bytes(k).lower() != b"content-length"]
+        headers.append((b"content-encoding", encoding.encode()))
+        headers.append((b"vary", b"Accept-Encoding"))
+        if length is not None:
+            headers.append((b"content-length", str(length).encode()))
+        return headers
+
+
+def http_client(
+    timeout: float,
+    idempotent: bool = None,
+    hedger: Hedger = None,
+    transport: httpx.AsyncBaseTransport = None,
+    breakers: bool = True,
+    paced: bool = False
+) -> httpx.AsyncClient:
+    """httpx client with tracing, retries and circuit breaking.
+
+    idempotent overrides the per-method default deciding whether requests may be retried.
+    hedger, when given, hedges slow requests (only pass it for idempotent calls).
+    transport replaces the shared pool under the retries (e.g. a rate-governed one).
+    breakers=False skips circuit breaking, for hosts that are not our upstreams (crawled sites).
+    paced=True when that transport paces 429s itself: they are then left to it.
+    """
+    transport = ResilientTransport(idempotent, transport, breakers, paced)
+    if hedger is not None:
+        transport = HedgingTransport(transport, hedger)
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(timeout, connect=min(CONNECT_TIMEOUT, timeout)),
+        headers={"Accept-Encoding": UPSTREAM_ACCEPT_ENCODING},
+        transport=transport,
+        event_hooks={"request": [_trace_request], "response": [_trace_response]}
+    )
+
+
+class TraceMiddleware:
+    """ASGI middleware opening the root span of each HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path in ("/", "", "/ready"):
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        incoming = headers.get(b"traceparent", b"").decode("latin-1")
+        attributes = {"http.method": scope.get("method"), "http.target": path}
+
+        with traced("http.server", incoming, **attributes) as span:
+            async def traced_send(message):
+                if message["type"] == "http.response.start":
+                    span.set("http.status_code", message["status"])
+                await send(message)
+
+            # Propagate our span to the MCP layer, which runs tools in another task
+            scope = dict(scope)
+            scope["headers"] = [
+                (k, v) for k, v in scope.get("headers", []) if k != b"traceparent"
+            ] + [(b"traceparent", span.traceparent().encode())]
+            await self.app(scope, receive, traced_send)
+
+
+class ToolTracingMiddleware(Middleware):
+    """FastMCP middleware wrapping each tool invocation in a span."""
+
+    async def on_call_tool(self, context, call_next):
+        name = context.message.name
+        with traced(f"tool {name}", get_http_headers().get("traceparent"), **{"mcp.tool": name}):
+            return await call_next(context)
+
+
+def decode_upstream(decoder: msgspec.json.Decoder, content: bytes, include_raw: bool = False) -> tuple:
+    """(typed, raw) of an upstream JSON body, parsed once; raw is None unless include_raw."""
+    if not include_raw:
+        return decoder.decode(content), None
+    raw = msgspec.json.decode(content)
+    return msgspec.convert(raw, decoder.type), raw
+
+
+# Jobs: slow scrapes can be submitted and collected later. A bounded pool of
+# workers drains a bounded queue; finished jobs are kept in a bounded store
+# (oldest finished evicted first, expired after JOB_TTL seconds).
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.environ.get("JOB_QUEUE_SIZE", "500"))
+JOB_STORE_SIZE = int(os.environ.get("JOB_STORE_SIZE", "2000"))
+JOB_TTL = float(os.environ.get("JOB_TTL", "3600"))
+JOB_PROGRESS = {"queued": 0, "running": 1, "done": 2, "error": 2}
+
+
+class Job:
+    """A queued tool invocation and its outcome."""
+
+    def __init__(self, tool: str, func, arguments: dict):
+        self.id = secrets.token_hex(8)
+        self.tool = tool
+        self.func = func
+        self.arguments = arguments
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.traceparent = None
+        self.finished = asyncio.Event()
+
+    def to_dict(self) -> dict:
+        job = {
+            "job_id": self.id,
+            "tool": self.tool,
+            "arguments": self.arguments,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+        if self.status == "done":
+            job["result"] = self.result
+        elif self.status == "error":
+            job["error"] = self.error
+        return job
+
+
+class JobRunner:
+    """Bounded job queue, worker pool and evicting job store."""
+
+    def __init__(self, workers: int, queue_size: int, store_size: int):
+        self.workers = workers
+        self.store_size = store_size
+        self.queue = None
+        self.queue_size = queue_size
+        self.jobs = collections.OrderedDict()
+        self._tasks = []
+
+    def _start(self):
+        if self._tasks:
+            return
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        loop = asyncio.get_running_loop()
+        # Fresh context: workers must not inherit the submitting call's deadline or span
+        self._tasks = [loop.create_task(self._work(), context=contextvars.Context()) for _ in range(self.workers)]
+
+    def _evict(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished_at and now - job.finished_at > JOB_TTL:
+                del self.jobs[job_id]
+        if len(self.jobs) < self.store_size:
+            return
+        for job_id, job in self.jobs.items():
+            if job.finished_at:
+                del self.jobs[job_id]
+                return
+        raise ToolError("Job store full, retry later")
+
+    def submit(self, tool: str, func, **arguments) -> Job:
+        self._start()
+        self._evict()
+        job = Job(tool, func, arguments)
+        span = _current_span.get()
+        job.traceparent = span.traceparent() if span is not None else None
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise ToolError(f"Job queue full ({self.queue.maxsize} pending), retry later")
+        self.jobs[job.id] = job
+        return job
+
+    def get(self, job_id: str) -> Job:
+        job = self.jobs.get(job_id)
+        if job is None:
+            raise ToolError(f"Unknown or expired job: {job_id}")
+        return job
+
+    async def _work(self):
+        while True:
+            job = await self.queue.get()
+            job.status = "running"
+            job.started_at = time.time()
+            try:
+                with traced(f"job {job.tool}", job.traceparent, **{"job.id": job.id}):
+                    job.result = await job.func(**job.arguments)
+                job.status = "done"
+            except Exception as e:
+                job.status = "error"
+                job.error = str(e) or type(e).__name__
+            finally:
+                job.finished_at = time.time()
+                job.finished.set()
+                self.queue.task_done()
+
+    def snapshot(self) -> dict:
+        counts = collections.Counter(job.status for job in self.jobs.values())
+        return {"workers": self.workers, "queued": self.queue.qsize() if self.queue else 0, **counts}
+
+
+job_runner = JobRunner(JOB_WORKERS, JOB_QUEUE_SIZE, JOB_STORE_SIZE)
+
+
+def register_job_tools(mcp):
+    """Add the get_job and wait_job tools of the job runner to a server with submit_* tools."""
+
+    async def get_job(job_id: str) -> dict:
+        """
+        Renvoie le statut d'un job (queued, running, done, error) et son résultat.
+
+        Args:
+            job_id: Identifiant renvoyé par un tool submit_*
+
+        Returns:
+            Statut du job, et résultat ou erreur s'il est terminé
+        """
+        return job_runner.get(job_id).to_dict()
+
+    async def wait_job(job_id: str, ctx: Context, timeout: float = 60) -> dict:
+        """
+        Attend la fin d'un job en envoyant des notifications de progression.
+
+        Args:
+            job_id: Identifiant renvoyé par un tool submit_*
+            timeout: Attente maximale en secondes (défaut: 60)
+
+        Returns:
+            Statut du job, et résultat ou erreur s'il est terminé avant le timeout
+        """
+        job = job_runner.get(job_id)
+        remaining = deadline_remaining()
+        wait_until = time.monotonic() + (timeout if remaining is None else min(timeout, remaining))
+
+        while not job.finished.is_set() and time.monotonic() < wait_until:
+            await ctx.report_progress(
+                progress=JOB_PROGRESS[job.status],
+                total=2,
+                message=f"{job.status} ({time.time() - job.created_at:.0f}s)"
+            )
+            try:
+                await asyncio.wait_for(job.finished.wait(), timeout=min(2.0, max(0.0, wait_until - time.monotonic())))
+            except asyncio.TimeoutError:
+                pass
+
+        await ctx.report_progress(progress=JOB_PROGRESS[job.status], total=2, message=job.status)
+        return job.to_dict()
+
+    mcp.tool(get_job)
+    mcp.tool(wait_job)
+
+
+# Admission control: at most ADMISSION_MAX_INFLIGHT tool calls run at once in the
+# server, and ADMISSION_TOOL_MAX_INFLIGHT per tool (ADMISSION_TOOL_LIMITS overrides it
+# per tool, e.g. '{"serp_search_many": 10}'). Calls over a limit wait up to
+# ADMISSION_QUEUE_TIMEOUT seconds in a queue of at most ADMISSION_QUEUE_SIZE, then get
+# a 503 with Retry-After. Other MCP messages (initialize, tools/list...) are not limited.
+ADMISSION_MAX_INFLIGHT = int(os.environ.get("ADMISSION_MAX_INFLIGHT", "100"))
+ADMISSION_TOOL_MAX_INFLIGHT = int(os.environ.get("ADMISSION_TOOL_MAX_INFLIGHT", "50"))
+ADMISSION_TOOL_LIMITS = msgspec.json.decode(os.environ.get("ADMISSION_TOOL_LIMITS", "{}"), type=dict[str, int])
+ADMISSION_QUEUE_SIZE = int(os.environ.get("ADMISSION_QUEUE_SIZE", "50"))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "2"))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", "1"))
+
+
+class Overloaded(Exception):
+    pass
+
+
+class AdmissionGate:
+    """In-flight limit whose waiters are served first come, first served."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.inflight = 0
+        self._waiters = collections.deque()
+
+    def try_acquire(self) -> bool:
+        if self.inflight < self.limit and not self._waiters:
+            self.inflight += 1
+            return True
+        return False
+
+    async def acquire(self):
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    # release() already dropped it while skipping cancelled waiters
+                    pass
+            raise
+
+    def release(self):
+        # Hand the slot over to the oldest waiter, or free it
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.inflight -= 1
+
+
+class AdmissionController:
+    """Server-wide and per-tool gates sharing one bounded wait queue."""
+
+    def __init__(self):
+        self.server = AdmissionGate(ADMISSION_MAX_INFLIGHT)
+        self.tools = {}
+        self.waiting = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def gate_for(self, tool: str) -> AdmissionGate:
+        gate = self.tools.get(tool)
+        if gate is None:
+            gate = self.tools[tool] = AdmissionGate(ADMISSION_TOOL_LIMITS.get(tool, ADMISSION_TOOL_MAX_INFLIGHT))
+        return gate
+
+    async def _acquire(self, gate: AdmissionGate, deadline: float):
+        if gate.try_acquire():
+            return
+        if self.waiting >= ADMISSION_QUEUE_SIZE:
+            raise Overloaded()
+        self.waiting += 1
+        try:
+            with anyio.fail_after(max(deadline - time.monotonic(), 0)):
+                await gate.acquire()
+        except TimeoutError:
+            raise Overloaded() from None
+        finally:
+            self.waiting -= 1
+
+    @contextlib.asynccontextmanager
+    async def admit(self, tool: str):
+        # Tool gate first: calls queued behind a saturated tool hold no server slot,
+        # so one slow upstream cannot starve the other tools
+        deadline = time.monotonic() + ADMISSION_QUEUE_TIMEOUT
+        acquired = []
+        try:
+            for gate in (self.gate_for(tool), self.server):
+                await self._acquire(gate, deadline)
+                acquired.append(gate)
+        except Overloaded:
+            self.rejected += 1
+            for gate in acquired:
+                gate.release()
+            raise
+
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            for gate in acquired:
+                gate.release()
+
+    def snapshot(self) -> dict:
+        return {
+            "inflight": self.server.inflight,
+            "limit": self.server.limit,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "tools": {name: gate.inflight for name, gate in self.tools.items() if gate.inflight}
+        }
+
+
+admission = AdmissionController()
+
+
+class RpcParams(msgspec.Struct):
+    name: str | None = None
+
+
+class RpcMessage(msgspec.Struct):
+    id: int | str | None = None
+    method: str | None = None
+    params: RpcParams | None = None
+
+
+rpc_decoder = msgspec.json.Decoder(RpcMessage)
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying admission control to MCP tool calls."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST":
+            await self.app(scope, receive, send)
+            return
+
+        # Buffer the JSON-RPC body to find the tool, then replay it to the app
+        messages = []
+        while True:
+            message = await receive()
+            messages.append(message)
+            if message["type"] != "http.request" or not message.get("more_body", False):
+                break
+
+        try:
+            rpc = rpc_decoder.decode(b"".join(m.get("body", b"") for m in messages))
+        except msgspec.DecodeError:
+            rpc = None
+
+        async def replay_receive():
+            if messages:
+                return messages.pop(0)
+            return await receive()
+
+        if rpc is None or rpc.method != "tools/call" or rpc.params is None or not rpc.params.name:
+            await self.app(scope, replay_receive, send)
+            return
+
+        try:
+            async with admission.admit(rpc.params.name):
+                await self.app(scope, replay_receive, send)
+        except Overloaded:
+            await self._send_503(send, rpc.id)
+
+    async def _send_503(self, send, request_id):
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                [b"content-type", b"application/json"],
+                [b"retry-after", str(ADMISSION_RETRY_AFTER).encode()]
+            ]
+        })
+        await send({
+            "type": "http.response.body",
+            "body": msgspec.json.encode({
+                "jsonrpc": "2.0",
+                "id": request_id,
+                "error": {"code": -32000, "message": "Server overloaded, retry later"}
+            })
+        })
+
+
+# Profiling: with PROFILING_ENABLED, admin endpoints are served behind Basic Auth.
+# Disabled (the default), the middleware is not mounted and tracemalloc never starts.
+#   /admin/memory   tracemalloc top allocation growth since the previous call; the first
+#                   call starts tracing, ?stop=1 stops it (?top=, ?traceback=1)
+#   /admin/objects  live objects by type with the change since the previous call, and
+#                   the MCP sessions held by the streamable-HTTP app (?top=)
+#   /admin/cpu      sampling CPU profile of every thread over ?seconds= (?hz=), as
+#                   collapsed stacks for flamegraph.pl or speedscope
+PROFILING_ENABLED = os.environ.get("PROFILING_ENABLED", "") in ("1", "true")
+PROFILING_TRACE_FRAMES = int(os.environ.get("PROFILING_TRACE_FRAMES", "8"))
+PROFILING_MAX_SECONDS = 60
+PROFILING_MAX_HZ = 1000
+MCP_SESSION_TYPES = ("ServerSession", "StreamableHTTPServerTransport")
+_MEMORY_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>")
+]
+
+
+def rss_bytes():
+    """Resident set size of the process (Linux only)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+
+def sample_stacks(seconds: float, interval: float) -> collections.Counter:
+    """Collapsed stacks (root first) of every other thread, sampled every interval."""
+    me = threading.get_ident()
+    stacks = collections.Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            stacks[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+class Profiler:
+    """Snapshots the memory and object endpoints diff against."""
+
+    def __init__(self):
+        self.memory_snapshot = None
+        self.object_counts = collections.Counter()
+
+    def memory(self, top: int, traceback: bool, stop: bool) -> dict:
+        if stop:
+            tracemalloc.stop()
+            self.memory_snapshot = None
+            return {"tracing": False}
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILING_TRACE_FRAMES)
+            self.memory_snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+            return {"tracing": True, "rss_bytes": rss_bytes(), "top": []}
+
+        snapshot = tracemalloc.take_snapshot().filter_traces(_MEMORY_FILTERS)
+        stats = snapshot.compare_to(self.memory_snapshot, "traceback" if traceback else "lineno")
+        self.memory_snapshot = snapshot
+        traced, peak = tracemalloc.get_traced_memory()
+        return {
+            "tracing": True,
+            "rss_bytes": rss_bytes(),
+            "traced_bytes": traced,
+            "peak_bytes": peak,
+            "top": [
+                {
+                    "size_diff": stat.size_diff,
+                    "count_diff": stat.count_diff,
+                    "size": stat.size,
+                    "count": stat.count,
+                    "traceback": [f"{frame.filename}:{frame.lineno}" for frame in stat.traceback]
+                }
+                for stat in stats[:top]
+            ]
+        }
+
+    def objects(self, top: int, mcp_app) -> dict:
+        # gc only tracks containers: str, bytes and numbers are not counted
+        counts = collections.Counter(f"{type(o).__module__}.{type(o).__qualname__}" for o in gc.get_objects())
+        previous, self.object_counts = self.object_counts, counts
+        growth = sorted(counts, key=lambda name: counts[name] - previous[name], reverse=True)
+        return {
+            "rss_bytes": rss_bytes(),
+            "total": sum(counts.values()),
+            "top": [{"type": name, "count": count, "diff": count - previous[name]} for name, count in counts.most_common(top)],
+            "growth": [
+                {"type": name, "count": counts[name], "diff": counts[name] - previous[name]}
+                for name in growth[:top] if counts[name] > previous[name]
+            ],
+            "mcp_sessions": mcp_sessions(mcp_app, counts)
+        }
+
+
+def mcp_sessions(mcp_app, counts: collections.Counter) -> dict:
+    """Sessions tracked by the streamable-HTTP session manager, and live session objects."""
+    active = None
+    for route in getattr(mcp_app, "routes", []):
+        manager = getattr(getattr(route, "endpoint", None), "session_manager", None)
+        if manager is not None:
+            # Private to the MCP SDK, hence the fallback
+            active = len(getattr(manager, "_server_instances", {}))
+    objects = {
+        name: sum(count for type_name, count in counts.items() if type_name.endswith(f".{name}"))
+        for name in MCP_SESSION_TYPES
+    }
+    return {"active": active, "objects": objects}
+
+
+profiler = Profiler()
+
+
+class ProfilingMiddleware:
+    """ASGI middleware serving the /admin/ profiling endpoints, mounted behind Basic Auth."""
+
+    def __init__(self, app, mcp_app):
+        self.app = app
+        self.mcp_app = mcp_app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or not path.startswith("/admin/"):
+            await self.app(scope, receive, send)
+            return
+
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+
+        def arg(name: str, default: str) -> str:
+            return query.get(name, [default])[-1]
+
+        try:
+            top = int(arg("top", "30"))
+            if path == "/admin/memory":
+                body = profiler.memory(top, arg("traceback", "0") in ("1", "true"), arg("stop", "0") in ("1", "true"))
+            elif path == "/admin/objects":
+                body = profiler.objects(top, self.mcp_app)
+            elif path == "/admin/cpu":
+                seconds = min(float(arg("seconds", "10")), PROFILING_MAX_SECONDS)
+                hz = min(float(arg("hz", "100")), PROFILING_MAX_HZ)
+                stacks = await anyio.to_thread.run_sync(sample_stacks, seconds, 1 / hz)
+                collapsed = "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+                await self._send(send, 200, b"text/plain; charset=utf-8", collapsed.encode())
+                return
+            else:
+                await self._send(send, 404, b"application/json", b'{"error": "Not found"}')
+                return
+        except (ValueError, ZeroDivisionError) as e:
+            await self._send(send, 400, b"application/json", msgspec.json.encode({"error": str(e)}))
+            return
+
+        await self._send(send, 200, b"application/json", msgspec.json.encode(body))
+
+    async def _send(self, send, status: int, content_type: bytes, body: bytes):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [[b"content-type", content_type]]
+        })
+        await send({
+            "type": "http.response.body",
+            "body": body
+        })
+
+
+class BasicAuthMiddleware:
+    """ASGI middleware for Basic Auth, serving the health and readiness probes without it."""
+
+    def __init__(self, app, warmup: Warmup, health=None):
+        self.app = app
+        self.warmup = warmup
+        self.health = health
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        # Allow healthcheck on root path without auth
+        path = scope.get("path", "")
+        if path == "/" or path == "":
+            await self._send_health(send)
+            return
+        if path == "/ready":
+            await self._send_ready(send)
+            return
+
+        with traced("auth"):
+            headers = dict(scope.get("headers", []))
+            auth_header = headers.get(b"authorization", b"").decode("utf-8")
+
+            if not auth_header.startswith("Basic "):
+                await self._send_401(send)
+                return
+
+            try:
+                encoded = auth_header[6:]
+                decoded = base64.b64decode(encoded).decode("utf-8")
+                username, password = decoded.split(":", 1)
+
+                if username != AUTH_USERNAME or password != AUTH_PASSWORD:
+                    await self._send_401(send)
+                    return
+            except Exception:
+                await self._send_401(send)
+                return
+
+        await self.app(scope, receive, send)
+
+    async def _send_401(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 401,
+            "headers": [
+                [b"content-type", b"application/json"],
+                [b"www-authenticate", b'Basic realm="MCP Server"']
+            ]
+        })
+        await send({
+            "type": "http.response.body",
+            "body": b'{"error": "Unauthorized"}'
+        })
+
+    async def _send_ready(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200 if self.warmup.ready else 503,
+            "headers": [[b"content-type", b"application/json"]]
+        })
+        await send({
+            "type": "http.response.body",
+            "body": msgspec.json.encode(self.warmup.snapshot())
+        })
+
+    async def _send_health(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [[b"content-type", b"application/json"]]
+        })
+        body = {
+            "status": "ok",
+            "breakers": {host: b.snapshot() for host, b in breakers.items()},
+            "admission": admission.snapshot()
+        }
+        if self.health is not None:
+            body.update(self.health())
+        await send({
+            "type": "http.response.body",
+            "body": msgspec.json.encode(body)
+        })
+
+
+def setup(mcp, service_name: str):
+    """Install the deadline and tool tracing middleware, and name the trace service."""
+    span_exporter.service_name = service_name
+    mcp.add_middleware(DeadlineMiddleware())
+    mcp.add_middleware(ToolTracingMiddleware())
+
+
+def create_authenticated_app(mcp, warmup: Warmup, health=None):
+    """Wrap FastMCP app with Basic Auth, admission control, tracing, compression, disconnect handling, warm-up and profiling middleware.
+
+    health returns the service's own entries of the / health body.
+    """
+    mcp_app = mcp.http_app(path="/mcp")
+    app = AdmissionMiddleware(CancelOnDisconnectMiddleware(mcp_app))
+    if PROFILING_ENABLED:
+        app = ProfilingMiddleware(app, mcp_app)
+    return LifespanMiddleware(TraceMiddleware(CompressionMiddleware(BasicAuthMiddleware(app, warmup, health))), warmup)
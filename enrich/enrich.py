@@ -0,0 +1,426 @@
+"""
+Bulk enrichment of a CSV prospect file
+
+Streams the input CSV and runs the MCP tool functions in-process (imported from
+each <service>/server.py, no server to start): annuaire_recherche, serp_pappers,
+rdap_whois and siret_extractor, each stage under its own concurrency limit.
+Every finished row is appended to the output (CSV or NDJSON) and its index to a
+journal next to it, so an interrupted run resumes where it stopped when started
+again with the same arguments. At most --window rows are in flight, so memory
+does not grow with the file size.
+
+Usage:
+    python enrich/enrich.py prospects.csv -o enriched.csv
+    python enrich/enrich.py prospects.csv -o enriched.ndjson --stages annuaire rdap
+    python enrich/enrich.py prospects.csv -o enriched.csv --concurrency pappers=10 rdap=20
+    python enrich/enrich.py prospects.csv -o enriched.csv --name-column raison_sociale --url-column site
+    python enrich/enrich.py prospects.csv -o enriched.csv --restart   # ignore the journal
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import asyncio
+import argparse
+import collections
+import importlib.util
+
+import msgspec
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Input columns looked up (case-insensitive) when not given on the command line
+NAME_COLUMNS = ("nom", "raison_sociale", "nom_entreprise", "entreprise", "societe", "company", "company_name", "name")
+SIREN_COLUMNS = ("siren", "siret")
+URL_COLUMNS = ("site", "site_web", "website", "url", "domaine", "domain")
+
+PROGRESS_WINDOW = 30  # seconds of history behind the displayed rate
+
+
+def load_server(service: str):
+    """Import <service>/server.py as a standalone module."""
+    spec = importlib.util.spec_from_file_location(f"{service}_server", os.path.join(ROOT, service, "server.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def tool_function(module, name: str):
+    # FastMCP 2.x decorators return a FunctionTool wrapping the function
+    tool = getattr(module, name)
+    return getattr(tool, "fn", tool)
+
+
+def first(result: dict, key: str) -> dict:
+    return (result.get(key) or [None])[0] or {}
+
+
+class Stage(msgspec.Struct):
+    """One tool call per row: arguments from the row, flattened fields for CSV output."""
+    service: str
+    tool: str
+    fields: tuple
+    concurrency: int
+    arguments: object
+    extract: object
+
+
+def annuaire_arguments(row: dict, columns: dict, server) -> dict:
+    query = row.get(columns["siren"]) or row.get(columns["name"])
+    return {"query": query.strip(), "per_page": 1} if query and query.strip() else None
+
+
+def annuaire_extract(result: dict) -> dict:
+    r = first(result, "results")
+    return {
+        "siren": r.get("siren"),
+        "siret": r.get("siret"),
+        "nom": r.get("nom_complet"),
+        "code_postal": r.get("code_postal"),
+        "commune": r.get("libelle_commune"),
+        "activite": r.get("activite_principale"),
+        "effectif": r.get("tranche_effectif_salarie")
+    }
+
+
+def pappers_arguments(row: dict, columns: dict, server) -> dict:
+    name = row.get(columns["name"])
+    return {"company_name": name.strip()} if name and name.strip() else None
+
+
+def pappers_extract(result: dict) -> dict:
+    r = first(result, "pappers_results")
+    return {"siren": r.get("siren_extrait"), "nom_legal": r.get("nom_legal_extrait"), "url": r.get("url")}
+
+
+def rdap_arguments(row: dict, columns: dict, server) -> dict:
+    domain = server.normalize_domain(row.get(columns["url"]) or "")
+    return {"domain": domain, "include_raw": False} if domain else None
+
+
+def rdap_extract(result: dict) -> dict:
+    return {
+        "registrant": result.get("registrant_organization") or result.get("registrant_name"),
+        "email": result.get("registrant_email"),
+        "registrar": result.get("registrar"),
+        "creation": result.get("creation_date"),
+        "expiration": result.get("expiration_date")
+    }
+
+
+def siret_arguments(row: dict, columns: dict, server) -> dict:
+    url = (row.get(columns["url"]) or "").strip()
+    if not url:
+        return None
+    return {"url": url if "://" in url else f"https://{url}", "include_raw": False}
+
+
+def siret_extract(result: dict) -> dict:
+    return {"siret": result.get("siret"), "siren": result.get("siren"), "tva": result.get("tva"), "page": result.get("source_page")}
+
+
+STAGES = {
+    "annuaire": Stage("annuaire", "annuaire_recherche", ("siren", "siret", "nom", "code_postal", "commune", "activite", "effectif"),
+                      4, annuaire_arguments, annuaire_extract),
+    "pappers": Stage("serp", "serp_pappers", ("siren", "nom_legal", "url"), 8, pappers_arguments, pappers_extract),
+    "rdap": Stage("rdap", "rdap_whois", ("registrant", "email", "registrar", "creation", "expiration"), 8, rdap_arguments, rdap_extract),
+    "siret": Stage("siret-extractor", "siret_extractor", ("siret", "siren", "tva", "page"), 8, siret_arguments, siret_extract)
+}
+
+
+def truncate_partial_line(path: str):
+    """Drop a line half-written when the previous run was killed."""
+    if not os.path.exists(path):
+        return
+    with open(path, "rb+") as f:
+        size = f.seek(0, os.SEEK_END)
+        position = size
+        while position > 0:
+            step = min(65536, position)
+            f.seek(position - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position < size:
+            f.truncate(position)
+
+
+class Journal:
+    """Append-only log of finished row indexes.
+
+    Only the indexes past the contiguous finished prefix are kept in memory:
+    rows finish at most --window apart, so that set stays bounded.
+    """
+
+    def __init__(self, path: str, header: dict, restart: bool):
+        self.watermark = 0
+        self.ahead = set()
+        if restart and os.path.exists(path):
+            os.remove(path)
+        truncate_partial_line(path)
+
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path) as f:
+                previous = json.loads(f.readline())
+                if previous != header:
+                    raise SystemExit(f"{path} was written by another run ({previous}); use --restart to start over")
+                for line in f:
+                    self._add(int(line))
+            self.file = open(path, "a")
+        else:
+            self.file = open(path, "w")
+            self.file.write(json.dumps(header) + "\n")
+            self.file.flush()
+
+    def _add(self, index: int):
+        self.ahead.add(index)
+        while self.watermark in self.ahead:
+            self.ahead.remove(self.watermark)
+            self.watermark += 1
+
+    @property
+    def count(self) -> int:
+        return self.watermark + len(self.ahead)
+
+    def done(self, index: int) -> bool:
+        return index < self.watermark or index in self.ahead
+
+    def record(self, index: int):
+        self.file.write(f"{index}\n")
+        self.file.flush()
+        self._add(index)
+
+
+class CsvOutput:
+    """Input columns, _row, then <stage>_<field> and <stage>_error per stage."""
+
+    def __init__(self, path: str, input_columns: list, stages: dict):
+        self.stages = stages
+        columns = list(input_columns) + ["_row"]
+        for name, stage in stages.items():
+            columns += [f"{name}_{field}" for field in stage.fields] + [f"{name}_error"]
+        self.file = open(path, "a", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, columns, extrasaction="ignore")
+        if self.file.tell() == 0:
+            self.writer.writeheader()
+
+    def write(self, index: int, row: dict, results: dict):
+        record = {**row, "_row": index}
+        for name, result in results.items():
+            if result is None:
+                continue
+            if "error" in result:
+                record[f"{name}_error"] = result["error"]
+            else:
+                record.update((f"{name}_{field}", value) for field, value in self.stages[name].extract(result).items())
+        self.writer.writerow(record)
+        self.file.flush()
+
+
+class NdjsonOutput:
+    """One JSON object per row: _row, the input row and the full result of each stage."""
+
+    def __init__(self, path: str, input_columns: list, stages: dict):
+        self.file = open(path, "ab")
+
+    def write(self, index: int, row: dict, results: dict):
+        self.file.write(msgspec.json.encode({"_row": index, "input": row, **results}) + b"\n")
+        self.file.flush()
+
+
+class Progress:
+    """Per-stage counters and the live throughput/ETA line on stderr."""
+
+    def __init__(self, stages: dict, total: int, resumed: int):
+        self.total = total
+        self.resumed = resumed
+        self.done = 0
+        self.started = time.monotonic()
+        self.samples = collections.deque([(self.started, 0)], maxlen=PROGRESS_WINDOW * 10)
+        self.stats = {name: collections.Counter() for name in stages}
+
+    def count(self, stage: str, outcome: str):
+        self.stats[stage][outcome] += 1
+
+    def line(self) -> str:
+        now = time.monotonic()
+        self.samples.append((now, self.done))
+        while len(self.samples) > 2 and now - self.samples[0][0] > PROGRESS_WINDOW:
+            self.samples.popleft()
+        since, done_then = self.samples[0]
+        rate = (self.done - done_then) / (now - since) if now > since else 0.0
+
+        finished = self.resumed + self.done
+        text = f"{finished}" + (f"/{self.total}" if self.total is not None else "") + f" rows  {rate:.1f} rows/s"
+        if self.total is not None and rate > 0:
+            text += f"  ETA {format_duration((self.total - finished) / rate)}"
+        for name, counter in self.stats.items():
+            text += f"  | {name} {counter['ok']} ok {counter['error']} err {counter['running']} run"
+            if counter["skipped"]:
+                text += f" {counter['skipped']} skip"
+        return text
+
+    def summary(self) -> str:
+        elapsed = time.monotonic() - self.started
+        return f"{self.done} rows in {format_duration(elapsed)} ({self.done / elapsed if elapsed else 0:.1f} rows/s), {self.resumed} resumed"
+
+
+def format_duration(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600}h{seconds // 60 % 60:02d}m{seconds % 60:02d}s" if seconds >= 3600 else f"{seconds // 60}m{seconds % 60:02d}s"
+
+
+async def report(progress: Progress, interval: float):
+    tty = sys.stderr.isatty()
+    while True:
+        await asyncio.sleep(interval)
+        line = progress.line()
+        sys.stderr.write(f"\r\033[K{line}" if tty else f"{line}\n")
+        sys.stderr.flush()
+
+
+def detect_column(columns: list, given: str, candidates: tuple):
+    if given:
+        if given not in columns:
+            raise SystemExit(f"Column {given!r} not in input ({', '.join(columns)})")
+        return given
+    lowered = {c.strip().lower(): c for c in columns}
+    return next((lowered[c] for c in candidates if c in lowered), None)
+
+
+def count_rows(path: str, encoding: str, delimiter: str) -> int:
+    with open(path, newline="", encoding=encoding) as f:
+        return sum(1 for _ in csv.reader(f, delimiter=delimiter)) - 1
+
+
+async def enrich(args, stages: dict, servers: dict, columns: dict, reader, output, journal: Journal, progress: Progress):
+    tools = {name: tool_function(servers[stage.service], stage.tool) for name, stage in stages.items()}
+    limits = {name: asyncio.Semaphore(stage.concurrency) for name, stage in stages.items()}
+
+    async def call(name: str, row: dict):
+        stage = stages[name]
+        arguments = stage.arguments(row, columns, servers[stage.service])
+        if arguments is None:
+            progress.count(name, "skipped")
+            return None
+        async with limits[name]:
+            progress.count(name, "running")
+            try:
+                result = await asyncio.wait_for(tools[name](**arguments), args.timeout)
+            except asyncio.TimeoutError:
+                result = {"error": f"Timeout after {args.timeout:g}s"}
+            except Exception as e:
+                result = {"error": f"{type(e).__name__}: {e}"}
+            finally:
+                progress.stats[name]["running"] -= 1
+        progress.count(name, "error" if "error" in result else "ok")
+        return result
+
+    async def process(index: int, row: dict):
+        results = await asyncio.gather(*(call(name, row) for name in stages))
+        # Output first: a crash in between replays the row rather than losing it
+        output.write(index, row, dict(zip(stages, results)))
+        journal.record(index)
+        progress.done += 1
+
+    pending = set()
+    for index, row in enumerate(reader):
+        if journal.done(index):
+            continue
+        if len(pending) >= args.window:
+            finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in finished:
+                task.result()
+        pending.add(asyncio.ensure_future(process(index, row)))
+    if pending:
+        for task in (await asyncio.wait(pending))[0]:
+            task.result()
+
+
+async def main_async(args):
+    stages = {}
+    for name in args.stages:
+        stage = STAGES[name]
+        stages[name] = msgspec.structs.replace(stage, concurrency=args.concurrency.get(name, stage.concurrency))
+    servers = {stage.service: None for stage in stages.values()}
+    for service in servers:
+        servers[service] = load_server(service)
+
+    with open(args.input, newline="", encoding=args.encoding) as f:
+        reader = csv.DictReader(f, delimiter=args.delimiter)
+        input_columns = reader.fieldnames or []
+        columns = {
+            "name": detect_column(input_columns, args.name_column, NAME_COLUMNS),
+            "siren": detect_column(input_columns, args.siren_column, SIREN_COLUMNS),
+            "url": detect_column(input_columns, args.url_column, URL_COLUMNS)
+        }
+        print(f"Columns: name={columns['name']} siren={columns['siren']} url={columns['url']}", file=sys.stderr)
+
+        header = {"input": os.path.abspath(args.input), "stages": list(stages)}
+        journal = Journal(args.output + ".journal", header, args.restart)
+        if args.restart and os.path.exists(args.output):
+            os.remove(args.output)
+        truncate_partial_line(args.output)
+        ndjson = args.output.endswith((".ndjson", ".jsonl")) if args.format is None else args.format == "ndjson"
+        output = (NdjsonOutput if ndjson else CsvOutput)(args.output, input_columns, stages)
+
+        total = None if args.no_count else count_rows(args.input, args.encoding, args.delimiter)
+        progress = Progress(stages, total, journal.count)
+        reporter = asyncio.ensure_future(report(progress, args.progress_interval))
+        try:
+            await enrich(args, stages, servers, columns, reader, output, journal, progress)
+        finally:
+            reporter.cancel()
+            print(("\n" if sys.stderr.isatty() else "") + progress.summary(), file=sys.stderr)
+
+
+def parse_concurrency(values: list) -> dict:
+    limits = {}
+    for value in values:
+        name, _, limit = value.partition("=")
+        if name not in STAGES or not limit.isdigit() or int(limit) < 1:
+            raise argparse.ArgumentTypeError(f"expected stage=N with stage in {', '.join(STAGES)}, got {value!r}")
+        limits[name] = int(limit)
+    return limits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enrich a CSV prospect file with the MCP tools, resumably")
+    parser.add_argument("input", help="CSV file, one prospect per row with a header line")
+    parser.add_argument("-o", "--output", required=True, help="output file, .csv or .ndjson/.jsonl")
+    parser.add_argument("--format", choices=["csv", "ndjson"], help="output format (default: from the extension)")
+    parser.add_argument("--stages", nargs="+", choices=list(STAGES), default=list(STAGES), help="tools to run on each row")
+    parser.add_argument("--concurrency", nargs="+", default=[], metavar="STAGE=N",
+                        help="concurrent calls per stage (default: annuaire=4, others 8)")
+    parser.add_argument("--window", type=int, help="rows in flight (default: twice the highest concurrency)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="seconds per tool call")
+    parser.add_argument("--name-column", help="company name column (default: detected)")
+    parser.add_argument("--siren-column", help="SIREN/SIRET column, preferred over the name for annuaire (default: detected)")
+    parser.add_argument("--url-column", help="website or domain column for rdap and siret (default: detected)")
+    parser.add_argument("--delimiter", default=",", help="input CSV delimiter")
+    parser.add_argument("--encoding", default="utf-8-sig", help="input file encoding")
+    parser.add_argument("--restart", action="store_true", help="discard the journal and output of a previous run")
+    parser.add_argument("--no-count", action="store_true", help="skip counting input rows (no ETA)")
+    parser.add_argument("--progress-interval", type=float, default=1.0, help="seconds between progress lines")
+    args = parser.parse_args()
+    try:
+        args.concurrency = parse_concurrency(args.concurrency)
+    except argparse.ArgumentTypeError as e:
+        parser.error(str(e))
+    if args.window is None:
+        args.window = 2 * max(args.concurrency.get(name, STAGES[name].concurrency) for name in args.stages)
+
+    try:
+        asyncio.run(main_async(args))
+    except KeyboardInterrupt:
+        print("Interrupted: run the same command again to resume", file=sys.stderr)
+        sys.exit(130)
+
+
+if __name__ == "__main__":
+    main()
@@ -5,16 +5,25 @@ With Basic Auth protection
 """
 
 import os
-import base64
-import httpx
+import sys
+import msgspec
+from typing import Any
 from fastmcp import FastMCP
 
-# Auth credentials from env or defaults
-AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "ackizit")
-AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "!Lam3ute!75")
+# Shared runtime (common/runtime.py), copied next to this file in the image
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from runtime import (  # noqa: E402
+    create_authenticated_app, deadline_remaining, decode_upstream, http_client, job_runner, register_job_tools, setup,
+    Warmup
+)
 
 # Create MCP server
 mcp = FastMCP("LinkedIn Scraper")
+setup(mcp, "mcp-linkedin")
+
+# Scraper APIs (overridable for local mocks and benchmarks)
+LINKEDIN_PROFILE_API_URL = os.environ.get("LINKEDIN_PROFILE_API_URL", "https://scrap-lk-profile.lasupermachine.fr")
+LINKEDIN_COMPANY_API_URL = os.environ.get("LINKEDIN_COMPANY_API_URL", "https://scrap-lk-company.lasupermachine.fr")
 
 # Internal API auth
 BASIC_AUTH = "YWNraXppdDohTGFtM3V0ZSE3NQ=="
@@ -24,141 +33,166 @@ HEADERS = {
 }
 
 
-class BasicAuthMiddleware:
-    """ASGI middleware for Basic Auth."""
+warmup = Warmup([LINKEDIN_PROFILE_API_URL, LINKEDIN_COMPANY_API_URL])
+
+
+class Profile(msgspec.Struct):
+    name: str | None = None
+    company: str | None = None
+    company_url: str | None = None
+    location: str | None = None
+    headline: str | None = None
 
-    def __init__(self, app):
-        self.app = app
 
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
-            await self.app(scope, receive, send)
-            return
+class ProfileResponse(msgspec.Struct):
+    profile: Profile = msgspec.field(default_factory=Profile)
 
-        # Allow healthcheck on root path without auth
-        path = scope.get("path", "")
-        if path == "/" or path == "":
-            await self._send_health(send)
-            return
 
-        headers = dict(scope.get("headers", []))
-        auth_header = headers.get(b"authorization", b"").decode("utf-8")
+class Company(msgspec.Struct):
+    company_name: str | None = None
+    website: str | None = None
+    postal_code: str | int | None = None
+    headquarters: Any = None
+    industry: str | None = None
+    company_size: str | None = None
+    locations_secondary: list[Any] | None = None
 
-        if not auth_header.startswith("Basic "):
-            await self._send_401(send)
-            return
+
+profile_decoder = msgspec.json.Decoder(ProfileResponse)
+company_decoder = msgspec.json.Decoder(Company)
+
+
+# Plain coroutines behind the tools, also run by the job workers (under fastmcp
+# 2.x a decorated tool is a FunctionTool, not a callable)
+async def scrape_profile(url: str, include_raw: bool = True) -> dict:
+    """Scraped fields of a LinkedIn profile; HTTP and decoding errors are returned as an error dict."""
+    async with http_client(timeout=30.0) as client:
+        api_url = f"{LINKEDIN_PROFILE_API_URL}/api/extract?url={url}&method=combined"
+        response = await client.get(api_url, headers=HEADERS)
+
+        if response.status_code != 200:
+            return {"error": f"HTTP {response.status_code}", "details": response.text}
 
         try:
-            encoded = auth_header[6:]
-            decoded = base64.b64decode(encoded).decode("utf-8")
-            username, password = decoded.split(":", 1)
-
-            if username != AUTH_USERNAME or password != AUTH_PASSWORD:
-                await self._send_401(send)
-                return
-        except Exception:
-            await self._send_401(send)
-            return
-
-        await self.app(scope, receive, send)
-
-    async def _send_401(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 401,
-            "headers": [
-                [b"content-type", b"application/json"],
-                [b"www-authenticate", b'Basic realm="MCP Server"']
-            ]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"error": "Unauthorized"}'
-        })
-
-    async def _send_health(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 200,
-            "headers": [[b"content-type", b"application/json"]]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"status": "ok"}'
-        })
+            decoded, raw = decode_upstream(profile_decoder, response.content, include_raw)
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            return {"error": "Réponse invalide du scraper", "details": str(e)}
+
+        profile = decoded.profile
+        result = {
+            "name": profile.name,
+            "company": profile.company,
+            "company_url": profile.company_url,
+            "location": profile.location,
+            "headline": profile.headline
+        }
+        if include_raw:
+            result["raw"] = raw.get("profile", {})
+        return result
 
 
 @mcp.tool
-async def linkedin_profile(url: str) -> dict:
+async def linkedin_profile(url: str, include_raw: bool = True) -> dict:
     """
     Extrait les informations d'un profil LinkedIn.
 
     Args:
         url: URL du profil LinkedIn (ex: linkedin.com/in/john-doe)
+        include_raw: Inclure la réponse brute du scraper (défaut: True)
 
     Returns:
         Infos du profil: nom, company, company_url, location, etc.
     """
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        api_url = f"https://scrap-lk-profile.lasupermachine.fr/api/extract?url={url}&method=combined"
-        response = await client.get(api_url, headers=HEADERS)
+    return await scrape_profile(url, include_raw)
+
+
+async def scrape_company(url: str, timeout: int = 25, include_raw: bool = True) -> dict:
+    """Scraped fields of a LinkedIn company page; HTTP and decoding errors are returned as an error dict."""
+    remaining = deadline_remaining()
+    if remaining is not None:
+        # Leave the scraper room to answer within the caller's deadline
+        timeout = max(1, min(timeout, int(remaining) - 5))
+
+    # A POST launching a scrape, not known to be side-effect free: left unretried
+    async with http_client(timeout=float(timeout) + 5) as client:
+        api_url = f"{LINKEDIN_COMPANY_API_URL}/api/scrape"
+        payload = {"url": url, "timeout": timeout}
+
+        response = await client.post(api_url, json=payload, headers=HEADERS)
 
         if response.status_code != 200:
             return {"error": f"HTTP {response.status_code}", "details": response.text}
 
-        data = response.json()
-        profile = data.get("profile", {})
-
-        return {
-            "name": profile.get("name"),
-            "company": profile.get("company"),
-            "company_url": profile.get("company_url"),
-            "location": profile.get("location"),
-            "headline": profile.get("headline"),
-            "raw": profile
+        try:
+            company, raw = decode_upstream(company_decoder, response.content, include_raw)
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            return {"error": "Réponse invalide du scraper", "details": str(e)}
+
+        result = {
+            "company_name": company.company_name,
+            "website": company.website,
+            "postal_code": company.postal_code,
+            "headquarters": company.headquarters,
+            "industry": company.industry,
+            "company_size": company.company_size,
+            "locations_secondary": company.locations_secondary or []
         }
+        if include_raw:
+            result["raw"] = raw
+        return result
 
 
 @mcp.tool
-async def linkedin_company(url: str, timeout: int = 25) -> dict:
+async def linkedin_company(url: str, timeout: int = 25, include_raw: bool = True) -> dict:
     """
     Extrait les informations d'une page company LinkedIn.
 
     Args:
         url: URL de la page company LinkedIn
-        timeout: Timeout en secondes (défaut: 25)
+        timeout: Timeout en secondes (défaut: 25), réduit si l'appelant a fixé une deadline
+        include_raw: Inclure la réponse brute du scraper (défaut: True)
 
     Returns:
         Infos de l'entreprise: nom, website, adresse, code postal, etc.
     """
-    async with httpx.AsyncClient(timeout=float(timeout) + 5) as client:
-        api_url = "https://scrap-lk-company.lasupermachine.fr/api/scrape"
-        payload = {"url": url, "timeout": timeout}
+    return await scrape_company(url, timeout, include_raw)
 
-        response = await client.post(api_url, json=payload, headers=HEADERS)
 
-        if response.status_code != 200:
-            return {"error": f"HTTP {response.status_code}", "details": response.text}
+@mcp.tool
+async def submit_linkedin_profile(url: str) -> dict:
+    """
+    Met en file l'extraction d'un profil LinkedIn et rend la main immédiatement.
 
-        data = response.json()
-
-        return {
-            "company_name": data.get("company_name"),
-            "website": data.get("website"),
-            "postal_code": data.get("postal_code"),
-            "headquarters": data.get("headquarters"),
-            "industry": data.get("industry"),
-            "company_size": data.get("company_size"),
-            "locations_secondary": data.get("locations_secondary", []),
-            "raw": data
-        }
+    Args:
+        url: URL du profil LinkedIn (ex: linkedin.com/in/john-doe)
+
+    Returns:
+        job_id à passer à get_job ou wait_job
+    """
+    return job_runner.submit("linkedin_profile", scrape_profile, url=url).to_dict()
+
+
+@mcp.tool
+async def submit_linkedin_company(url: str, timeout: int = 25) -> dict:
+    """
+    Met en file le scraping d'une page company LinkedIn et rend la main immédiatement.
+
+    Args:
+        url: URL de la page company LinkedIn
+        timeout: Timeout du scraper en secondes (défaut: 25)
+
+    Returns:
+        job_id à passer à get_job ou wait_job
+    """
+    return job_runner.submit("linkedin_company", scrape_company, url=url, timeout=timeout).to_dict()
+
+
+register_job_tools(mcp)
 
 
-def create_authenticated_app():
-    """Wrap FastMCP app with Basic Auth middleware."""
-    mcp_app = mcp.http_app(path="/mcp")
-    return BasicAuthMiddleware(mcp_app)
+def health() -> dict:
+    """Service entries of the / health body."""
+    return {"jobs": job_runner.snapshot()}
 
 
-# For uvicorn: uvicorn server:app --host 0.0.0.0 --port 8080
-app = create_authenticated_app()
+app = create_authenticated_app(mcp, warmup, health)
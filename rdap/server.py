@@ -5,86 +5,69 @@ With Basic Auth protection
 """
 
 import os
-import base64
+import sys
+import time
+import asyncio
+import collections
 import httpx
-from fastmcp import FastMCP
+import msgspec
+import re
+from typing import Any
+from fastmcp import FastMCP, Context
 
-AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "ackizit")
-AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "!Lam3ute!75")
+# Shared runtime (common/runtime.py), copied next to this file in the image
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from runtime import (  # noqa: E402
+    backoff, create_authenticated_app, decode_upstream, http_client, setup, Warmup, RETRY_ATTEMPTS, RETRY_STATUSES
+)
 
 mcp = FastMCP("RDAP WHOIS")
+setup(mcp, "mcp-rdap")
+
+# Internal RDAP API (overridable for local mocks and benchmarks)
+RDAP_API_URL = os.environ.get("RDAP_API_URL", "https://rdap.lasupermachine.fr")
 
 # Internal API auth
 INTERNAL_AUTH = "YWNraXppdDohTGFtM3V0ZSE3NQ=="
 INTERNAL_HEADERS = {"Authorization": f"Basic {INTERNAL_AUTH}"}
 
 
-class BasicAuthMiddleware:
-    """ASGI middleware for Basic Auth."""
+warmup = Warmup([RDAP_API_URL])
 
-    def __init__(self, app):
-        self.app = app
 
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
-            await self.app(scope, receive, send)
-            return
+class Whois(msgspec.Struct):
+    registrant_organization: str | None = None
+    registrant_name: str | None = None
+    registrant_address: Any = None
+    registrant_email: str | None = None
+    registrar: str | None = None
+    creation_date: str | None = None
+    expiration_date: str | None = None
 
-        # Allow healthcheck on root path without auth
-        path = scope.get("path", "")
-        if path == "/" or path == "":
-            await self._send_health(send)
-            return
 
-        headers = dict(scope.get("headers", []))
-        auth_header = headers.get(b"authorization", b"").decode("utf-8")
+whois_decoder = msgspec.json.Decoder(Whois)
 
-        if not auth_header.startswith("Basic "):
-            await self._send_401(send)
-            return
 
-        try:
-            encoded = auth_header[6:]
-            decoded = base64.b64decode(encoded).decode("utf-8")
-            username, password = decoded.split(":", 1)
-
-            if username != AUTH_USERNAME or password != AUTH_PASSWORD:
-                await self._send_401(send)
-                return
-        except Exception:
-            await self._send_401(send)
-            return
-
-        await self.app(scope, receive, send)
-
-    async def _send_401(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 401,
-            "headers": [
-                [b"content-type", b"application/json"],
-                [b"www-authenticate", b'Basic realm="MCP Server"']
-            ]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"error": "Unauthorized"}'
-        })
-
-    async def _send_health(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 200,
-            "headers": [[b"content-type", b"application/json"]]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"status": "ok"}'
-        })
+async def whois_lookup(client: httpx.AsyncClient, domain: str, include_raw: bool) -> dict:
+    """RDAP data of one domain."""
+    response = await client.get(f"{RDAP_API_URL}/api/whois", params={"domain": domain}, headers=INTERNAL_HEADERS)
+    return whois_result(response, include_raw)
+
+
+def whois_result(response: httpx.Response, include_raw: bool) -> dict:
+    """RDAP data of an /api/whois response; HTTP errors are returned as an error dict."""
+    if response.status_code != 200:
+        return {"error": f"HTTP {response.status_code}", "details": response.text, "status": response.status_code}
+
+    whois, raw = decode_upstream(whois_decoder, response.content, include_raw)
+    result = msgspec.structs.asdict(whois)
+    if include_raw:
+        result["raw"] = raw
+    return result
 
 
 @mcp.tool
-async def rdap_whois(domain: str) -> dict:
+async def rdap_whois(domain: str, include_raw: bool = True) -> dict:
     """
     Interroge les données RDAP/WHOIS d'un domaine.
 
@@ -93,36 +76,210 @@ async def rdap_whois(domain: str) -> dict:
 
     Args:
         domain: Nom de domaine à interroger (ex: example.fr)
+        include_raw: Inclure la réponse RDAP brute (défaut: False)
 
     Returns:
         Infos registrant: organisation, adresse, email
     """
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        api_url = f"https://rdap.lasupermachine.fr/api/whois?domain={domain}"
+    async with http_client(timeout=15.0) as client:
+        try:
+            result = await whois_lookup(client, domain, include_raw)
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            return {"error": "Réponse RDAP invalide", "details": str(e)}
+    result.pop("status", None)
+    return result
+
+
+# Batch lookups: domains are grouped by registry, each running under its own
+# concurrency and request-rate limit (shared by every batch in the process) and its
+# own circuit breaker, so a strict or failing registry never slows down the others.
+# Retries happen here rather than in the client, so each attempt waits for the
+# limiter and a 429 holds the whole registry at once; 5xx and dropped connections
+# are retried after a jittered backoff. RDAP_REGISTRY_LIMITS overrides the limits
+# as JSON, e.g. '{"afnic": [2, 1.0]}' (concurrency, requests per second).
+RDAP_BATCH_MAX_DOMAINS = 5000
+RDAP_BATCH_TIMEOUT = 15.0
+RDAP_REGISTRIES = {
+    "fr": "afnic", "re": "afnic", "pm": "afnic", "yt": "afnic", "tf": "afnic", "wf": "afnic",
+    "com": "verisign", "net": "verisign", "cc": "verisign", "name": "verisign"
+}
+RDAP_REGISTRY_LIMITS = {
+    "afnic": (4, 4.0),
+    "verisign": (20, 20.0),
+    "default": (4, 2.0),
+    **msgspec.json.decode(os.environ.get("RDAP_REGISTRY_LIMITS", "{}"), type=dict[str, tuple[int, float]])
+}
+# Lookups are reads: a connection lost mid-request is as safe to retry as a refused one
+RDAP_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.ReadError, httpx.RemoteProtocolError)
+_DOMAIN_RE = re.compile(r"^(?=.{1,253}$)(?:[a-z0-9](?:[a-z0-9-]{0,61}[a-z0-9])?\.)+[a-z0-9-]{2,63}$")
+
+
+def normalize_domain(value: str):
+    """Registrable-looking domain of a user input (URL, www., case, IDN), or None if invalid."""
+    domain = value.strip().lower()
+    if "://" in domain:
+        domain = domain.split("://", 1)[1]
+    domain = domain.split("/", 1)[0].split("?", 1)[0].split("@")[-1].split(":", 1)[0].rstrip(".")
+    if domain.startswith("www."):
+        domain = domain[4:]
+    try:
+        domain = domain.encode("idna").decode("ascii")
+    except UnicodeError:
+        return None
+    return domain if _DOMAIN_RE.match(domain) else None
+
+
+def registry_of(domain: str) -> str:
+    tld = domain.rsplit(".", 1)[-1]
+    return RDAP_REGISTRIES.get(tld, tld)
+
+
+class RegistryLimiter:
+    """Concurrency cap plus evenly spaced request starts for one registry."""
+
+    def __init__(self, concurrency: int, rate: float):
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.interval = 1 / rate if rate > 0 else 0.0
+        self.next_start = 0.0
+        self.requests = 0
+        self.throttled = 0
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        try:
+            now = time.monotonic()
+            start = max(now, self.next_start)
+            self.next_start = start + self.interval
+            if start > now:
+                await asyncio.sleep(start - now)
+        except BaseException:
+            self.semaphore.release()
+            raise
+        self.requests += 1
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+    def backoff(self, response: httpx.Response):
+        """Hold every next request of the registry after a 429 (Retry-After seconds, else 1s)."""
+        retry_after = response.headers.get("retry-after", "")
+        self.throttled += 1
+        self.next_start = max(self.next_start, time.monotonic() + (float(retry_after) if retry_after.isdigit() else 1.0))
+
+    def snapshot(self) -> dict:
+        return {"requests": self.requests, "throttled_429": self.throttled}
+
+
+registry_limiters = {}
+
+
+def limiter_for(registry: str) -> RegistryLimiter:
+    limiter = registry_limiters.get(registry)
+    if limiter is None:
+        concurrency, rate = RDAP_REGISTRY_LIMITS.get(registry, RDAP_REGISTRY_LIMITS["default"])
+        limiter = registry_limiters[registry] = RegistryLimiter(concurrency, rate)
+    return limiter
+
+
+@mcp.tool
+async def rdap_whois_batch(domains: list[str], ctx: Context, include_raw: bool = False) -> dict:
+    """
+    Interroge les données RDAP/WHOIS de plusieurs domaines en parallèle.
+
+    Les domaines sont normalisés (URL, www., casse, IDN) et dédoublonnés, puis
+    groupés par registre (AFNIC pour .fr, Verisign pour .com/.net...) : chaque
+    registre a sa propre limite de concurrence et de débit. Chaque résultat est
+    envoyé dès qu'il arrive via une notification de progression (message JSON:
+    domain, registry, données ou error).
 
-        response = await client.get(api_url, headers=INTERNAL_HEADERS)
+    Args:
+        domains: Noms de domaine ou URLs (5000 max)
+        include_raw: Inclure la réponse RDAP brute (défaut: False)
 
-        if response.status_code != 200:
-            return {"error": f"HTTP {response.status_code}", "details": response.text}
+    Returns:
+        Résumé (uniques, doublons, invalides, succès, échecs, par registre, durée)
+        et un résultat par domaine unique, dans l'ordre d'entrée
+    """
+    if len(domains) > RDAP_BATCH_MAX_DOMAINS:
+        return {"error": f"Trop de domaines ({len(domains)}), maximum {RDAP_BATCH_MAX_DOMAINS}"}
 
-        data = response.json()
+    started = time.monotonic()
+    unique = {}
+    invalid = []
+    for value in domains:
+        domain = normalize_domain(value)
+        if domain is None:
+            invalid.append({"input": value, "error": "Domaine invalide"})
+        else:
+            unique.setdefault(domain, registry_of(domain))
+
+    async def lookup(index: int, domain: str, registry: str) -> tuple:
+        result = {"domain": domain, "registry": registry}
+        limiter = limiter_for(registry)
+        try:
+            for attempt in range(RETRY_ATTEMPTS):
+                last = attempt == RETRY_ATTEMPTS - 1
+                try:
+                    async with limiter:
+                        response = await client.get(
+                            f"{RDAP_API_URL}/api/whois",
+                            params={"domain": domain},
+                            headers=INTERNAL_HEADERS,
+                            extensions={"breaker": f"rdap:{registry}"}
+                        )
+                except RDAP_RETRY_ERRORS:
+                    if last:
+                        raise
+                    delay = backoff(attempt)
+                else:
+                    if response.status_code not in RETRY_STATUSES or last:
+                        break
+                    if response.status_code == 429:
+                        # The limiter now holds the whole registry: the retry waits there
+                        limiter.backoff(response)
+                        continue
+                    delay = backoff(attempt, response)
+                await asyncio.sleep(delay)
+            data = whois_result(response, include_raw)
+            data.pop("status", None)
+            result.update(data)
+        except (httpx.HTTPError, msgspec.DecodeError, msgspec.ValidationError) as e:
+            result["error"] = str(e) or type(e).__name__
+        return index, result
+
+    results = [None] * len(unique)
+    async with http_client(timeout=RDAP_BATCH_TIMEOUT, idempotent=False) as client:
+        tasks = [asyncio.ensure_future(lookup(i, d, r)) for i, (d, r) in enumerate(unique.items())]
+        try:
+            for done, next_result in enumerate(asyncio.as_completed(tasks), start=1):
+                index, result = await next_result
+                results[index] = result
+                await ctx.report_progress(
+                    progress=done,
+                    total=len(tasks),
+                    message=msgspec.json.encode({"index": index, **result}).decode()
+                )
+        finally:
+            for task in tasks:
+                task.cancel()
 
-        return {
-            "registrant_organization": data.get("registrant_organization"),
-            "registrant_name": data.get("registrant_name"),
-            "registrant_address": data.get("registrant_address"),
-            "registrant_email": data.get("registrant_email"),
-            "registrar": data.get("registrar"),
-            "creation_date": data.get("creation_date"),
-            "expiration_date": data.get("expiration_date"),
-            "raw": data
-        }
+    failed = sum(1 for r in results if "error" in r)
+    return {
+        "total": len(domains),
+        "unique": len(unique),
+        "duplicates": len(domains) - len(unique) - len(invalid),
+        "invalid": invalid,
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "registries": dict(collections.Counter(unique.values())),
+        "elapsed_s": round(time.monotonic() - started, 3),
+        "results": results
+    }
 
 
-def create_authenticated_app():
-    """Wrap FastMCP app with Basic Auth middleware."""
-    mcp_app = mcp.http_app(path="/mcp")
-    return BasicAuthMiddleware(mcp_app)
+def health() -> dict:
+    """Service entries of the / health body."""
+    return {"registries": {name: limiter.snapshot() for name, limiter in registry_limiters.items()}}
 
 
-app = create_authenticated_app()
+app = create_authenticated_app(mcp, warmup, health)
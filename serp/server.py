@@ -5,86 +5,248 @@ With Basic Auth protection
 """
 
 import os
-import base64
+import sys
+import time
+import asyncio
+import functools
+import sqlite3
+import threading
+import unicodedata
+import anyio
 import httpx
+import msgspec
+from typing import Any
 import re
-from fastmcp import FastMCP
+from fastmcp import FastMCP, Context
 
-AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "ackizit")
-AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "!Lam3ute!75")
+# Shared runtime (common/runtime.py), copied next to this file in the image
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from runtime import (  # noqa: E402
+    create_authenticated_app, Hedger, http_client, setup, Warmup, HEDGE_ENABLED
+)
 
 mcp = FastMCP("SERP Search")
+setup(mcp, "mcp-serp")
 
-SERP_API_KEY = "089e2741-9760-4b19-90d3-f4bedba01640"
-SERP_URL = "http://176.154.220.83/query"
+SERP_API_KEY = os.environ.get("SERP_API_KEY", "089e2741-9760-4b19-90d3-f4bedba01640")
+SERP_URL = os.environ.get("SERP_URL", "http://176.154.220.83/query")
+SERP_MANY_MAX_QUERIES = 100
+SERP_MANY_MAX_CONCURRENCY = 20
 SERP_HEADERS = {
     "Content-Type": "application/json",
     "X-API-KEY": SERP_API_KEY
 }
 
 
-class BasicAuthMiddleware:
-    """ASGI middleware for Basic Auth."""
+serp_hedger = Hedger("serp", os.environ.get("SERP_HEDGE_URL", "")) if HEDGE_ENABLED else None
+warmup = Warmup([SERP_URL, os.environ.get("SERP_HEDGE_URL", "")])
 
-    def __init__(self, app):
-        self.app = app
 
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
-            await self.app(scope, receive, send)
-            return
+class SerpResponse(msgspec.Struct):
+    # Results stay whole: callers get every upstream field (position, sitelinks...)
+    results: list[dict[str, Any]] = []
 
-        # Allow healthcheck on root path without auth
-        path = scope.get("path", "")
-        if path == "/" or path == "":
-            await self._send_health(send)
-            return
 
-        headers = dict(scope.get("headers", []))
-        auth_header = headers.get(b"authorization", b"").decode("utf-8")
+serp_decoder = msgspec.json.Decoder(SerpResponse)
+json_encoder = msgspec.json.Encoder()
 
-        if not auth_header.startswith("Basic "):
-            await self._send_401(send)
-            return
 
-        try:
-            encoded = auth_header[6:]
-            decoded = base64.b64decode(encoded).decode("utf-8")
-            username, password = decoded.split(":", 1)
+def decode_results(content: bytes) -> list:
+    """Decode a SERP body into its result list, skipping the rest of the payload."""
+    return serp_decoder.decode(content).results
+
+
+# Persistent cache: SERP answers are stored in SQLite (SERP_CACHE_PATH, empty disables
+# it) under the tool name and the normalized query, so a company searched again with
+# other casing, accents, spacing or legal form is not paid for twice. Entries expire
+# after their tool's TTL (SERP_CACHE_TTLS overrides it, in seconds, as JSON) and the
+# least recently used ones are evicted beyond SERP_CACHE_MAX_BYTES.
+SERP_CACHE_PATH = os.environ.get("SERP_CACHE_PATH", "serp_cache.sqlite3")
+SERP_CACHE_MAX_BYTES = int(os.environ.get("SERP_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+SERP_CACHE_TTLS = {
+    "serp_search": 86400,
+    "serp_pappers": 30 * 86400,
+    "serp_societe_com": 30 * 86400,
+    "serp_linkedin_company": 7 * 86400,
+    **msgspec.json.decode(os.environ.get("SERP_CACHE_TTLS", "{}"), type=dict[str, float])
+}
+LEGAL_FORMS = {
+    "sa", "sas", "sasu", "sarl", "eurl", "ei", "eirl", "sci", "snc", "scs", "sca",
+    "scop", "scm", "selarl", "selas", "selafa", "gie", "gaec", "earl"
+}
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase query without accents, whitespace collapsed."""
+    decomposed = unicodedata.normalize("NFKD", query)
+    return " ".join("".join(c for c in decomposed if not unicodedata.combining(c)).lower().split())
+
+
+def company_key(company_name: str) -> str:
+    """Cache key of a company name: normalized, punctuation and legal forms (S.A.S., SARL...) dropped."""
+    words = re.findall(r"[a-z0-9&]+", normalize_query(company_name).replace(".", ""))
+    core = list(words)
+    while core and core[-1] in LEGAL_FORMS:
+        core.pop()
+    while core and core[0] in LEGAL_FORMS:
+        core.pop(0)
+    return " ".join(core or words)
+
+
+class SerpCache:
+    """SQLite store of SERP results by tool and normalized query, with per-tool TTLs.
+
+    get() and put() run the blocking SQLite calls in a worker thread, one at a time;
+    entry and byte counts are kept in memory so the health check never queries it.
+    """
 
-            if username != AUTH_USERNAME or password != AUTH_PASSWORD:
-                await self._send_401(send)
-                return
-        except Exception:
-            await self._send_401(send)
+    def __init__(self, path: str, max_bytes: int):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.entries = 0
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "stores": 0, "evictions": 0}
+        self._db = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        # Opened on first use, so importing the module creates no file
+        if self._db is None:
+            self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode = WAL")
+            self._db.execute("PRAGMA synchronous = NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS serp_cache ("
+                "tool TEXT NOT NULL, key TEXT NOT NULL, results BLOB NOT NULL, size INTEGER NOT NULL, "
+                "stored_at REAL NOT NULL, used_at REAL NOT NULL, hits INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (tool, key))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS serp_cache_used_at ON serp_cache (used_at)")
+            totals = self._db.execute("SELECT count(*), coalesce(sum(size), 0) FROM serp_cache").fetchone()
+            self.entries, self.bytes = totals
+        return self._db
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.max_bytes > 0
+
+    async def get(self, tool: str, key: str):
+        if not self.enabled:
+            return None
+        return await anyio.to_thread.run_sync(self._get, tool, key)
+
+    async def put(self, tool: str, key: str, results: list):
+        if not self.enabled:
             return
+        await anyio.to_thread.run_sync(self._put, tool, key, msgspec.json.encode(results))
+
+    def _get(self, tool: str, key: str):
+        with self._lock:
+            now = time.time()
+            row = self.db.execute("SELECT results, stored_at FROM serp_cache WHERE tool = ? AND key = ?", (tool, key)).fetchone()
+            # TTLs apply at read time, so changing one also applies to stored entries
+            if row is None or row[1] + SERP_CACHE_TTLS.get(tool, 0) < now:
+                self.stats["misses"] += 1
+                return None
+            self.db.execute("UPDATE serp_cache SET used_at = ?, hits = hits + 1 WHERE tool = ? AND key = ?", (now, tool, key))
+            self.stats["hits"] += 1
+        return msgspec.json.decode(row[0])
+
+    def _put(self, tool: str, key: str, blob: bytes):
+        with self._lock:
+            now = time.time()
+            old = self.db.execute("SELECT size FROM serp_cache WHERE tool = ? AND key = ?", (tool, key)).fetchone()
+            self.db.execute(
+                "INSERT INTO serp_cache (tool, key, results, size, stored_at, used_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (tool, key) DO UPDATE SET results = excluded.results, size = excluded.size, "
+                "stored_at = excluded.stored_at, used_at = excluded.used_at",
+                (tool, key, blob, len(blob), now, now)
+            )
+            if old is None:
+                self.entries += 1
+            self.bytes += len(blob) - (old[0] if old else 0)
+            self.stats["stores"] += 1
+            if self.bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """Drop least recently used entries down to 90% of max_bytes (one pass, not one per store)."""
+        target = self.max_bytes * 0.9
+        victims = []
+        for tool, key, size in self.db.execute("SELECT tool, key, size FROM serp_cache ORDER BY used_at"):
+            if self.bytes <= target:
+                break
+            victims.append((tool, key))
+            self.bytes -= size
+        self.db.executemany("DELETE FROM serp_cache WHERE tool = ? AND key = ?", victims)
+        self.entries -= len(victims)
+        self.stats["evictions"] += len(victims)
+
+    def snapshot(self) -> dict:
+        if not self.enabled:
+            return {"enabled": False}
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            # Counted when the store is opened (first lookup), then tracked in memory
+            "entries": self.entries,
+            "bytes": self.bytes,
+            **self.stats,
+            "hit_ratio": round(self.stats["hits"] / lookups, 3) if lookups else None,
+            # Paid SERP queries avoided: cache hits plus calls that joined an identical one in flight
+            "quota_saved": self.stats["hits"] + self.stats["coalesced"]
+        }
+
+
+serp_cache = SerpCache(SERP_CACHE_PATH, SERP_CACHE_MAX_BYTES)
+_pending_searches = {}
+
+
+async def _search_and_store(tool: str, key: str, query: str) -> tuple:
+    async with http_client(timeout=15.0, idempotent=True, hedger=serp_hedger) as client:
+        response = await client.post(SERP_URL, json={"q": query}, headers=SERP_HEADERS)
+
+    if response.status_code != 200:
+        return None, {"error": f"HTTP {response.status_code}", "details": response.text}
+
+    results = decode_results(response.content)
+    await serp_cache.put(tool, key, results)
+    return results, None
+
+
+def _search_done(tool: str, key: str, task: asyncio.Task):
+    _pending_searches.pop((tool, key), None)
+    if not task.cancelled():
+        task.exception()
+
+
+async def cached_search(tool: str, key: str, query: str) -> tuple:
+    """(results, error) of query: cached, joined to an identical search in flight, or fetched."""
+    results = await serp_cache.get(tool, key)
+    if results is not None:
+        return results, None
 
-        await self.app(scope, receive, send)
-
-    async def _send_401(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 401,
-            "headers": [
-                [b"content-type", b"application/json"],
-                [b"www-authenticate", b'Basic realm="MCP Server"']
-            ]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"error": "Unauthorized"}'
-        })
-
-    async def _send_health(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 200,
-            "headers": [[b"content-type", b"application/json"]]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"status": "ok"}'
-        })
+    task = _pending_searches.get((tool, key))
+    if task is None:
+        task = _pending_searches[(tool, key)] = asyncio.ensure_future(_search_and_store(tool, key, query))
+        task.add_done_callback(functools.partial(_search_done, tool, key))
+    else:
+        serp_cache.stats["coalesced"] += 1
+    # Shielded: a caller going away must not cancel the search for the others
+    return await asyncio.shield(task)
+
+
+async def _serp_search(query: str) -> dict:
+    # Plain coroutine shared with serp_search_many (under fastmcp 2.x a decorated tool is not callable)
+    results, error = await cached_search("serp_search", normalize_query(query), query)
+    if error:
+        return error
+
+    return {
+        "query": query,
+        "results": results,
+        "total": len(results)
+    }
 
 
 @mcp.tool
@@ -98,19 +260,7 @@ async def serp_search(query: str) -> dict:
     Returns:
         Liste des résultats avec titre, URL et snippet
     """
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        response = await client.post(SERP_URL, json={"q": query}, headers=SERP_HEADERS)
-
-        if response.status_code != 200:
-            return {"error": f"HTTP {response.status_code}", "details": response.text}
-
-        data = response.json()
-
-        return {
-            "query": query,
-            "results": data.get("results", []),
-            "total": len(data.get("results", []))
-        }
+    return await _serp_search(query)
 
 
 @mcp.tool
@@ -128,33 +278,28 @@ async def serp_pappers(company_name: str) -> dict:
     """
     query = f"{company_name} pappers"
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        response = await client.post(SERP_URL, json={"q": query}, headers=SERP_HEADERS)
-
-        if response.status_code != 200:
-            return {"error": f"HTTP {response.status_code}", "details": response.text}
-
-        data = response.json()
-        results = data.get("results", [])
-
-        pappers_results = []
-        for r in results:
-            url = r.get("url", "")
-            if "pappers.fr/entreprise/" in url:
-                match = re.search(r'/entreprise/([a-z0-9\-]+)-(\d{9})(?:/|$)', url)
-                if match:
-                    pappers_results.append({
-                        "url": url,
-                        "title": r.get("title"),
-                        "nom_legal_extrait": match.group(1).replace('-', ' ').upper(),
-                        "siren_extrait": match.group(2)
-                    })
-
-        return {
-            "query": query,
-            "pappers_results": pappers_results,
-            "all_results": results
-        }
+    results, error = await cached_search("serp_pappers", company_key(company_name), query)
+    if error:
+        return error
+
+    pappers_results = []
+    for r in results:
+        url = r.get("url") or ""
+        if "pappers.fr/entreprise/" in url:
+            match = re.search(r'/entreprise/([a-z0-9\-]+)-(\d{9})(?:/|$)', url)
+            if match:
+                pappers_results.append({
+                    "url": url,
+                    "title": r.get("title"),
+                    "nom_legal_extrait": match.group(1).replace('-', ' ').upper(),
+                    "siren_extrait": match.group(2)
+                })
+
+    return {
+        "query": query,
+        "pappers_results": pappers_results,
+        "all_results": results
+    }
 
 
 @mcp.tool
@@ -170,22 +315,17 @@ async def serp_societe_com(company_name: str) -> dict:
     """
     query = f"{company_name} societe.com"
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        response = await client.post(SERP_URL, json={"q": query}, headers=SERP_HEADERS)
-
-        if response.status_code != 200:
-            return {"error": f"HTTP {response.status_code}", "details": response.text}
+    results, error = await cached_search("serp_societe_com", company_key(company_name), query)
+    if error:
+        return error
 
-        data = response.json()
-        results = data.get("results", [])
+    societe_results = [r for r in results if "societe.com" in (r.get("url") or "")]
 
-        societe_results = [r for r in results if "societe.com" in r.get("url", "")]
-
-        return {
-            "query": query,
-            "societe_results": societe_results,
-            "all_results": results
-        }
+    return {
+        "query": query,
+        "societe_results": societe_results,
+        "all_results": results
+    }
 
 
 @mcp.tool
@@ -201,31 +341,83 @@ async def serp_linkedin_company(company_name: str) -> dict:
     """
     query = f"site:linkedin.com/company {company_name}"
 
-    async with httpx.AsyncClient(timeout=15.0) as client:
-        response = await client.post(SERP_URL, json={"q": query}, headers=SERP_HEADERS)
-
-        if response.status_code != 200:
-            return {"error": f"HTTP {response.status_code}", "details": response.text}
+    results, error = await cached_search("serp_linkedin_company", company_key(company_name), query)
+    if error:
+        return error
 
-        data = response.json()
-        results = data.get("results", [])
+    linkedin_urls = [
+        r.get("url") for r in results
+        if "linkedin.com/company/" in (r.get("url") or "")
+    ]
 
-        linkedin_urls = [
-            r.get("url") for r in results
-            if "linkedin.com/company/" in r.get("url", "")
-        ]
+    return {
+        "query": query,
+        "linkedin_company_url": linkedin_urls[0] if linkedin_urls else None,
+        "all_linkedin_urls": linkedin_urls
+    }
 
-        return {
-            "query": query,
-            "linkedin_company_url": linkedin_urls[0] if linkedin_urls else None,
-            "all_linkedin_urls": linkedin_urls
-        }
 
+@mcp.tool
+async def serp_search_many(queries: list[str], ctx: Context, concurrency: int = 5) -> dict:
+    """
+    Effectue plusieurs recherches Google en parallèle.
 
-def create_authenticated_app():
-    """Wrap FastMCP app with Basic Auth middleware."""
-    mcp_app = mcp.http_app(path="/mcp")
-    return BasicAuthMiddleware(mcp_app)
+    Chaque résultat est envoyé dès qu'il arrive via une notification de
+    progression (message JSON: query, results ou error), sans attendre la
+    requête la plus lente.
 
+    Args:
+        queries: Requêtes de recherche (100 max)
+        concurrency: Recherches simultanées (défaut: 5, max: 20)
 
-app = create_authenticated_app()
+    Returns:
+        Résumé (succès, échecs, durée) et résultats dans l'ordre des requêtes
+    """
+    if len(queries) > SERP_MANY_MAX_QUERIES:
+        return {"error": f"Trop de requêtes ({len(queries)}), maximum {SERP_MANY_MAX_QUERIES}"}
+
+    started = time.monotonic()
+    semaphore = asyncio.Semaphore(max(1, min(concurrency, SERP_MANY_MAX_CONCURRENCY)))
+
+    async def run(index: int, query: str) -> tuple:
+        async with semaphore:
+            try:
+                return index, await _serp_search(query)
+            except (httpx.HTTPError, msgspec.DecodeError, msgspec.ValidationError) as e:
+                # One bad query (network or malformed body) must not fail the batch
+                return index, {"query": query, "error": str(e) or type(e).__name__}
+
+    results = [None] * len(queries)
+    tasks = [asyncio.ensure_future(run(i, q)) for i, q in enumerate(queries)]
+    try:
+        for done, next_result in enumerate(asyncio.as_completed(tasks), start=1):
+            index, result = await next_result
+            results[index] = result
+            await ctx.report_progress(
+                progress=done,
+                total=len(queries),
+                message=json_encoder.encode({"index": index, **result}).decode()
+            )
+    finally:
+        for task in tasks:
+            task.cancel()
+
+    failed = sum(1 for r in results if "error" in r)
+    return {
+        "total": len(queries),
+        "succeeded": len(queries) - failed,
+        "failed": failed,
+        "elapsed_s": round(time.monotonic() - started, 3),
+        "results": results
+    }
+
+
+def health() -> dict:
+    """Service entries of the / health body."""
+    body = {"serp_cache": serp_cache.snapshot()}
+    if serp_hedger is not None:
+        body["hedging"] = serp_hedger.snapshot()
+    return body
+
+
+app = create_authenticated_app(mcp, warmup, health)
@@ -5,14 +5,30 @@ With Basic Auth protection
 """
 
 import os
-import base64
+import sys
+import asyncio
+import anyio
 import httpx
+import msgspec
+import re
+from html import unescape
 from fastmcp import FastMCP
 
-AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "ackizit")
-AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "!Lam3ute!75")
+# Shared runtime (common/runtime.py), copied next to this file in the image
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from runtime import (  # noqa: E402
+    create_authenticated_app, decode_upstream, http_client, job_runner, register_job_tools, setup, SharedTransport,
+    Warmup
+)
 
 mcp = FastMCP("SIRET Extractor")
+setup(mcp, "mcp-siret-extractor")
+
+# Extraction engine: "local" crawls sites in-process, "remote" forwards to the extraction API
+SIRET_ENGINE = os.environ.get("SIRET_ENGINE", "local")
+
+# Extraction API (overridable for local mocks and benchmarks)
+SIRET_EXTRACTOR_API_URL = os.environ.get("SIRET_EXTRACTOR_API_URL", "https://siretextractor.lasupermachine.fr")
 
 # Internal API auth
 INTERNAL_AUTH = "YWNraXppdDohTGFtM3V0ZSE3NQ=="
@@ -22,106 +38,309 @@ INTERNAL_HEADERS = {
 }
 
 
-class BasicAuthMiddleware:
-    """ASGI middleware for Basic Auth."""
+class Extraction(msgspec.Struct):
+    found: bool = False
+    siret: str | None = None
+    siren: str | None = None
+    tva: str | None = None
+    source_page: str | None = None
+
+
+extraction_decoder = msgspec.json.Decoder(Extraction)
+
+
+# Local extraction engine: the homepage and the usual legal pages are fetched
+# concurrently, then the legal links found on the homepage, at most
+# CRAWL_MAX_PAGES pages per site and CRAWL_MAX_BYTES per page. The crawl stops
+# at the first page carrying a labelled SIRET, SIREN or VAT number; a bare
+# checksum-valid number is only kept in case no page has one. Crawled sites get their own
+# pool (CRAWL_POOL_CONNECTIONS, short keep-alive) and no circuit breakers, so
+# thousands of one-off hosts neither crowd the upstream pool nor the breaker table.
+CRAWL_MAX_PAGES = int(os.environ.get("CRAWL_MAX_PAGES", "8"))
+CRAWL_MAX_BYTES = int(os.environ.get("CRAWL_MAX_BYTES", str(1024 * 1024)))
+CRAWL_CONCURRENCY = int(os.environ.get("CRAWL_CONCURRENCY", "4"))
+CRAWL_TIMEOUT = float(os.environ.get("CRAWL_TIMEOUT", "10"))
+CRAWL_POOL_CONNECTIONS = int(os.environ.get("CRAWL_POOL_CONNECTIONS", "50"))
+CRAWL_KEEPALIVE_EXPIRY = 5.0
+CRAWL_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (compatible; siret-extractor/1.0)",
+    "Accept": "text/html,application/xhtml+xml;q=0.9,*/*;q=0.5",
+    "Accept-Language": "fr-FR,fr;q=0.9"
+}
+LEGAL_PATHS = ("mentions-legales", "legal", "cgv")
+LA_POSTE_SIREN = "356000000"
+
+# Digits may be grouped with spaces (\s includes non-breaking ones), dots or dashes
+_SEP = r"[\s.\-]?"
+_SIRET = rf"(?<!\d)(\d{{3}}){_SEP}(\d{{3}}){_SEP}(\d{{3}}){_SEP}(\d{{5}})(?!\d)"
+_SIRET_CONTEXT_RE = re.compile(rf"siret\W{{0,40}}?{_SIRET}", re.IGNORECASE)
+_SIRET_RE = re.compile(_SIRET)
+_SIREN_RE = re.compile(
+    rf"(?:siren|r\.?\s?c\.?\s?s\.?|immatricul\w*)[^\d]{{0,40}}?(?<!\d)(\d{{3}}){_SEP}(\d{{3}}){_SEP}(\d{{3}})(?!{_SEP}\d)",
+    re.IGNORECASE
+)
+_TVA_RE = re.compile(rf"\bFR{_SEP}(\d{{2}}){_SEP}(\d{{3}}){_SEP}(\d{{3}}){_SEP}(\d{{3}})(?!\d)", re.IGNORECASE)
+_LINK_RE = re.compile(r"""<a\s[^>]*?href\s*=\s*["']([^"']+)["'][^>]*>(.*?)</a>""", re.IGNORECASE | re.DOTALL)
+_LEGAL_LINK_RE = re.compile(r"mentions|l[eé]gal|cgv|cgu|conditions|imprint|impressum", re.IGNORECASE)
+_HIDDEN_RE = re.compile(r"<(script|style|noscript)\b.*?</\1\s*>", re.IGNORECASE | re.DOTALL)
+_TAG_RE = re.compile(r"<[^>]+>")
+
+
+crawl_pool = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+    max_connections=CRAWL_POOL_CONNECTIONS,
+    max_keepalive_connections=CRAWL_POOL_CONNECTIONS,
+    keepalive_expiry=CRAWL_KEEPALIVE_EXPIRY
+))
+# Closed on shutdown along with the upstream pool
+warmup = Warmup([SIRET_EXTRACTOR_API_URL] if SIRET_ENGINE == "remote" else [], pools=[crawl_pool])
+
+
+def luhn_valid(number: str) -> bool:
+    total = 0
+    for position, digit in enumerate(reversed(number)):
+        d = int(digit) * (2 if position % 2 else 1)
+        total += d - 9 if d > 9 else d
+    return total % 10 == 0
+
+
+def valid_siret(siret: str) -> bool:
+    if len(siret) != 14 or not siret.isdigit():
+        return False
+    # La Poste establishments share one SIREN and use a digit-sum check instead
+    if siret.startswith(LA_POSTE_SIREN):
+        return luhn_valid(siret) or sum(map(int, siret)) % 5 == 0
+    return luhn_valid(siret)
+
+
+def valid_siren(siren: str) -> bool:
+    return len(siren) == 9 and siren.isdigit() and luhn_valid(siren)
+
+
+def tva_number(siren: str) -> str:
+    """French intra-community VAT number of a SIREN."""
+    return f"FR{(12 + 3 * (int(siren) % 97)) % 97:02d}{siren}"
+
+
+def html_text(html: str) -> str:
+    """Visible text of an HTML page, tags replaced by spaces."""
+    return unescape(_TAG_RE.sub(" ", _HIDDEN_RE.sub(" ", html)))
+
+
+def extract_identifiers(html: str) -> dict | None:
+    """First valid SIRET, SIREN and TVA in a page's text, or None without a valid SIREN.
+
+    contextual is False when the only evidence is a bare checksum-valid 14-digit
+    number, with no SIRET, SIREN/RCS or VAT label to back it: one in ten random
+    numbers (order or tracking ids) pass Luhn.
+    """
+    text = html_text(html)
+    siret = next(
+        (s for s in ("".join(m.groups()) for m in _SIRET_CONTEXT_RE.finditer(text)) if valid_siret(s)),
+        None
+    )
+    bare = None if siret else next(
+        (s for s in ("".join(m.groups()) for m in _SIRET_RE.finditer(text)) if valid_siret(s)),
+        None
+    )
+
+    tva = None
+    for m in _TVA_RE.finditer(text):
+        candidate = f"FR{''.join(m.groups())}"
+        if valid_siren(candidate[4:]) and tva_number(candidate[4:]) == candidate.upper():
+            tva = candidate.upper()
+            break
+
+    contextual = True
+    if siret:
+        siren = siret[:9]
+    elif tva:
+        siren = tva[4:]
+    else:
+        siren = next((s for s in ("".join(m.groups()) for m in _SIREN_RE.finditer(text)) if valid_siren(s)), None)
+    if siren is None and bare:
+        siren = bare[:9]
+        contextual = False
+    if siren is None:
+        return None
+    if bare and bare.startswith(siren):
+        siret = bare
+    return {"siret": siret, "siren": siren, "tva": tva or tva_number(siren), "contextual": contextual}
+
+
+def legal_links(html: str, page_url: str) -> list:
+    """Same-site links whose URL or text looks like a legal page, in page order."""
+    host = httpx.URL(page_url).host.removeprefix("www.")
+    links = []
+    for href, label in _LINK_RE.findall(html):
+        if not (_LEGAL_LINK_RE.search(href) or _LEGAL_LINK_RE.search(_TAG_RE.sub(" ", label))):
+            continue
+        try:
+            url = httpx.URL(page_url).join(unescape(href.strip()))
+        except httpx.InvalidURL:
+            continue
+        if url.scheme in ("http", "https") and url.host.removeprefix("www.") == host:
+            links.append(str(url.copy_with(fragment=None)))
+    return list(dict.fromkeys(links))
+
+
+def site_base(url: str) -> str:
+    """The URL legal paths are resolved against: the site's directory, with a trailing slash."""
+    url = url.strip()
+    if "://" not in url:
+        url = f"https://{url}"
+    parsed = httpx.URL(url)
+    last = parsed.path.rsplit("/", 1)[-1]
+    if "." in last:
+        return str(parsed.join(".").copy_with(query=None, fragment=None))
+    return str(parsed.copy_with(path=parsed.path.rstrip("/") + "/", query=None, fragment=None))
+
+
+async def fetch_page(client: httpx.AsyncClient, url: str) -> dict:
+    """GET a page, reading at most CRAWL_MAX_BYTES of it; html is None for non-HTML or errors."""
+    page = {"url": url, "status": None, "bytes": 0, "html": None}
+    async with client.stream("GET", url, headers=CRAWL_HEADERS, follow_redirects=True) as response:
+        page["url"] = str(response.url)
+        page["status"] = response.status_code
+        content_type = response.headers.get("content-type", "text/html")
+        if response.status_code != 200 or not ("html" in content_type or "text/plain" in content_type):
+            return page
+        body = bytearray()
+        async for chunk in response.aiter_bytes():
+            body += chunk
+            if len(body) >= CRAWL_MAX_BYTES:
+                break
+        page["bytes"] = min(len(body), CRAWL_MAX_BYTES)
+        page["html"] = bytes(body[:CRAWL_MAX_BYTES]).decode(response.encoding or "utf-8", errors="replace")
+    return page
 
-    def __init__(self, app):
-        self.app = app
 
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
-            await self.app(scope, receive, send)
-            return
+async def local_extract(url: str) -> dict:
+    """Crawl a site for its SIRET; returns Extraction fields plus the crawl log."""
+    base = site_base(url)
+    seen = set()
+    crawled = []
+    found = None
+    fallback = None
+    semaphore = asyncio.Semaphore(CRAWL_CONCURRENCY)
 
-        # Allow healthcheck on root path without auth
-        path = scope.get("path", "")
-        if path == "/" or path == "":
-            await self._send_health(send)
-            return
+    async with http_client(CRAWL_TIMEOUT, idempotent=False, transport=SharedTransport(crawl_pool), breakers=False) as client:
+        async with anyio.create_task_group() as tg:
+            async def visit(page_url: str, homepage: bool):
+                nonlocal found, fallback
+                async with semaphore:
+                    if found is not None:
+                        return
+                    try:
+                        page = await fetch_page(client, page_url)
+                    except (httpx.HTTPError, httpx.InvalidURL) as e:
+                        # UnsupportedProtocol (a redirect to mailto:...) is an HTTPError
+                        crawled.append({"url": page_url, "error": type(e).__name__})
+                        return
+                html = page.pop("html")
+                crawled.append(page)
+                if html is None:
+                    return
+                identifiers = await asyncio.to_thread(extract_identifiers, html)
+                if identifiers is not None:
+                    result = {**identifiers, "source_page": page["url"]}
+                    if result.pop("contextual"):
+                        if found is None:
+                            found = result
+                            tg.cancel_scope.cancel()
+                        return
+                    fallback = fallback or result
+                if homepage:
+                    for link in legal_links(html, page["url"]):
+                        schedule(link)
 
-        headers = dict(scope.get("headers", []))
-        auth_header = headers.get(b"authorization", b"").decode("utf-8")
+            def schedule(page_url: str, homepage: bool = False):
+                if page_url not in seen and len(seen) < CRAWL_MAX_PAGES:
+                    seen.add(page_url)
+                    tg.start_soon(visit, page_url, homepage)
 
-        if not auth_header.startswith("Basic "):
-            await self._send_401(send)
-            return
+            schedule(base, homepage=True)
+            for path in LEGAL_PATHS:
+                schedule(str(httpx.URL(base).join(path)))
+
+    found = found or fallback
+    return {"found": found is not None, **(found or {}), "pages": crawled}
+
+
+# Plain coroutine behind the tool, also run by the job workers (under fastmcp 2.x
+# a decorated tool is a FunctionTool, not a callable)
+async def extract_siret(url: str, include_raw: bool = True) -> dict:
+    """Identifiers of a site with the configured engine; errors are returned as an error dict."""
+    if SIRET_ENGINE == "local":
+        try:
+            crawl = await local_extract(url)
+        except httpx.InvalidURL as e:
+            return {"error": "URL invalide", "details": str(e)}
+        result = msgspec.structs.asdict(msgspec.convert(crawl, Extraction))
+        if include_raw:
+            result["raw"] = {"engine": "local", "pages": crawl["pages"]}
+        return result
+
+    async with http_client(timeout=30.0, idempotent=True) as client:
+        api_url = f"{SIRET_EXTRACTOR_API_URL}/api/extract"
+        payload = {"url": url}
+
+        response = await client.post(api_url, json=payload, headers=INTERNAL_HEADERS)
+
+        if response.status_code != 200:
+            return {"error": f"HTTP {response.status_code}", "details": response.text}
 
         try:
-            encoded = auth_header[6:]
-            decoded = base64.b64decode(encoded).decode("utf-8")
-            username, password = decoded.split(":", 1)
-
-            if username != AUTH_USERNAME or password != AUTH_PASSWORD:
-                await self._send_401(send)
-                return
-        except Exception:
-            await self._send_401(send)
-            return
-
-        await self.app(scope, receive, send)
-
-    async def _send_401(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 401,
-            "headers": [
-                [b"content-type", b"application/json"],
-                [b"www-authenticate", b'Basic realm="MCP Server"']
-            ]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"error": "Unauthorized"}'
-        })
-
-    async def _send_health(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 200,
-            "headers": [[b"content-type", b"application/json"]]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"status": "ok"}'
-        })
+            extraction, raw = decode_upstream(extraction_decoder, response.content, include_raw)
+        except (msgspec.DecodeError, msgspec.ValidationError) as e:
+            return {"error": "Réponse invalide de l'extracteur", "details": str(e)}
+
+        result = msgspec.structs.asdict(extraction)
+        if include_raw:
+            result["raw"] = raw
+        return result
 
 
 @mcp.tool
-async def siret_extractor(url: str) -> dict:
+async def siret_extractor(url: str, include_raw: bool = True) -> dict:
     """
     Extrait le SIRET des mentions légales d'un site web.
 
+    La page d'accueil et les pages légales probables (/mentions-legales, /legal,
+    /cgv, liens légaux de la page d'accueil) sont parcourues en parallèle ; le
+    premier SIRET, SIREN ou TVA valide (clé de Luhn) et libellé comme tel arrête
+    le crawl. Un nombre de 14 chiffres seul n'est retenu qu'à défaut de mieux.
+
     Args:
         url: URL du site web à analyser
+        include_raw: Inclure le détail brut : pages parcourues, ou réponse de
+            l'extracteur distant avec SIRET_ENGINE=remote (défaut: True)
 
     Returns:
         SIRET, SIREN et TVA si trouvés (~38% des sites les publient)
     """
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        api_url = "https://siretextractor.lasupermachine.fr/api/extract"
-        payload = {"url": url}
+    return await extract_siret(url, include_raw)
 
-        response = await client.post(api_url, json=payload, headers=INTERNAL_HEADERS)
 
-        if response.status_code != 200:
-            return {"error": f"HTTP {response.status_code}", "details": response.text}
+@mcp.tool
+async def submit_siret_extractor(url: str) -> dict:
+    """
+    Met en file l'extraction du SIRET d'un site web et rend la main immédiatement.
+
+    Args:
+        url: URL du site web à analyser
+
+    Returns:
+        job_id à passer à get_job ou wait_job
+    """
+    return job_runner.submit("siret_extractor", extract_siret, url=url).to_dict()
 
-        data = response.json()
 
-        return {
-            "found": data.get("found", False),
-            "siret": data.get("siret"),
-            "siren": data.get("siren"),
-            "tva": data.get("tva"),
-            "source_page": data.get("source_page"),
-            "raw": data
-        }
+register_job_tools(mcp)
 
 
-def create_authenticated_app():
-    """Wrap FastMCP app with Basic Auth middleware."""
-    mcp_app = mcp.http_app(path="/mcp")
-    return BasicAuthMiddleware(mcp_app)
+def health() -> dict:
+    """Service entries of the / health body."""
+    return {"jobs": job_runner.snapshot()}
 
 
-app = create_authenticated_app()
+app = create_authenticated_app(mcp, warmup, health)
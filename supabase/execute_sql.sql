@@ -0,0 +1,62 @@
+-- RPC behind the execute_sql tool, to run once in the Supabase SQL editor.
+--
+-- params (JSON array, up to 10 values) are bound server-side to $1..$10 with
+-- EXECUTE ... USING, never spliced into the query text. Values are bound as
+-- text: cast them in the query when needed ($1::int, $2::uuid...).
+--
+-- The previous 2-argument version is dropped: left next to this one, every call
+-- without params would match both and PostgREST would reject it as ambiguous.
+
+drop function if exists public.execute_sql(text, boolean);
+
+create or replace function public.execute_sql(
+  query text,
+  read_only boolean default true,
+  params jsonb default '[]'::jsonb
+)
+returns jsonb
+language plpgsql
+security definer
+set search_path = public, extensions
+as $$
+declare
+  result jsonb;
+  affected bigint;
+begin
+  if jsonb_typeof(params) <> 'array' or jsonb_array_length(params) > 10 then
+    raise exception 'params must be a JSON array of at most 10 values';
+  end if;
+
+  query := regexp_replace(query, ';\s*$', '');
+
+  if read_only then
+    set local transaction_read_only = on;
+  end if;
+
+  -- EXPLAIN output is already JSON (FORMAT JSON): return it as is
+  if query ~* '^\s*explain\M' then
+    execute query
+      into result
+      using params->>0, params->>1, params->>2, params->>3, params->>4,
+            params->>5, params->>6, params->>7, params->>8, params->>9;
+    return result;
+  end if;
+
+  if read_only or query ~* '^\s*(select|values|table)\M' then
+    execute format('select coalesce(jsonb_agg(t), ''[]''::jsonb) from (%s) t', query)
+      into result
+      using params->>0, params->>1, params->>2, params->>3, params->>4,
+            params->>5, params->>6, params->>7, params->>8, params->>9;
+    return result;
+  end if;
+
+  execute query
+    using params->>0, params->>1, params->>2, params->>3, params->>4,
+          params->>5, params->>6, params->>7, params->>8, params->>9;
+  get diagnostics affected = row_count;
+  return jsonb_build_object('success', true, 'rows_affected', affected);
+end;
+$$;
+
+revoke execute on function public.execute_sql(text, boolean, jsonb) from public, anon, authenticated;
+grant execute on function public.execute_sql(text, boolean, jsonb) to service_role;
@@ -4,14 +4,27 @@ Interact with self-hosted Supabase instances
 With Basic Auth protection
 """
 
+import io
 import os
-import base64
+import sys
+import csv
+import gzip
+import math
+import time
+import asyncio
+import collections
+import anyio
 import httpx
-from fastmcp import FastMCP
+import msgspec
+import re
+from fastmcp import FastMCP, Context
+from fastmcp.exceptions import ToolError
 
-# Auth credentials from env or defaults
-AUTH_USERNAME = os.environ.get("AUTH_USERNAME", "ackizit")
-AUTH_PASSWORD = os.environ.get("AUTH_PASSWORD", "!Lam3ute!75")
+# Shared runtime (common/runtime.py), copied next to this file in the image
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "common"))
+from runtime import (  # noqa: E402
+    create_authenticated_app, http_client, setup, Warmup
+)
 
 # Supabase configuration
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "https://supabase.lasupermachine.fr")
@@ -20,6 +33,7 @@ SUPABASE_SERVICE_KEY = os.environ.get("SUPABASE_SERVICE_KEY", "")
 
 # Create MCP server
 mcp = FastMCP("Supabase Self-Hosted")
+setup(mcp, "mcp-supabase")
 
 
 def get_headers(use_service_key: bool = True) -> dict:
@@ -32,71 +46,173 @@ def get_headers(use_service_key: bool = True) -> dict:
     }
 
 
-class BasicAuthMiddleware:
-    """ASGI middleware for Basic Auth."""
-
-    def __init__(self, app):
-        self.app = app
-
-    async def __call__(self, scope, receive, send):
-        if scope["type"] != "http":
-            await self.app(scope, receive, send)
+warmup = Warmup([SUPABASE_URL])
+
+
+class AuthUser(msgspec.Struct):
+    id: str | None = None
+    email: str | None = None
+    created_at: str | None = None
+    last_sign_in_at: str | None = None
+    role: str | None = None
+
+
+class UsersResponse(msgspec.Struct):
+    users: list[AuthUser] = []
+
+
+class Bucket(msgspec.Struct):
+    id: str | None = None
+    name: str | None = None
+    public: bool | None = None
+    created_at: str | None = None
+
+
+users_decoder = msgspec.json.Decoder(UsersResponse)
+user_decoder = msgspec.json.Decoder(AuthUser)
+buckets_decoder = msgspec.json.Decoder(list[Bucket])
+
+
+# Results of read-only execute_sql calls are cached for SQL_CACHE_TTL seconds,
+# keyed on the normalized query and its parameters, within SQL_CACHE_MAX_BYTES
+# (least recently used entries are evicted first; 0 disables the cache). A write
+# evicts the entries reading the tables it touches, or everything when its
+# tables can't be determined.
+SQL_CACHE_TTL = float(os.environ.get("SQL_CACHE_TTL", "60"))
+SQL_CACHE_MAX_BYTES = int(os.environ.get("SQL_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+SQL_MAX_PARAMS = 10
+
+_SQL_QUOTED = re.compile(r"""('(?:[^']|'')*'|"(?:[^"]|"")*")""")
+_SQL_DOLLAR_QUOTE = re.compile(r"\$(?:[a-z_]\w*)?\$", re.IGNORECASE)
+_SQL_IDENTIFIER = r'(?:"(?:[^"]|"")+"|[a-z_][\w$]*)(?:\s*\.\s*(?:"(?:[^"]|"")+"|[a-z_][\w$]*))?'
+_SQL_READ_TABLES = re.compile(rf"\b(?:from|join)\s+(?:only\s+)?({_SQL_IDENTIFIER})", re.IGNORECASE)
+_SQL_WRITE_TABLES = re.compile(
+    rf"\b(?:insert\s+into|update|delete\s+from|merge\s+into|truncate(?:\s+table)?|copy"
+    rf"|(?:alter|drop|create)\s+(?:table|view|materialized\s+view)(?:\s+if\s+(?:not\s+)?exists)?)"
+    rf"\s+(?:only\s+)?({_SQL_IDENTIFIER})",
+    re.IGNORECASE
+)
+_SQL_VOLATILE = re.compile(
+    r"\b(?:now|random|clock_timestamp|statement_timestamp|timeofday|nextval|gen_random_uuid|uuid_generate_v4)\s*\("
+    r"|\bcurrent_(?:timestamp|time|date)\b",
+    re.IGNORECASE
+)
+
+
+def normalize_sql(query: str) -> str:
+    """Lower-case and collapse whitespace outside quoted strings and identifiers."""
+    if _SQL_DOLLAR_QUOTE.search(query):
+        # Dollar-quoted bodies can't be split safely: only trim
+        return query.strip().rstrip(";").strip()
+    parts = _SQL_QUOTED.split(query)
+    for i in range(0, len(parts), 2):
+        parts[i] = re.sub(r"\s+", " ", parts[i].lower())
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def _table_names(pattern: re.Pattern, sql: str) -> set:
+    """Bare table names matched by pattern in normalized SQL (schema dropped)."""
+    return {match.split(".")[-1].strip().strip('"').lower() for match in pattern.findall(sql)}
+
+
+class QueryCache:
+    """Size-bounded LRU of read-only query results, invalidated by table."""
+
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.entries = collections.OrderedDict()  # key -> (expires, size, tables, data)
+        self.bytes = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def key(self, sql: str, params: list) -> tuple:
+        return sql, msgspec.json.encode(params or [])
+
+    def get(self, key: tuple):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._drop(key)
+            self.stats["misses"] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.stats["hits"] += 1
+        return entry[3]
+
+    def put(self, key: tuple, data, size: int):
+        if size > self.max_bytes or _SQL_VOLATILE.search(key[0]):
             return
-
-        path = scope.get("path", "")
-        if path == "/" or path == "":
-            await self._send_health(send)
-            return
-
-        headers = dict(scope.get("headers", []))
-        auth_header = headers.get(b"authorization", b"").decode("utf-8")
-
-        if not auth_header.startswith("Basic "):
-            await self._send_401(send)
-            return
-
+        if key in self.entries:
+            self._drop(key)
+        self.entries[key] = (time.monotonic() + self.ttl, size, _table_names(_SQL_READ_TABLES, key[0]), data)
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            self._drop(next(iter(self.entries)))
+            self.stats["evictions"] += 1
+
+    def invalidate(self, sql: str):
+        """Drop entries reading a table written by sql (all entries if unknown)."""
+        tables = _table_names(_SQL_WRITE_TABLES, sql)
+        stale = [key for key, entry in self.entries.items() if not tables or entry[2] & tables]
+        for key in stale:
+            self._drop(key)
+        self.stats["invalidations"] += len(stale)
+
+    def _drop(self, key: tuple):
+        self.bytes -= self.entries.pop(key)[1]
+
+    def snapshot(self) -> dict:
+        return {"entries": len(self.entries), "bytes": self.bytes, **self.stats}
+
+
+query_cache = QueryCache(SQL_CACHE_TTL, SQL_CACHE_MAX_BYTES)
+
+
+# Plain coroutine behind the tool, also awaited by the other tools (under fastmcp
+# 2.x a decorated tool is a FunctionTool, not a callable)
+async def _execute_sql(query: str, read_only: bool = True, params: list = None, use_cache: bool = True) -> dict:
+    """Run a query through the execute_sql RPC; errors are returned as {"success": False, ...}."""
+    if params and len(params) > SQL_MAX_PARAMS:
+        return {"success": False, "error": f"At most {SQL_MAX_PARAMS} parameters are supported"}
+
+    sql = normalize_sql(query)
+    cacheable = read_only and use_cache and query_cache.enabled
+    if cacheable:
+        key = query_cache.key(sql, params)
+        data = query_cache.get(key)
+        if data is not None:
+            return {"success": True, "data": data, "cached": True}
+
+    # params always sent, so the call resolves to the 3-argument RPC only
+    body = {"query": query, "read_only": read_only, "params": params or []}
+
+    async with http_client(timeout=30.0, idempotent=read_only) as client:
         try:
-            encoded = auth_header[6:]
-            decoded = base64.b64decode(encoded).decode("utf-8")
-            username, password = decoded.split(":", 1)
-
-            if username != AUTH_USERNAME or password != AUTH_PASSWORD:
-                await self._send_401(send)
-                return
-        except Exception:
-            await self._send_401(send)
-            return
-
-        await self.app(scope, receive, send)
-
-    async def _send_401(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 401,
-            "headers": [
-                [b"content-type", b"application/json"],
-                [b"www-authenticate", b'Basic realm="MCP Server"']
-            ]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"error": "Unauthorized"}'
-        })
+            response = await client.post(
+                f"{SUPABASE_URL}/rest/v1/rpc/execute_sql",
+                json=body,
+                headers=get_headers()
+            )
 
-    async def _send_health(self, send):
-        await send({
-            "type": "http.response.start",
-            "status": 200,
-            "headers": [[b"content-type", b"application/json"]]
-        })
-        await send({
-            "type": "http.response.body",
-            "body": b'{"status": "ok"}'
-        })
+            if not read_only:
+                query_cache.invalidate(sql)
+            if response.status_code == 200:
+                data = msgspec.json.decode(response.content)
+                if cacheable:
+                    query_cache.put(key, data, len(response.content))
+                return {"success": True, "data": data}
+            else:
+                return {"success": False, "error": response.text, "status": response.status_code}
+        except Exception as e:
+            return {"success": False, "error": str(e)}
 
 
 @mcp.tool
-async def execute_sql(query: str, read_only: bool = True) -> dict:
+async def execute_sql(query: str, read_only: bool = True, params: list = None, use_cache: bool = True) -> dict:
     """
     Execute a SQL query on the Supabase database via RPC.
 
@@ -106,26 +222,15 @@ async def execute_sql(query: str, read_only: bool = True) -> dict:
     - DML: INSERT, UPDATE, DELETE
 
     Args:
-        query: The SQL query to execute
+        query: The SQL query to execute, with $1, $2... placeholders for params
         read_only: Set to False for DDL/DML operations (default True for safety)
+        params: Values bound server-side to $1..$10, as text (cast in SQL, e.g. $1::int)
+        use_cache: Serve read-only results from the cache when fresh (default True)
 
     Returns:
         Query results or operation status
     """
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        try:
-            response = await client.post(
-                f"{SUPABASE_URL}/rest/v1/rpc/execute_sql",
-                json={"query": query, "read_only": read_only},
-                headers=get_headers()
-            )
-
-            if response.status_code == 200:
-                return {"success": True, "data": response.json()}
-            else:
-                return {"success": False, "error": response.text, "status": response.status_code}
-        except Exception as e:
-            return {"success": False, "error": str(e)}
+    return await _execute_sql(query, read_only, params, use_cache)
 
 
 @mcp.tool
@@ -139,13 +244,13 @@ async def list_tables(schema: str = "public") -> dict:
     Returns:
         List of table names with their details
     """
-    query = f"""
+    query = """
     SELECT table_name, table_type
     FROM information_schema.tables
-    WHERE table_schema = '{schema}'
+    WHERE table_schema = $1
     ORDER BY table_name
     """
-    return await execute_sql(query, read_only=True)
+    return await _execute_sql(query, read_only=True, params=[schema])
 
 
 @mcp.tool
@@ -160,7 +265,7 @@ async def describe_table(table_name: str, schema: str = "public") -> dict:
     Returns:
         Table structure with column details
     """
-    query = f"""
+    query = """
     SELECT
         column_name,
         data_type,
@@ -168,10 +273,10 @@ async def describe_table(table_name: str, schema: str = "public") -> dict:
         column_default,
         character_maximum_length
     FROM information_schema.columns
-    WHERE table_schema = '{schema}' AND table_name = '{table_name}'
+    WHERE table_schema = $1 AND table_name = $2
     ORDER BY ordinal_position
     """
-    return await execute_sql(query, read_only=True)
+    return await _execute_sql(query, read_only=True, params=[schema, table_name])
 
 
 @mcp.tool
@@ -186,7 +291,7 @@ async def list_users(page: int = 1, per_page: int = 50) -> dict:
     Returns:
         List of users with their details
     """
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with http_client(timeout=30.0) as client:
         try:
             response = await client.get(
                 f"{SUPABASE_URL}/auth/v1/admin/users",
@@ -195,21 +300,11 @@ async def list_users(page: int = 1, per_page: int = 50) -> dict:
             )
 
             if response.status_code == 200:
-                data = response.json()
-                users = data.get("users", [])
+                users = users_decoder.decode(response.content).users
                 return {
                     "success": True,
                     "count": len(users),
-                    "users": [
-                        {
-                            "id": u.get("id"),
-                            "email": u.get("email"),
-                            "created_at": u.get("created_at"),
-                            "last_sign_in_at": u.get("last_sign_in_at"),
-                            "role": u.get("role")
-                        }
-                        for u in users
-                    ]
+                    "users": [msgspec.structs.asdict(u) for u in users]
                 }
             else:
                 return {"success": False, "error": response.text, "status": response.status_code}
@@ -230,7 +325,7 @@ async def create_user(email: str, password: str, email_confirm: bool = True) ->
     Returns:
         Created user details
     """
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with http_client(timeout=30.0) as client:
         try:
             response = await client.post(
                 f"{SUPABASE_URL}/auth/v1/admin/users",
@@ -243,13 +338,13 @@ async def create_user(email: str, password: str, email_confirm: bool = True) ->
             )
 
             if response.status_code in [200, 201]:
-                user = response.json()
+                user = user_decoder.decode(response.content)
                 return {
                     "success": True,
                     "user": {
-                        "id": user.get("id"),
-                        "email": user.get("email"),
-                        "created_at": user.get("created_at")
+                        "id": user.id,
+                        "email": user.email,
+                        "created_at": user.created_at
                     }
                 }
             else:
@@ -269,7 +364,7 @@ async def delete_user(user_id: str) -> dict:
     Returns:
         Deletion status
     """
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with http_client(timeout=30.0) as client:
         try:
             response = await client.delete(
                 f"{SUPABASE_URL}/auth/v1/admin/users/{user_id}",
@@ -292,7 +387,7 @@ async def list_buckets() -> dict:
     Returns:
         List of storage buckets with their details
     """
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with http_client(timeout=30.0) as client:
         try:
             response = await client.get(
                 f"{SUPABASE_URL}/storage/v1/bucket",
@@ -300,19 +395,11 @@ async def list_buckets() -> dict:
             )
 
             if response.status_code == 200:
-                buckets = response.json()
+                buckets = buckets_decoder.decode(response.content)
                 return {
                     "success": True,
                     "count": len(buckets),
-                    "buckets": [
-                        {
-                            "id": b.get("id"),
-                            "name": b.get("name"),
-                            "public": b.get("public"),
-                            "created_at": b.get("created_at")
-                        }
-                        for b in buckets
-                    ]
+                    "buckets": [msgspec.structs.asdict(b) for b in buckets]
                 }
             else:
                 return {"success": False, "error": response.text, "status": response.status_code}
@@ -333,7 +420,7 @@ async def list_files(bucket_id: str, path: str = "", limit: int = 100) -> dict:
     Returns:
         List of files in the bucket
     """
-    async with httpx.AsyncClient(timeout=30.0) as client:
+    async with http_client(timeout=30.0, idempotent=True) as client:
         try:
             response = await client.post(
                 f"{SUPABASE_URL}/storage/v1/object/list/{bucket_id}",
@@ -342,7 +429,7 @@ async def list_files(bucket_id: str, path: str = "", limit: int = 100) -> dict:
             )
 
             if response.status_code == 200:
-                files = response.json()
+                files = msgspec.json.decode(response.content)
                 return {
                     "success": True,
                     "count": len(files),
@@ -371,7 +458,7 @@ async def get_database_stats() -> dict:
     JOIN pg_database ON pg_database.oid = pg_stat_database.datid
     WHERE pg_database.datname = current_database()
     """
-    return await execute_sql(query, read_only=True)
+    return await _execute_sql(query, read_only=True)
 
 
 @mcp.tool
@@ -385,23 +472,728 @@ async def get_table_row_counts(schema: str = "public") -> dict:
     Returns:
         Tables with their row counts
     """
-    query = f"""
+    query = """
     SELECT
         schemaname,
         relname as table_name,
         n_live_tup as row_count
     FROM pg_stat_user_tables
-    WHERE schemaname = '{schema}'
+    WHERE schemaname = $1
     ORDER BY n_live_tup DESC
     """
-    return await execute_sql(query, read_only=True)
+    return await _execute_sql(query, read_only=True, params=[schema])
+
+
+EXPLAIN_MISESTIMATE = 10
+TOP_QUERIES_ORDER = {
+    "total_time": "total_exec_time",
+    "mean_time": "mean_exec_time",
+    "calls": "calls",
+    "rows": "rows",
+    "shared_blks_read": "shared_blks_read"
+}
+
+
+def flatten_plan(node: dict, depth: int = 0, nodes: list = None) -> list:
+    """Flatten an EXPLAIN (FORMAT JSON) plan tree into one record per node, depth-first."""
+    nodes = [] if nodes is None else nodes
+    record = {
+        "depth": depth,
+        "node_type": node.get("Node Type"),
+        "relation": node.get("Relation Name"),
+        "index": node.get("Index Name"),
+        "startup_cost": node.get("Startup Cost"),
+        "total_cost": node.get("Total Cost"),
+        "plan_rows": node.get("Plan Rows"),
+        "shared_hit_blocks": node.get("Shared Hit Blocks"),
+        "shared_read_blocks": node.get("Shared Read Blocks")
+    }
+    for key, field in (("filter", "Filter"), ("index_cond", "Index Cond"), ("join_filter", "Join Filter"),
+                       ("rows_removed_by_filter", "Rows Removed by Filter")):
+        if field in node:
+            record[key] = node[field]
+    if "Actual Rows" in node:
+        loops = node.get("Actual Loops") or 1
+        actual = node["Actual Rows"] * loops
+        estimate = (node.get("Plan Rows") or 0) * loops
+        record["actual_rows"] = actual
+        record["actual_loops"] = loops
+        record["actual_total_ms"] = round(node.get("Actual Total Time", 0) * loops, 3)
+        # How far off the planner was, as a factor >= 1 (in either direction)
+        record["misestimate"] = round(max(actual, 1) / max(estimate, 1), 2) if actual >= estimate \
+            else round(max(estimate, 1) / max(actual, 1), 2)
+    nodes.append(record)
+    for child in node.get("Plans", []):
+        flatten_plan(child, depth + 1, nodes)
+    return nodes
+
+
+@mcp.tool
+async def explain_query(query: str, analyze: bool = False, params: list = None) -> dict:
+    """
+    Get the execution plan of a query (EXPLAIN), optionally running it (ANALYZE).
+
+    The plan is returned as a flat list of nodes (depth-first) with costs, row
+    estimates and, with analyze=True, actual rows, timing and buffer usage.
+    ANALYZE runs in a read-only transaction: it can't be used on writes.
+
+    Args:
+        query: The SQL query to explain, with $1, $2... placeholders for params
+        analyze: Execute the query to get actual rows, timings and buffers (default False)
+        params: Values bound to $1..$10, as text (cast in SQL, e.g. $1::int)
+
+    Returns:
+        Summary (total cost, planning/execution time, buffers), plan nodes and warnings
+    """
+    options = "FORMAT JSON, VERBOSE, ANALYZE, BUFFERS, TIMING" if analyze else "FORMAT JSON, VERBOSE"
+    result = await _execute_sql(f"EXPLAIN ({options}) {query}", read_only=True, params=params, use_cache=False)
+    if not result["success"]:
+        return result
+
+    try:
+        explained = result["data"][0]
+        root = explained["Plan"]
+    except (KeyError, IndexError, TypeError):
+        return {"success": False, "error": f"Unexpected EXPLAIN output: {str(result['data'])[:200]}"}
+
+    nodes = flatten_plan(root)
+    summary = {
+        "total_cost": root.get("Total Cost"),
+        "plan_rows": root.get("Plan Rows"),
+        "planning_ms": explained.get("Planning Time"),
+        "execution_ms": explained.get("Execution Time"),
+        "actual_rows": nodes[0].get("actual_rows"),
+        "shared_hit_blocks": root.get("Shared Hit Blocks"),
+        "shared_read_blocks": root.get("Shared Read Blocks")
+    }
+
+    warnings = []
+    for node in nodes:
+        if node.get("misestimate", 1) >= EXPLAIN_MISESTIMATE:
+            warnings.append(
+                f"{node['node_type']} on {node['relation'] or node['index'] or '-'}: "
+                f"estimated {node['plan_rows']} rows, got {node['actual_rows']}"
+            )
+        if node["node_type"] == "Seq Scan" and node.get("rows_removed_by_filter", 0) > 1000:
+            warnings.append(f"Seq Scan on {node['relation']} discarded {node['rows_removed_by_filter']} rows by filter")
+
+    return {"success": True, "analyzed": analyze, "summary": summary, "nodes": nodes, "warnings": warnings}
+
+
+@mcp.tool
+async def top_queries(limit: int = 20, order_by: str = "total_time") -> dict:
+    """
+    List the most expensive queries recorded by pg_stat_statements.
+
+    Args:
+        limit: Number of queries to return (default 20)
+        order_by: total_time, mean_time, calls, rows or shared_blks_read (default total_time)
+
+    Returns:
+        Queries with calls, total/mean/max time (ms), rows and shared-buffer hit ratio
+    """
+    column = TOP_QUERIES_ORDER.get(order_by)
+    if column is None:
+        return {"success": False, "error": f"order_by must be one of {', '.join(TOP_QUERIES_ORDER)}"}
+
+    query = f"""
+    SELECT
+        queryid::text AS queryid,
+        left(query, 1000) AS query,
+        calls,
+        round(total_exec_time::numeric, 2) AS total_ms,
+        round(mean_exec_time::numeric, 2) AS mean_ms,
+        round(max_exec_time::numeric, 2) AS max_ms,
+        rows,
+        shared_blks_hit,
+        shared_blks_read,
+        round(100.0 * shared_blks_hit / nullif(shared_blks_hit + shared_blks_read, 0), 2) AS hit_ratio
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    ORDER BY {column} DESC
+    LIMIT $1::int
+    """
+    result = await _execute_sql(query, read_only=True, params=[limit])
+    if not result["success"] and "pg_stat_statements" in str(result.get("error")):
+        result["hint"] = "Enable the extension: CREATE EXTENSION IF NOT EXISTS pg_stat_statements"
+    return result
+
+
+INDEX_MIN_ROWS = 10000
+INDEX_REPORT_LIMIT = 20
+
+
+def _redundant_prefix(index: dict, indexes: list) -> dict | None:
+    """Another plain index on the same table whose leading columns are this one's."""
+    if index["is_unique"] or index["has_expressions"]:
+        return None
+    columns = index["columns"].split()
+    for other in indexes:
+        if other["table_name"] != index["table_name"] or other["has_expressions"]:
+            continue
+        other_columns = other["columns"].split()
+        if len(other_columns) > len(columns) and other_columns[:len(columns)] == columns:
+            return other
+    return None
+
+
+@mcp.tool
+async def index_report(schema: str = "public") -> dict:
+    """
+    Analyze table access and indexes of a schema to find where indexes are missing or wasted.
+
+    Combines seq-scan vs index-scan ratios, unused and duplicate indexes,
+    foreign keys without a supporting index and cache hit ratios, and ranks
+    tables by the likely benefit of a new index (rows read by sequential scans
+    on large tables). Counters are cumulative since the last statistics reset.
+
+    Args:
+        schema: Schema name (default: public)
+
+    Returns:
+        Index candidates, unused/duplicate indexes, unindexed foreign keys, per-table access stats
+    """
+    tables_query = """
+    SELECT
+        s.relname AS table_name,
+        s.n_live_tup AS rows,
+        s.seq_scan,
+        s.seq_tup_read,
+        coalesce(s.idx_scan, 0) AS idx_scan,
+        round(100.0 * coalesce(s.idx_scan, 0) / nullif(s.seq_scan + coalesce(s.idx_scan, 0), 0), 2) AS idx_scan_pct,
+        pg_total_relation_size(s.relid) AS total_bytes,
+        io.heap_blks_hit,
+        io.heap_blks_read,
+        coalesce(io.idx_blks_hit, 0) AS idx_blks_hit,
+        coalesce(io.idx_blks_read, 0) AS idx_blks_read
+    FROM pg_stat_user_tables s
+    JOIN pg_statio_user_tables io USING (relid)
+    WHERE s.schemaname = $1
+    """
+    indexes_query = """
+    SELECT
+        s.relname AS table_name,
+        s.indexrelname AS index_name,
+        s.idx_scan,
+        pg_relation_size(s.indexrelid) AS index_bytes,
+        i.indisunique AS is_unique,
+        i.indisprimary AS is_primary,
+        i.indexprs IS NOT NULL OR i.indpred IS NOT NULL AS has_expressions,
+        i.indkey::text AS columns,
+        i.indrelid::text || ' ' || i.indkey::text || ' ' || i.indclass::text || ' '
+            || coalesce(pg_get_expr(i.indexprs, i.indrelid), '') || ' '
+            || coalesce(pg_get_expr(i.indpred, i.indrelid), '') AS signature,
+        pg_get_indexdef(s.indexrelid) AS definition
+    FROM pg_stat_user_indexes s
+    JOIN pg_index i USING (indexrelid)
+    WHERE s.schemaname = $1
+    """
+    foreign_keys_query = """
+    SELECT
+        c.conrelid::regclass::text AS table_name,
+        c.conname AS constraint_name,
+        array_to_string(array(
+            SELECT a.attname
+            FROM unnest(c.conkey) WITH ORDINALITY AS k(attnum, ord)
+            JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = k.attnum
+            ORDER BY k.ord
+        ), ', ') AS columns,
+        c.confrelid::regclass::text AS references_table
+    FROM pg_constraint c
+    WHERE c.contype = 'f'
+        AND c.connamespace = $1::regnamespace
+        AND NOT EXISTS (
+            SELECT 1 FROM pg_index i
+            WHERE i.indrelid = c.conrelid
+                AND (string_to_array(i.indkey::text, ' ')::int2[])[1:array_length(c.conkey, 1)] @> c.conkey
+        )
+    """
+    results = await asyncio.gather(
+        _execute_sql(tables_query, read_only=True, params=[schema]),
+        _execute_sql(indexes_query, read_only=True, params=[schema]),
+        _execute_sql(foreign_keys_query, read_only=True, params=[schema])
+    )
+    for result in results:
+        if not result["success"]:
+            return result
+    tables, indexes, missing_fk = (result["data"] for result in results)
+
+    # Duplicates share table, columns, operator classes, expressions and predicate
+    by_signature = collections.defaultdict(list)
+    for index in indexes:
+        by_signature[index["signature"]].append(index)
+    duplicate_indexes = [
+        {"table_name": group[0]["table_name"], "indexes": [i["index_name"] for i in group],
+         "wasted_bytes": sum(i["index_bytes"] for i in group[1:])}
+        for group in by_signature.values() if len(group) > 1
+    ]
+    for index in indexes:
+        covering = _redundant_prefix(index, indexes)
+        if covering is not None:
+            duplicate_indexes.append({
+                "table_name": index["table_name"], "indexes": [index["index_name"], covering["index_name"]],
+                "wasted_bytes": index["index_bytes"], "reason": f"prefix of {covering['index_name']}"
+            })
+
+    unused_indexes = sorted(
+        ({"table_name": i["table_name"], "index_name": i["index_name"], "index_bytes": i["index_bytes"],
+          "definition": i["definition"]}
+         for i in indexes if i["idx_scan"] == 0 and not i["is_unique"] and not i["is_primary"]),
+        key=lambda i: i["index_bytes"], reverse=True
+    )
+
+    unindexed_fk_tables = {fk["table_name"].split(".")[-1].strip('"') for fk in missing_fk}
+    candidates = []
+    for table in tables:
+        if table["rows"] < INDEX_MIN_ROWS or not table["seq_scan"]:
+            continue
+        reasons = [f"{table['seq_scan']} seq scans read {table['seq_tup_read']} rows"]
+        if table["idx_scan_pct"] is not None:
+            reasons.append(f"{table['idx_scan_pct']}% of scans use an index")
+        if table["table_name"] in unindexed_fk_tables:
+            reasons.append("foreign key without index")
+        candidates.append({
+            "table_name": table["table_name"],
+            "rows": table["rows"],
+            "score": table["seq_tup_read"],
+            "reasons": reasons
+        })
+    candidates.sort(key=lambda c: c["score"], reverse=True)
+
+    def hit_ratio(hit: int, read: int):
+        return round(100.0 * hit / (hit + read), 2) if hit + read else None
+
+    cache_hit_ratio = {
+        "heap": hit_ratio(sum(t["heap_blks_hit"] or 0 for t in tables), sum(t["heap_blks_read"] or 0 for t in tables)),
+        "index": hit_ratio(sum(t["idx_blks_hit"] for t in tables), sum(t["idx_blks_read"] for t in tables))
+    }
+    # Results may come from the query cache: build new records rather than editing them
+    blocks = ("heap_blks_hit", "heap_blks_read", "idx_blks_hit", "idx_blks_read")
+    tables = [
+        {**{k: v for k, v in t.items() if k not in blocks},
+         "heap_hit_ratio": hit_ratio(t["heap_blks_hit"] or 0, t["heap_blks_read"] or 0),
+         "idx_hit_ratio": hit_ratio(t["idx_blks_hit"], t["idx_blks_read"])}
+        for t in tables
+    ]
+
+    return {
+        "success": True,
+        "schema": schema,
+        "index_candidates": candidates[:INDEX_REPORT_LIMIT],
+        "unused_indexes": unused_indexes,
+        "duplicate_indexes": duplicate_indexes,
+        "missing_fk_indexes": missing_fk,
+        "cache_hit_ratio": cache_hit_ratio,
+        "tables": sorted(tables, key=lambda t: t["seq_tup_read"], reverse=True)
+    }
+
+
+TUPLE_OVERHEAD = 28  # heap tuple header (23, aligned to 24) + line pointer (4)
+PAGE_HEADER = 24
+
+
+def quote_ident(name: str) -> str:
+    """Quote a SQL identifier (table, schema) for interpolation into a query."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+def sampled_count(percent: float, sample: dict) -> dict:
+    """
+    Row count estimate from a TABLESAMPLE SYSTEM sample, with a 95% confidence interval.
+
+    SYSTEM keeps each page with probability p, so the count is estimated as
+    sampled rows / p, with variance (1 - p) / p^2 * sum of squared rows per
+    sampled page (empty pages contribute nothing).
+    """
+    p = percent / 100
+    estimate = sample["sampled_rows"] / p
+    margin = 1.96 * math.sqrt((1 - p) * sample["sum_squares"]) / p
+    return {
+        "method": f"TABLESAMPLE SYSTEM ({percent}%)",
+        "sampled_pages": sample["sampled_pages"],
+        "sampled_rows": sample["sampled_rows"],
+        "estimate": round(estimate),
+        "ci95": [max(round(estimate - margin), sample["sampled_rows"]), round(estimate + margin)]
+    }
+
+
+@mcp.tool
+async def table_sizes(schema: str = "public", sample_table: str = None, sample_percent: float = 1.0) -> dict:
+    """
+    Get fast row estimates, sizes, bloat and maintenance status of the tables of a schema.
+
+    Row counts are planner estimates (reltuples scaled to the current number of
+    pages), never a full count. For a closer figure on one table, sample_table
+    counts a TABLESAMPLE SYSTEM sample of sample_percent of its pages and returns
+    an estimate with a 95% confidence interval. Bloat is estimated from average
+    row widths in pg_stats (tables never analyzed have no estimate).
+
+    Args:
+        schema: Schema name (default: public)
+        sample_table: Table to count by sampling (default: none)
+        sample_percent: Percentage of pages to sample, 0.01 to 100 (default: 1)
+
+    Returns:
+        Tables by total size with estimated rows, heap/index/TOAST sizes, dead tuples, bloat and vacuum/analyze times
+    """
+    query = """
+    SELECT
+        c.relname AS table_name,
+        c.reltuples::float8 AS reltuples,
+        c.relpages,
+        current_setting('block_size')::int AS block_size,
+        s.n_live_tup,
+        s.n_dead_tup,
+        pg_relation_size(c.oid) AS heap_bytes,
+        pg_indexes_size(c.oid) AS index_bytes,
+        coalesce(pg_total_relation_size(nullif(c.reltoastrelid, 0)), 0) AS toast_bytes,
+        pg_total_relation_size(c.oid) AS total_bytes,
+        w.row_width,
+        greatest(s.last_vacuum, s.last_autovacuum) AS last_vacuum,
+        greatest(s.last_analyze, s.last_autoanalyze) AS last_analyze
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid
+    LEFT JOIN (
+        SELECT tablename, sum(avg_width) AS row_width
+        FROM pg_stats
+        WHERE schemaname = $1
+        GROUP BY tablename
+    ) w ON w.tablename = c.relname
+    WHERE n.nspname = $1 AND c.relkind IN ('r', 'm', 'p')
+    ORDER BY pg_total_relation_size(c.oid) DESC
+    """
+    result = await _execute_sql(query, read_only=True, params=[schema])
+    if not result["success"]:
+        return result
+
+    tables = []
+    for row in result["data"]:
+        pages = row["heap_bytes"] / row["block_size"]
+        if row["reltuples"] >= 0 and row["relpages"] > 0:
+            # What the planner does: tuple density from the last ANALYZE times current pages
+            estimated_rows = round(row["reltuples"] / row["relpages"] * pages)
+        else:
+            estimated_rows = row["n_live_tup"]
+        live, dead = row["n_live_tup"] or 0, row["n_dead_tup"] or 0
+
+        bloat_bytes = bloat_pct = None
+        if row["row_width"] is not None and estimated_rows is not None and row["heap_bytes"]:
+            per_page = max((row["block_size"] - PAGE_HEADER) // (row["row_width"] + TUPLE_OVERHEAD), 1)
+            expected_bytes = math.ceil(estimated_rows / per_page) * row["block_size"]
+            bloat_bytes = max(row["heap_bytes"] - expected_bytes, 0)
+            bloat_pct = round(100.0 * bloat_bytes / row["heap_bytes"], 2)
+
+        tables.append({
+            "table_name": row["table_name"],
+            "estimated_rows": estimated_rows,
+            "n_live_tup": row["n_live_tup"],
+            "n_dead_tup": row["n_dead_tup"],
+            "dead_ratio": round(dead / (live + dead), 4) if live + dead else None,
+            "heap_bytes": row["heap_bytes"],
+            "index_bytes": row["index_bytes"],
+            "toast_bytes": row["toast_bytes"],
+            "total_bytes": row["total_bytes"],
+            "estimated_bloat_bytes": bloat_bytes,
+            "estimated_bloat_pct": bloat_pct,
+            "last_vacuum": row["last_vacuum"],
+            "last_analyze": row["last_analyze"]
+        })
+
+    response = {"success": True, "schema": schema, "tables": tables}
+    if sample_table:
+        row = next((r for r in result["data"] if r["table_name"] == sample_table), None)
+        if row is None:
+            return {"success": False, "error": f"Table {schema}.{sample_table} not found"}
+        if not 0 < sample_percent <= 100:
+            return {"success": False, "error": "sample_percent must be between 0 and 100"}
+        sample_query = f"""
+        SELECT
+            count(*) AS sampled_pages,
+            coalesce(sum(n), 0) AS sampled_rows,
+            coalesce(sum(n * n), 0) AS sum_squares
+        FROM (
+            SELECT count(*) AS n
+            FROM {quote_ident(schema)}.{quote_ident(sample_table)} TABLESAMPLE SYSTEM ($1::float8)
+            GROUP BY (ctid::text::point)[0]
+        ) pages
+        """
+        sample = await _execute_sql(sample_query, read_only=True, params=[sample_percent], use_cache=False)
+        if not sample["success"]:
+            return sample
+        response["sampled_count"] = {
+            "table_name": sample_table,
+            **sampled_count(sample_percent, sample["data"][0])
+        }
+    return response
+
+
+# Exports read EXPORT_CHUNK_ROWS rows per keyset page and upload each page as a
+# gzipped part object while the next page is read, so at most two chunks are in
+# memory. Parts are complete gzip members: concatenated in order they form one
+# valid .gz file (CSV header only in the first part). A failed or cancelled export
+# deletes the objects of its run, so no partial export is left without a manifest.
+EXPORT_CHUNK_ROWS = int(os.environ.get("EXPORT_CHUNK_ROWS", "5000"))
+EXPORT_CLEANUP_TIMEOUT = 30.0
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def encode_chunk(rows: list, columns: list, fmt: str, header: bool) -> bytes:
+    """Serialize rows as NDJSON or CSV, gzip-compressed."""
+    if fmt == "ndjson":
+        raw = b"".join(msgspec.json.encode(row) + b"\n" for row in rows)
+    else:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        if header:
+            writer.writerow(columns)
+        for row in rows:
+            writer.writerow([
+                msgspec.json.encode(v).decode() if isinstance(v, (dict, list, bool)) else v
+                for v in (row.get(c) for c in columns)
+            ])
+        raw = out.getvalue().encode()
+    return gzip.compress(raw, compresslevel=6)
+
+
+async def upload_object(bucket: str, path: str, content: bytes, content_type: str):
+    """Upload (or overwrite) a Storage object, raising ToolError on failure."""
+    async with http_client(timeout=60.0, idempotent=True) as client:
+        response = await client.post(
+            f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path}",
+            content=content,
+            headers={**get_headers(), "Content-Type": content_type, "x-upsert": "true"}
+        )
+    if response.status_code not in (200, 201):
+        raise ToolError(f"Upload of {path} failed: HTTP {response.status_code}: {response.text[:200]}")
+
+
+async def download_object(bucket: str, path: str) -> bytes | None:
+    """Download a Storage object, or None if it doesn't exist."""
+    async with http_client(timeout=30.0) as client:
+        response = await client.get(f"{SUPABASE_URL}/storage/v1/object/{bucket}/{path}", headers=get_headers())
+    if response.status_code == 200:
+        return response.content
+    # Storage answers 400 with a not_found error for missing objects
+    if response.status_code in (400, 404):
+        return None
+    raise ToolError(f"Download of {path} failed: HTTP {response.status_code}: {response.text[:200]}")
+
+
+async def delete_objects(bucket: str, paths: list):
+    """Delete Storage objects (missing ones are skipped), raising ToolError on failure."""
+    async with http_client(timeout=30.0, idempotent=True) as client:
+        response = await client.request(
+            "DELETE",
+            f"{SUPABASE_URL}/storage/v1/object/{bucket}",
+            json={"prefixes": paths},
+            headers=get_headers()
+        )
+    if response.status_code != 200:
+        raise ToolError(f"Deletion of {len(paths)} objects failed: HTTP {response.status_code}: {response.text[:200]}")
+
+
+@mcp.tool
+async def export_table(
+    table: str,
+    bucket: str,
+    ctx: Context,
+    format: str = "ndjson",
+    where: str = None,
+    schema: str = "public",
+    key: list[str] | None = None,
+    watermark_column: str = None,
+    path: str = "exports"
+) -> dict:
+    """
+    Export a table to Supabase Storage as gzipped NDJSON or CSV parts.
+
+    Rows are read in primary-key order with keyset pagination and uploaded
+    chunk by chunk under <path>/<schema>.<table>/<run>/, with a manifest.json
+    listing the parts. Progress is reported after each part. With
+    watermark_column, rows are read in (watermark_column, key) order and only
+    those after the position stored by the previous export (and up to the
+    current maximum) are exported; the last exported (value, key) is stored in
+    <path>/<schema>.<table>/watermark.json, so rows sharing the previous
+    maximum value but written after it are not skipped.
+
+    Args:
+        table: Table name
+        bucket: Destination storage bucket
+        format: ndjson or csv (default: ndjson)
+        where: Optional SQL filter on the rows (e.g. "status = 'active'")
+        schema: Schema name (default: public)
+        key: Columns to paginate on, unique together (default: primary key)
+        watermark_column: Column (e.g. updated_at) enabling incremental exports
+        path: Prefix of the export objects in the bucket (default: exports)
+
+    Returns:
+        Manifest path, parts, exported row count, compressed bytes and watermark
+    """
+    if format not in EXPORT_FORMATS:
+        return {"success": False, "error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}
+
+    columns_query = """
+    SELECT
+        a.attname AS column_name,
+        format_type(a.atttypid, a.atttypmod) AS column_type,
+        coalesce(array_position(string_to_array(i.indkey::text, ' ')::int2[], a.attnum), 0) AS key_position,
+        c.reltuples::float8 AS reltuples
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    LEFT JOIN pg_index i ON i.indrelid = c.oid AND i.indisprimary
+    WHERE n.nspname = $1 AND c.relname = $2 AND a.attnum > 0 AND NOT a.attisdropped
+    ORDER BY a.attnum
+    """
+    result = await _execute_sql(columns_query, read_only=True, params=[schema, table], use_cache=False)
+    if not result["success"]:
+        return result
+    if not result["data"]:
+        return {"success": False, "error": f"Table {schema}.{table} not found"}
+
+    types = {c["column_name"]: c["column_type"] for c in result["data"]}
+    columns = list(types)
+    if key is None:
+        key = [c["column_name"] for c in sorted(result["data"], key=lambda c: c["key_position"]) if c["key_position"]]
+    if not key:
+        return {"success": False, "error": f"{schema}.{table} has no primary key: pass key columns"}
+    unknown = [c for c in key + ([watermark_column] if watermark_column else []) if c not in types]
+    if unknown:
+        return {"success": False, "error": f"Unknown columns: {', '.join(unknown)}"}
+    if len(key) > SQL_MAX_PARAMS - 2:
+        return {"success": False, "error": f"At most {SQL_MAX_PARAMS - 2} key columns are supported"}
+
+    qualified = f"{quote_ident(schema)}.{quote_ident(table)}"
+    prefix = f"{path.strip('/')}/{schema}.{table}"
+    filters, filter_params = [f"({where})"] if where else [], []
+
+    order_columns = list(key)
+    last = None
+    watermark = None
+    if watermark_column:
+        column = quote_ident(watermark_column)
+        bounds = await _execute_sql(
+            f"SELECT max({column})::text AS value FROM {qualified}" + (f" WHERE ({where})" if where else ""),
+            read_only=True, use_cache=False
+        )
+        if not bounds["success"]:
+            return bounds
+        try:
+            stored = await download_object(bucket, f"{prefix}/watermark.json")
+        except ToolError as e:
+            return {"success": False, "error": str(e)}
+        stored = msgspec.json.decode(stored) if stored else {}
+        previous = stored.get("value")
+        watermark = {"column": watermark_column, "from": previous, "to": bounds["data"][0]["value"]}
+        if watermark["to"] is None:
+            return {"success": True, "rows": 0, "parts": [], "watermark": watermark}
+        # Rows changed after this snapshot of the maximum go to the next export
+        filter_params.append(watermark["to"])
+        filters.append(f"{column} <= ${len(filter_params)}::{types[watermark_column]}")
+        order_columns = [watermark_column] + [k for k in key if k != watermark_column]
+        if stored.get("key") is not None:
+            # Resume right after the last exported row, as the pages do
+            last = {watermark_column: previous, **stored["key"]}
+        elif previous is not None:
+            # Watermark stored before keys were: only the value is known
+            filter_params.append(previous)
+            filters.append(f"{column} > ${len(filter_params)}::{types[watermark_column]}")
+
+    order = ", ".join(quote_ident(k) for k in order_columns)
+    run = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+    estimate = max(int(result["data"][0]["reltuples"]), 0) or None
+    manifest_path = f"{prefix}/{run}/manifest.json"
+    parts = []
+    rows = 0
+    upload = None
+    try:
+        while True:
+            conditions, params = list(filters), list(filter_params)
+            if last is not None:
+                placeholders = []
+                for k in order_columns:
+                    params.append(last[k])
+                    placeholders.append(f"${len(params)}::{types[k]}")
+                conditions.append(f"({order}) > ({', '.join(placeholders)})")
+            page_query = (
+                f"SELECT * FROM {qualified}"
+                + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+                + f" ORDER BY {order} LIMIT {EXPORT_CHUNK_ROWS}"
+            )
+            page = await _execute_sql(page_query, read_only=True, params=params or None, use_cache=False)
+            if not page["success"]:
+                raise ToolError(f"Reading {schema}.{table} failed: {page['error']}")
+            if not page["data"]:
+                break
+
+            content = await asyncio.to_thread(encode_chunk, page["data"], columns, format, not parts)
+            part = {"path": f"{prefix}/{run}/part-{len(parts) + 1:05d}.{format}.gz", "rows": len(page["data"]), "bytes": len(content)}
+            if upload is not None:
+                await upload
+            upload = asyncio.create_task(upload_object(bucket, part["path"], content, "application/gzip"))
+            parts.append(part)
+            rows += len(page["data"])
+            last = page["data"][-1]
+            await ctx.report_progress(progress=rows, total=estimate, message=f"{len(parts)} parts, {rows} rows")
+            if len(page["data"]) < EXPORT_CHUNK_ROWS:
+                break
+        if upload is not None:
+            await upload
+        if watermark is not None and not parts:
+            return {"success": True, "rows": 0, "parts": [], "watermark": watermark}
+
+        manifest = {
+            "schema": schema,
+            "table": table,
+            "format": format,
+            "content_type": EXPORT_FORMATS[format],
+            "compression": "gzip",
+            "columns": columns,
+            "key": key,
+            "where": where,
+            "watermark": watermark,
+            "rows": rows,
+            "bytes": sum(p["bytes"] for p in parts),
+            "parts": parts
+        }
+        await upload_object(bucket, manifest_path, msgspec.json.encode(manifest), "application/json")
+        if watermark is not None:
+            position = {"value": last[watermark_column], "key": {k: last[k] for k in key if k != watermark_column}}
+            await upload_object(bucket, f"{prefix}/watermark.json", msgspec.json.encode(position), "application/json")
+    except BaseException as e:
+        # Whatever stopped the export (error, deadline, disconnect), the pending upload
+        # is stopped and the run's objects are deleted, shielded from the cancellation
+        orphans = [p["path"] for p in parts]
+        with anyio.move_on_after(EXPORT_CLEANUP_TIMEOUT, shield=True):
+            if upload is not None:
+                upload.cancel()
+                await asyncio.gather(upload, return_exceptions=True)
+            try:
+                await delete_objects(bucket, orphans + [manifest_path])
+                orphans = []
+            except (ToolError, httpx.HTTPError):
+                pass
+        if not isinstance(e, (ToolError, httpx.HTTPError)):
+            raise
+        failure = {"success": False, "error": str(e) or type(e).__name__, "rows": rows, "parts": len(parts)}
+        if orphans:
+            failure["orphaned_parts"] = orphans
+        return failure
+
+    return {
+        "success": True,
+        "manifest": manifest_path,
+        "rows": rows,
+        "bytes": manifest["bytes"],
+        "parts": len(parts),
+        "watermark": watermark
+    }
 
 
-def create_authenticated_app():
-    """Wrap FastMCP app with Basic Auth middleware."""
-    mcp_app = mcp.http_app(path="/mcp")
-    return BasicAuthMiddleware(mcp_app)
+def health() -> dict:
+    """Service entries of the / health body."""
+    return {"sql_cache": query_cache.snapshot()}
 
 
-# For uvicorn: uvicorn server:app --host 0.0.0.0 --port 8080
-app = create_authenticated_app()
+app = create_authenticated_app(mcp, warmup, health)
@@ -0,0 +1,78 @@
+import os
+import sys
+import importlib.util
+
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "common"))
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+import runtime  # noqa: E402
+
+_servers = {}
+
+
+@pytest.fixture(scope="session")
+def load_server():
+    """Import <service>/server.py as a standalone module (once per session)."""
+    def load(service: str):
+        if service not in _servers:
+            spec = importlib.util.spec_from_file_location(f"{service}_server", os.path.join(ROOT, service, "server.py"))
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            _servers[service] = module
+        return _servers[service]
+    return load
+
+
+class RecordingContext:
+    """Stands in for the fastmcp Context of a tool: keeps the progress notifications."""
+
+    def __init__(self):
+        self.progress = []
+
+    async def report_progress(self, progress, total, message=None):
+        self.progress.append((progress, total, message))
+
+
+@pytest.fixture
+def ctx():
+    return RecordingContext()
+
+
+@pytest.fixture
+def mock_upstream(monkeypatch):
+    """Send a server's upstream calls to a handler (or transport) through the real runtime client.
+
+    The runtime layers (retries, breakers, deadlines) stay in place: only the
+    connection pool under them is replaced.
+    """
+    def route(server, handler):
+        transport = handler if isinstance(handler, httpx.AsyncBaseTransport) else httpx.MockTransport(handler)
+
+        def client(timeout, idempotent=None, *args, **kwargs):
+            return runtime.http_client(timeout, idempotent, transport=transport)
+        monkeypatch.setattr(server, "http_client", client)
+        return transport
+    return route
+
+
+@pytest.fixture
+def mock_app(monkeypatch):
+    """bench/mock_upstreams as an ASGI transport, without its simulated latencies."""
+    import mock_upstreams
+
+    async def simulate(upstream):
+        return None
+    monkeypatch.setattr(mock_upstreams, "simulate", simulate)
+    return httpx.ASGITransport(app=mock_upstreams.app)
+
+
+@pytest.fixture(scope="session")
+def call_tool():
+    """Call the function behind a tool (a FunctionTool under fastmcp 2.x); returns its coroutine."""
+    def call(tool, *args, **kwargs):
+        return getattr(tool, "fn", tool)(*args, **kwargs)
+    return call
@@ -0,0 +1,99 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+import runtime
+
+
+def test_gate_hands_slots_over_in_arrival_order():
+    gate = runtime.AdmissionGate(1)
+    order = []
+
+    async def call(name: str):
+        await gate.acquire()
+        order.append(name)
+        await asyncio.sleep(0)
+        gate.release()
+
+    async def scenario():
+        assert gate.try_acquire()
+        tasks = [asyncio.ensure_future(call(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        # A newcomer may not jump the queue while others wait
+        assert not gate.try_acquire()
+        gate.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["a", "b", "c"] and gate.inflight == 0
+
+
+def test_cancelled_waiter_racing_release():
+    gate = runtime.AdmissionGate(1)
+
+    async def scenario():
+        assert gate.try_acquire()
+        waiter = asyncio.ensure_future(gate.acquire())
+        await asyncio.sleep(0)
+        # Cancelled, then dropped by release() before it runs its cleanup
+        waiter.cancel()
+        gate.release()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+    asyncio.run(scenario())
+    assert gate.inflight == 0 and not gate._waiters
+
+
+@pytest.fixture
+def admission(monkeypatch):
+    monkeypatch.setattr(runtime, "ADMISSION_MAX_INFLIGHT", 10)
+    monkeypatch.setattr(runtime, "ADMISSION_TOOL_LIMITS", {"slow": 1})
+    monkeypatch.setattr(runtime, "ADMISSION_QUEUE_TIMEOUT", 0.1)
+    monkeypatch.setattr(runtime, "ADMISSION_QUEUE_SIZE", 1)
+    controller = runtime.AdmissionController()
+    monkeypatch.setattr(runtime, "admission", controller)
+    return controller
+
+
+def tool_call(client: httpx.AsyncClient, tool: str):
+    body = {"jsonrpc": "2.0", "id": 1, "method": "tools/call", "params": {"name": tool, "arguments": {}}}
+    return client.post("/mcp", content=json.dumps(body))
+
+
+def test_middleware_queues_then_rejects_with_503(admission):
+    release = asyncio.Event()
+
+    async def app(scope, receive, send):
+        await receive()
+        await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=runtime.AdmissionMiddleware(app))
+        async with httpx.AsyncClient(transport=transport, base_url="http://mcp") as client:
+            running = asyncio.ensure_future(tool_call(client, "slow"))
+            await asyncio.sleep(0.01)
+            queued = asyncio.ensure_future(tool_call(client, "slow"))
+            await asyncio.sleep(0.01)
+            # The queue holds one call: the next one is turned away at once
+            overflow = await tool_call(client, "slow")
+            assert overflow.status_code == 503 and overflow.headers["retry-after"] == "1"
+            assert overflow.json()["error"]["code"] == -32000
+
+            # The queued call times out waiting for the slot
+            timed_out = await queued
+            assert timed_out.status_code == 503
+
+            # Other tools are not held back by the saturated one
+            other = asyncio.ensure_future(tool_call(client, "fast"))
+            release.set()
+            assert (await running).status_code == 200
+            assert (await other).status_code == 200
+
+    asyncio.run(scenario())
+    assert admission.rejected == 2 and admission.admitted == 2
+    assert admission.server.inflight == 0 and admission.gate_for("slow").inflight == 0
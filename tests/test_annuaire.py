@@ -0,0 +1,207 @@
+import asyncio
+
+import httpx
+import pytest
+
+import mock_upstreams
+import runtime
+
+
+@pytest.fixture
+def server(load_server, monkeypatch, mock_upstream, mock_app):
+    server = load_server("annuaire")
+    monkeypatch.setitem(mock_upstreams.PROFILE["annuaire"], "results", 25)
+    monkeypatch.setattr(server, "ANNUAIRE_API_URL", "http://mock")
+    mock_upstream(server, mock_app)
+    return server
+
+
+def test_recherche_all_caps_the_returned_results(server, call_tool, ctx):
+    summary = asyncio.run(call_tool(server.annuaire_recherche_all, ctx, query="boulangerie", max_results=600))
+
+    assert summary["emitted"] == 600 and summary["truncated"]
+    assert len(summary["results"]) == server.ANNUAIRE_MAX_RETURNED
+    # Everything still went out in the progress notifications
+    assert ctx.progress[-1][0] == 600
+
+    summary = asyncio.run(call_tool(server.annuaire_recherche_all, ctx, query="boulangerie", max_results=40))
+    assert len(summary["results"]) == 40 and not summary["truncated"]
+
+
+class FailingPage(httpx.AsyncBaseTransport):
+    """The mock API, except that one page drops its connection."""
+
+    def __init__(self, app: httpx.AsyncBaseTransport, page: str):
+        self.app = app
+        self.page = page
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.params.get("page") == self.page:
+            raise httpx.ReadError("connection reset")
+        return await self.app.handle_async_request(request)
+
+
+def test_recherche_all_keeps_the_pages_before_a_failed_one(server, monkeypatch, mock_upstream, mock_app, call_tool, ctx):
+    monkeypatch.setattr(runtime, "RETRY_ATTEMPTS", 1)
+    mock_upstream(server, FailingPage(mock_app, "3"))
+
+    summary = asyncio.run(call_tool(server.annuaire_recherche_all, ctx, query="boulangerie", max_results=200))
+
+    assert summary["error"] == "connection reset"
+    assert summary["pages_done"] == 2 and summary["emitted"] == 50
+    assert len(summary["results_so_far"]) == 50
+
+
+def test_recherche_clamps_per_page(server, mock_upstream, call_tool):
+    sent = []
+
+    def answer(request: httpx.Request) -> httpx.Response:
+        sent.append(request.url.params["per_page"])
+        return httpx.Response(200, json={"results": [], "total_results": 0, "page": 1, "total_pages": 1})
+    mock_upstream(server, answer)
+
+    asyncio.run(call_tool(server.annuaire_recherche, "boulangerie", per_page=100))
+    asyncio.run(call_tool(server.annuaire_recherche, "boulangerie", per_page=0))
+    assert sent == ["25", "1"]
+
+
+def test_invalid_search_arguments_return_an_error(server, call_tool, ctx):
+    assert asyncio.run(call_tool(server.annuaire_recherche)) == {"error": "Préciser une requête ou au moins un filtre"}
+    unknown = asyncio.run(call_tool(server.annuaire_recherche, "boulangerie", include=["siege", "bilan"]))
+    assert unknown["error"].startswith("include inconnu: bilan")
+    assert "error" in asyncio.run(call_tool(server.annuaire_recherche_all, ctx))
+    assert not ctx.progress
+
+
+def test_batch_priority_clients_are_not_hedged(load_server):
+    server = load_server("annuaire")
+    hedger = server.Hedger("annuaire-test")
+
+    async def transports():
+        async with server.http_client(10.0, hedger=hedger) as interactive:
+            with server.request_priority(server.PRIORITY_BATCH):
+                async with server.http_client(10.0, hedger=hedger) as batch:
+                    return type(interactive._transport), type(batch._transport)
+
+    assert asyncio.run(transports()) == (runtime.HedgingTransport, runtime.ResilientTransport)
+
+
+def company(siren, nom, activite="70.10Z", effectif="NN", etat="A", adresse=None, dirigeants=()):
+    return {
+        "siren": siren, "nom_complet": nom, "nom_raison_sociale": nom, "activite_principale": activite,
+        "tranche_effectif_salarie": effectif, "etat_administratif": etat,
+        "siege": {"adresse": adresse or f"{siren} RUE DU TEST", "code_postal": "75001"},
+        "dirigeants": list(dirigeants)
+    }
+
+
+def morale(siren):
+    return {"type_dirigeant": "personne morale", "siren": siren, "qualite": "Président"}
+
+
+def physique(nom, prenoms, naissance):
+    return {"type_dirigeant": "personne physique", "nom": nom, "prenoms": prenoms, "date_de_naissance": naissance}
+
+
+DUPONT = physique("DUPONT", "Jean Marie", "1970-01")
+GROUP = {
+    "parent": company("500000005", "PARENT", "64.20Z"),
+    "holding": company("100000001", "HOLDING H", "64.20Z", adresse="1 RUE DE LA PAIX", dirigeants=[morale("500000005"), DUPONT]),
+    "filiale_12": company("200000002", "FILIALE UN", effectif="12", dirigeants=[morale("100000001")]),
+    "filiale_21": company("200000003", "FILIALE DEUX", effectif="21", dirigeants=[morale("100000001")]),
+    "fermee": company("200000004", "FILIALE FERMEE", effectif="41", etat="C", dirigeants=[morale("100000001")]),
+    "sans_lien": company("200000005", "HOLDING H IMMO", effectif="41"),
+    "associe": company("300000003", "DUPONT CONSEIL", effectif="21", dirigeants=[physique("DUPONT", "Jean", "1970-01")]),
+    "homonyme": company("400000004", "AUTRE DUPONT", effectif="31", dirigeants=[physique("DUPONT", "Jean", "1985-06")]),
+}
+
+
+def group_search(request: httpx.Request) -> httpx.Response:
+    params = request.url.params
+    by_siren = {c["siren"]: c for c in GROUP.values()}
+    if params.get("q") == "1 RUE DE LA PAIX":
+        raise httpx.ConnectError("connection refused")
+    if params.get("q") in by_siren:
+        results = [by_siren[params["q"]]]
+    elif params.get("q") == "HOLDING H":
+        results = [GROUP[k] for k in ("filiale_12", "filiale_21", "fermee", "sans_lien")]
+    elif params.get("nom_personne") == "DUPONT":
+        results = [GROUP[k] for k in ("holding", "associe", "homonyme")]
+    else:
+        results = []
+    return httpx.Response(200, json={"results": results, "total_results": len(results), "page": 1, "total_pages": 1})
+
+
+def test_resolve_group_ranks_the_linked_operating_entities(load_server, monkeypatch, mock_upstream, call_tool):
+    server = load_server("annuaire")
+    monkeypatch.setattr(server, "ANNUAIRE_API_URL", "http://group.test")
+    monkeypatch.setattr(runtime, "RETRY_ATTEMPTS", 1)
+    mock_upstream(server, group_search)
+
+    result = asyncio.run(call_tool(server.resolve_group, "100000001"))
+
+    assert result["is_holding"]
+    # Headcount first, then the strongest link; the namesake born elsewhen, the closed
+    # company, the holding parent and the name match without a director link are out
+    assert [c["siren"] for c in result["candidates"]] == ["200000003", "300000003", "200000002"]
+    assert result["operating_entity"]["relations"] == [{"type": "filiale", "detail": "dirigée par 100000001"}]
+    assert result["candidates"][1]["relations"][0]["type"] == "dirigeant_commun"
+    # The failed address lookup only pruned its branch
+    assert result["group"]["errors"] == 1
+    assert result["group"]["error_details"][0]["error"] == "connection refused"
+
+
+def test_resolve_group_reports_an_unreachable_annuaire(load_server, monkeypatch, mock_upstream, call_tool):
+    server = load_server("annuaire")
+    monkeypatch.setattr(server, "ANNUAIRE_API_URL", "http://group-down.test")
+    monkeypatch.setattr(runtime, "RETRY_ATTEMPTS", 1)
+
+    def down(request):
+        raise httpx.ConnectError("connection refused")
+    mock_upstream(server, down)
+
+    result = asyncio.run(call_tool(server.resolve_group, "100000001"))
+    assert result["error"] == "Annuaire indisponible" and len(result["details"]) == 1
+
+
+def test_governor_serves_interactive_waiters_before_batch_ones(server):
+    governor = server.RateGovernor(100)
+    governor.tokens = 0.0
+    order = []
+
+    async def acquire(name, priority):
+        await governor.acquire(priority)
+        order.append(name)
+
+    async def scenario():
+        await asyncio.gather(
+            acquire("batch-1", server.PRIORITY_BATCH),
+            acquire("batch-2", server.PRIORITY_BATCH),
+            acquire("interactive-1", server.PRIORITY_INTERACTIVE),
+            acquire("interactive-2", server.PRIORITY_INTERACTIVE)
+        )
+
+    asyncio.run(scenario())
+    assert order == ["interactive-1", "interactive-2", "batch-1", "batch-2"]
+    assert governor.snapshot()["granted"] == 4 and governor.waiters == []
+
+
+def test_governor_halves_its_rate_on_429_and_recovers_additively(server, monkeypatch):
+    monkeypatch.setattr(server, "ANNUAIRE_RATE_STEP", 1.0)
+    governor = server.RateGovernor(8)
+
+    governor.observe(429, "2")
+    snapshot = governor.snapshot()
+    assert governor.rate == 4 and governor.tokens == 0
+    assert snapshot["throttled_429"] == 1 and 1.5 < snapshot["paused_for_s"] <= 2
+
+    # Server errors say nothing about the rate limit
+    governor.observe(503)
+    assert governor.rate == 4
+    for _ in range(6):
+        governor.observe(200)
+    assert governor.rate == governor.max_rate == 8
+
+    for _ in range(10):
+        governor.observe(429)
+    assert governor.rate == server.ANNUAIRE_RATE_MIN
@@ -0,0 +1,93 @@
+import asyncio
+import zlib
+
+import brotli
+import pytest
+import zstandard
+
+import runtime
+
+DECOMPRESSORS = {
+    "gzip": lambda: zlib.decompressobj(31).decompress,
+    "br": lambda: brotli.Decompressor().process,
+    "zstd": lambda: zstandard.ZstdDecompressor().decompressobj().decompress,
+}
+
+
+def respond(content_type: bytes, chunks: list, headers: list = ()):
+    """ASGI app answering 200 with the given body chunks (more_body on all but the last)."""
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [(b"content-type", content_type), *headers]
+        })
+        for i, chunk in enumerate(chunks):
+            await send({"type": "http.response.body", "body": chunk, "more_body": i < len(chunks) - 1})
+    return app
+
+
+def serve(app, accept_encoding: str, on_body=None) -> tuple:
+    """(response headers, body messages) of one request through CompressionMiddleware."""
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+        if on_body is not None and message["type"] == "http.response.body":
+            on_body(message["body"])
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", accept_encoding.encode())]}
+    asyncio.run(runtime.CompressionMiddleware(app)(scope, receive, send))
+    return dict(messages[0]["headers"]), [m["body"] for m in messages[1:]]
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, br;q=0.5", "gzip"),
+    ("br, gzip", "br"),
+    ("gzip, br, zstd", "zstd"),
+    ("*;q=0.1, gzip", "gzip"),
+    ("identity", None),
+    ("gzip;q=0, br;q=0", None),
+])
+def test_negotiates_the_best_accepted_encoding(accept, expected):
+    assert runtime.negotiate_encoding(accept) == expected
+
+
+def test_compresses_bodies_from_the_size_threshold():
+    small = b'{"ok": true}'
+    headers, bodies = serve(respond(b"application/json", [small]), "gzip")
+    assert b"content-encoding" not in headers and bodies == [small]
+
+    large = b'{"rows": [%s]}' % b", ".join(b'{"siren": "123456789"}' for _ in range(100))
+    assert len(large) >= runtime.COMPRESS_MIN_SIZE
+    headers, bodies = serve(respond(b"application/json", [large]), "gzip")
+    assert headers[b"content-encoding"] == b"gzip" and headers[b"vary"] == b"Accept-Encoding"
+    assert int(headers[b"content-length"]) == len(bodies[0]) < len(large)
+    assert zlib.decompress(bodies[0], 31) == large
+
+
+@pytest.mark.parametrize("content_type, headers", [
+    (b"image/png", []),
+    (b"application/json", [(b"content-encoding", b"br")]),
+])
+def test_passes_through_encoded_and_binary_bodies(content_type, headers):
+    body = bytes(range(256)) * 8
+    response_headers, bodies = serve(respond(content_type, [body], headers), "gzip, br, zstd")
+    assert response_headers.get(b"content-encoding") == dict(headers).get(b"content-encoding")
+    assert bodies == [body]
+
+
+@pytest.mark.parametrize("encoding", sorted(DECOMPRESSORS))
+def test_flushes_every_sse_event(encoding):
+    events = [b"event: message\ndata: {\"n\": %d}\n\n" % i for i in range(3)]
+    decompress = DECOMPRESSORS[encoding]()
+    decoded = []
+
+    headers, _ = serve(respond(b"text/event-stream", events), encoding, lambda body: decoded.append(decompress(body)))
+
+    assert headers[b"content-encoding"] == encoding.encode() and b"content-length" not in headers
+    # Each event decodes from its own chunk, without waiting for the next one
+    assert decoded == events
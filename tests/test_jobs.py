@@ -0,0 +1,25 @@
+import asyncio
+
+import httpx
+
+import runtime
+
+
+def test_submitted_job_runs_to_completion(load_server, monkeypatch, mock_upstream, call_tool):
+    server = load_server("linkedin")
+    profile = {"profile": {"name": "Jane Doe", "company": "Acme", "headline": "CEO"}}
+    mock_upstream(server, lambda request: httpx.Response(200, json=profile))
+    runner = runtime.JobRunner(workers=1, queue_size=10, store_size=10)
+    monkeypatch.setattr(server, "job_runner", runner)
+    monkeypatch.setattr(runtime, "job_runner", runner)
+
+    async def scenario():
+        job = await call_tool(server.submit_linkedin_profile, "https://www.linkedin.com/in/jane-doe")
+        assert job["status"] == "queued"
+        await asyncio.wait_for(server.job_runner.get(job["job_id"]).finished.wait(), 5)
+        # get_job is registered on the server from the shared runtime
+        return await call_tool(await server.mcp.get_tool("get_job"), job["job_id"])
+
+    job = asyncio.run(scenario())
+    assert job["status"] == "done", job.get("error")
+    assert job["result"]["name"] == "Jane Doe" and job["result"]["headline"] == "CEO"
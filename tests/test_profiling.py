@@ -0,0 +1,96 @@
+import asyncio
+import threading
+import tracemalloc
+
+import httpx
+import pytest
+
+import runtime
+
+AUTH = (runtime.AUTH_USERNAME, runtime.AUTH_PASSWORD)
+
+
+async def passthrough(scope, receive, send):
+    await send({"type": "http.response.start", "status": 204, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def get(app, *paths, auth=None) -> list:
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://mcp", auth=auth) as client:
+            return [await client.get(path) for path in paths]
+    return asyncio.run(run())
+
+
+@pytest.fixture
+def profiling():
+    yield runtime.ProfilingMiddleware(passthrough, None)
+    tracemalloc.stop()
+
+
+class Leak:
+    pass
+
+
+def test_memory_diffs_against_the_previous_call(profiling, monkeypatch):
+    monkeypatch.setattr(runtime, "profiler", runtime.Profiler())
+    leaked = []
+
+    first, = get(profiling, "/admin/memory")
+    assert first.json()["tracing"] and first.json()["top"] == []
+    leaked.extend(bytearray(1024) for _ in range(1000))
+    second, stopped = get(profiling, "/admin/memory?top=5", "/admin/memory?stop=1")
+
+    top = second.json()["top"]
+    assert len(top) == 5 and top[0]["size_diff"] >= 1024 * 1000
+    assert stopped.json() == {"tracing": False} and not tracemalloc.is_tracing()
+
+
+def test_objects_report_growth_and_mcp_sessions(profiling, monkeypatch):
+    monkeypatch.setattr(runtime, "profiler", runtime.Profiler())
+    leaked = []
+
+    get(profiling, "/admin/objects")
+    leaked.extend(Leak() for _ in range(500))
+    body = get(profiling, "/admin/objects?top=50")[0].json()
+
+    growth = {entry["type"]: entry["diff"] for entry in body["growth"]}
+    assert growth[f"{__name__}.Leak"] == 500
+    assert set(body["mcp_sessions"]["objects"]) == set(runtime.MCP_SESSION_TYPES)
+
+
+def test_cpu_profile_is_collapsed_stacks(profiling):
+    stop = threading.Event()
+    worker = threading.Thread(target=stop.wait, name="busy-worker")
+    worker.start()
+    try:
+        response, = get(profiling, "/admin/cpu?seconds=0.05&hz=200")
+    finally:
+        stop.set()
+        worker.join()
+
+    assert response.headers["content-type"].startswith("text/plain")
+    lines = response.text.splitlines()
+    assert any(line.startswith("busy-worker;") for line in lines)
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+
+
+def test_bad_arguments_unknown_endpoints_and_other_paths(profiling):
+    bad_hz, bad_top, unknown, other = get(profiling, "/admin/cpu?hz=0", "/admin/objects?top=x", "/admin/nope", "/mcp")
+    assert (bad_hz.status_code, bad_top.status_code, unknown.status_code) == (400, 400, 404)
+    assert other.status_code == 204
+
+
+def test_endpoints_are_mounted_behind_basic_auth_only_when_enabled(load_server, monkeypatch):
+    mcp = load_server("rdap").mcp
+    monkeypatch.setattr(runtime, "PROFILING_ENABLED", True)
+    app = runtime.create_authenticated_app(mcp, runtime.Warmup([]))
+
+    anonymous, = get(app, "/admin/objects")
+    authenticated, = get(app, "/admin/objects", auth=AUTH)
+    assert anonymous.status_code == 401
+    assert authenticated.status_code == 200 and "mcp_sessions" in authenticated.json()
+
+    monkeypatch.setattr(runtime, "PROFILING_ENABLED", False)
+    disabled, = get(runtime.create_authenticated_app(mcp, runtime.Warmup([])), "/admin/objects", auth=AUTH)
+    assert disabled.status_code == 404
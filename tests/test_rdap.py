@@ -0,0 +1,71 @@
+import asyncio
+
+import httpx
+
+import runtime
+
+
+def test_batch_isolates_bad_bodies_and_throttles_per_registry(load_server, monkeypatch, mock_upstream, call_tool, ctx):
+    server = load_server("rdap")
+    calls = []
+
+    def answer(request: httpx.Request) -> httpx.Response:
+        domain = request.url.params["domain"]
+        calls.append(domain)
+        if domain == "throttled.fr" and calls.count(domain) == 1:
+            return httpx.Response(429, headers={"Retry-After": "0"})
+        if domain == "broken.fr":
+            return httpx.Response(200, content=b'{"registrar": ["not", "a", "string"]}')
+        return httpx.Response(200, json={"registrar": f"Registrar of {domain}"})
+
+    monkeypatch.setattr(server, "registry_limiters", {})
+    mock_upstream(server, answer)
+
+    summary = asyncio.run(call_tool(server.rdap_whois_batch, ["https://www.Throttled.fr/", "broken.fr", "example.com"], ctx))
+
+    assert (summary["succeeded"], summary["failed"]) == (2, 1)
+    assert summary["results"][0]["registrar"] == "Registrar of throttled.fr"
+    assert "error" in summary["results"][1]
+    # The 429 went through the registry limiter, not a client-side retry
+    assert calls.count("throttled.fr") == 2
+    assert server.registry_limiters["afnic"].snapshot() == {"requests": 3, "throttled_429": 1}
+    assert server.registry_limiters["verisign"].snapshot() == {"requests": 1, "throttled_429": 0}
+    assert "rdap:afnic" in runtime.breakers and "rdap:verisign" in runtime.breakers
+
+
+def test_batch_retries_5xx_and_dropped_connections_after_a_backoff(load_server, monkeypatch, mock_upstream, call_tool, ctx):
+    server = load_server("rdap")
+    outcomes = {"flaky.fr": [503, httpx.ReadError("reset"), 200], "down.fr": [503, 502, 500]}
+    delays = []
+
+    def answer(request: httpx.Request) -> httpx.Response:
+        domain = request.url.params["domain"]
+        outcome = outcomes[domain].pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, json={"registrar": f"Registrar of {domain}"})
+
+    def backoff(attempt, response=None):
+        delays.append((attempt, response.status_code if response is not None else 0))
+        return 0.0
+
+    monkeypatch.setattr(server, "registry_limiters", {})
+    monkeypatch.setattr(server, "backoff", backoff)
+    mock_upstream(server, answer)
+
+    summary = asyncio.run(call_tool(server.rdap_whois_batch, ["flaky.fr", "down.fr"], ctx))
+
+    assert summary["results"][0]["registrar"] == "Registrar of flaky.fr"
+    assert "error" in summary["results"][1]
+    assert sorted(delays) == [(0, 503), (0, 503), (1, 0), (1, 502)]
+
+
+def test_whois_returns_invalid_bodies_as_errors(load_server, mock_upstream, call_tool):
+    server = load_server("rdap")
+    bodies = [b'{"registrar": "Gandi", "events": []}', b'{"registrar": 12}', b"<html>"]
+    mock_upstream(server, lambda request: httpx.Response(200, content=bodies.pop(0)))
+
+    result = asyncio.run(call_tool(server.rdap_whois, "gandi.fr", include_raw=True))
+    assert result["registrar"] == "Gandi" and result["raw"] == {"registrar": "Gandi", "events": []}
+    assert asyncio.run(call_tool(server.rdap_whois, "gandi.fr"))["error"] == "Réponse RDAP invalide"
+    assert asyncio.run(call_tool(server.rdap_whois, "gandi.fr"))["error"] == "Réponse RDAP invalide"
@@ -0,0 +1,194 @@
+import asyncio
+import copy
+import time
+
+import httpx
+import pytest
+
+import runtime
+
+
+class ScriptedTransport(httpx.AsyncBaseTransport):
+    """Answers each request with the next scripted outcome: a status, an exception, or "hang"."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        outcome = self.outcomes.pop(0)
+        if outcome == "hang":
+            await asyncio.Event().wait()
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome, request=request)
+
+
+def send(transport: httpx.AsyncBaseTransport, url: str):
+    return transport.handle_async_request(httpx.Request("GET", url))
+
+
+def test_cancelled_half_open_probe_frees_the_slot(monkeypatch):
+    monkeypatch.setattr(runtime, "BREAKER_RESET_TIMEOUT", 0.0)
+    breaker = runtime.breaker_for("probe.test")
+    for _ in range(runtime.BREAKER_FAILURE_THRESHOLD):
+        breaker.record_failure()
+    assert breaker.state == "open"
+
+    async def scenario():
+        transport = runtime.ResilientTransport(idempotent=False, transport=ScriptedTransport("hang", 200))
+        probe = asyncio.ensure_future(send(transport, "http://probe.test/"))
+        await asyncio.sleep(0.01)
+        assert breaker.state == "half_open" and breaker.probing
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+        assert not breaker.probing
+        response = await send(transport, "http://probe.test/")
+        assert response.status_code == 200
+
+    asyncio.run(scenario())
+    assert breaker.state == "closed"
+
+
+def test_failed_half_open_probe_reopens(monkeypatch):
+    monkeypatch.setattr(runtime, "BREAKER_RESET_TIMEOUT", 0.0)
+    breaker = runtime.breaker_for("reopen.test")
+    for _ in range(runtime.BREAKER_FAILURE_THRESHOLD):
+        breaker.record_failure()
+
+    transport = runtime.ResilientTransport(idempotent=False, transport=ScriptedTransport(503))
+    response = asyncio.run(send(transport, "http://reopen.test/"))
+    assert response.status_code == 503
+    assert breaker.state == "open" and not breaker.probing
+
+
+def timed_send(transport: httpx.AsyncBaseTransport, url: str, read: float):
+    request = httpx.Request("GET", url, extensions={"timeout": {"connect": 5.0, "read": read, "write": 5.0, "pool": 5.0}})
+    return transport.handle_async_request(request)
+
+
+def with_deadline(budget: float, coroutine):
+    async def scenario():
+        token = runtime._deadline.set(time.monotonic() + budget)
+        try:
+            return await coroutine
+        finally:
+            runtime._deadline.reset(token)
+    return scenario()
+
+
+def test_deadline_shortened_timeout_is_not_an_upstream_failure():
+    breaker = runtime.breaker_for("deadline.test")
+    transport = runtime.ResilientTransport(transport=ScriptedTransport(httpx.ReadTimeout("timed out"), 200))
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(with_deadline(1.0, timed_send(transport, "http://deadline.test/", read=10.0)))
+    assert breaker.failures == 0
+
+
+def test_configured_timeout_is_an_upstream_failure(monkeypatch):
+    monkeypatch.setattr(runtime, "RETRY_ATTEMPTS", 1)
+    breaker = runtime.breaker_for("timeout.test")
+    transport = runtime.ResilientTransport(transport=ScriptedTransport(httpx.ReadTimeout("timed out")))
+    with pytest.raises(httpx.ReadTimeout):
+        asyncio.run(with_deadline(30.0, timed_send(transport, "http://timeout.test/", read=10.0)))
+    assert breaker.failures == 1
+
+
+class SlowPrimary(httpx.AsyncBaseTransport):
+    """The upstream answers after 0.2 s, its hedging alternate at once."""
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host != "alternate.test":
+            await asyncio.sleep(0.2)
+        return httpx.Response(200, request=request)
+
+
+def test_hedger_times_lost_first_attempts_not_backups():
+    hedger = runtime.Hedger("test", "http://alternate.test", initial_delay=0.02)
+
+    async def scenario():
+        for _ in range(5):
+            response = await hedger.send(SlowPrimary(), httpx.Request("GET", "http://primary.test/"))
+            assert response.request.url.host == "alternate.test"
+        await asyncio.sleep(0)
+
+    asyncio.run(scenario())
+    assert hedger.stats["hedge_wins"] == hedger.stats["censored"] == 5
+    # Each sample is a lost first attempt, which ran at least until the hedge
+    assert len(hedger.latencies) == 5 and min(hedger.latencies) >= 0.02
+
+
+def test_paced_429_is_retried_without_tripping_the_breaker(monkeypatch):
+    monkeypatch.setattr(runtime, "RETRY_ATTEMPTS", 2)
+    breaker = runtime.breaker_for("paced.test")
+    slept = []
+
+    async def sleep(delay):
+        slept.append(delay)
+    monkeypatch.setattr(runtime.asyncio, "sleep", sleep)
+
+    async def scenario():
+        for _ in range(runtime.BREAKER_FAILURE_THRESHOLD):
+            transport = runtime.ResilientTransport(transport=ScriptedTransport(429, 200), paced=True)
+            assert (await send(transport, "http://paced.test/")).status_code == 200
+
+    asyncio.run(scenario())
+    assert breaker.state == "closed" and breaker.failures == 0
+    assert slept == [0.0] * runtime.BREAKER_FAILURE_THRESHOLD
+
+    transport = runtime.ResilientTransport(idempotent=False, transport=ScriptedTransport(429))
+    asyncio.run(send(transport, "http://paced.test/"))
+    assert breaker.failures == 1
+
+
+class TracedUpstream(httpx.AsyncBaseTransport):
+    """Answers the scripted statuses, reporting the response close to the request's trace like httpcore does."""
+
+    class Body(httpx.AsyncByteStream):
+        def __init__(self, trace):
+            self.trace = trace
+
+        async def __aiter__(self):
+            yield b"{}"
+
+        async def aclose(self):
+            await self.trace("http11.response_closed.complete", {})
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return httpx.Response(self.statuses.pop(0), stream=self.Body(request.extensions["trace"]))
+
+
+def test_http_span_ends_after_the_retries(monkeypatch):
+    monkeypatch.setattr(runtime, "RETRY_MAX_DELAY", 0.0)
+    exported = []
+    # What was exported, not the span (still mutable after it ended)
+    monkeypatch.setattr(runtime.span_exporter, "export", lambda span: exported.append(copy.deepcopy(span.to_dict())))
+
+    async def scenario():
+        async with runtime.http_client(5.0, transport=TracedUpstream(503, 200)) as client:
+            return await client.get("http://traced.test/")
+
+    assert asyncio.run(scenario()).status_code == 200
+    assert len(exported) == 1
+    span = exported[0]
+    assert span["attributes"]["http.status_code"] == 200 and span["error"] is None
+    assert [(e["name"], e["attributes"]["reason"]) for e in span["events"]] == [("retry", "HTTP 503")]
+
+
+def test_http_span_ends_with_the_final_error(monkeypatch):
+    monkeypatch.setattr(runtime, "RETRY_MAX_DELAY", 0.0)
+    exported = []
+    monkeypatch.setattr(runtime.span_exporter, "export", lambda span: exported.append(copy.deepcopy(span.to_dict())))
+    failures = ScriptedTransport(*[httpx.ConnectError("refused")] * runtime.RETRY_ATTEMPTS)
+
+    async def scenario():
+        async with runtime.http_client(5.0, transport=failures) as client:
+            await client.get("http://refused.test/")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(scenario())
+    assert len(exported) == 1 and exported[0]["error"] == "refused"
+    assert len(exported[0]["events"]) == runtime.RETRY_ATTEMPTS - 1
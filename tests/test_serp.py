@@ -0,0 +1,51 @@
+import asyncio
+
+import httpx
+
+
+def test_search_many_isolates_a_malformed_body(load_server, monkeypatch, mock_upstream, call_tool, ctx):
+    server = load_server("serp")
+
+    def answer(request: httpx.Request) -> httpx.Response:
+        if b"broken" in request.content:
+            return httpx.Response(200, content=b'{"results": [42]}')
+        return httpx.Response(200, json={"results": [
+            {"position": 1, "title": "Acme", "url": "https://acme.example", "snippet": "..."},
+            {"position": 2, "title": "Sans lien", "url": None},
+        ]})
+
+    mock_upstream(server, answer)
+    monkeypatch.setattr(server, "serp_cache", server.SerpCache("", 0))
+
+    summary = asyncio.run(call_tool(server.serp_search_many, ["acme", "broken", "acme sas"], ctx))
+
+    assert (summary["succeeded"], summary["failed"]) == (2, 1)
+    assert summary["results"][0]["results"] == [
+        {"position": 1, "title": "Acme", "url": "https://acme.example", "snippet": "..."},
+        {"position": 2, "title": "Sans lien", "url": None},
+    ]
+    assert summary["results"][1]["query"] == "broken" and "error" in summary["results"][1]
+    assert len(ctx.progress) == 3
+
+
+def test_cache_counts_entries_and_bytes_in_memory(load_server, monkeypatch, tmp_path):
+    server = load_server("serp")
+    cache = server.SerpCache(str(tmp_path / "serp.sqlite3"), 1000)
+    monkeypatch.setitem(server.SERP_CACHE_TTLS, "serp_search", 60)
+    results = [{"title": "Acme", "url": "https://acme.example", "snippet": "x" * 100}]
+
+    async def scenario():
+        assert await cache.get("serp_search", "acme") is None
+        await cache.put("serp_search", "acme", results)
+        await cache.put("serp_search", "acme", results)
+        assert await cache.get("serp_search", "acme") == results
+        for i in range(10):
+            await cache.put("serp_search", f"other {i}", results)
+
+    asyncio.run(scenario())
+    snapshot = cache.snapshot()
+    assert snapshot["evictions"] > 0 and snapshot["bytes"] <= 1000
+    assert (snapshot["entries"], snapshot["bytes"]) == cache.db.execute(
+        "SELECT count(*), sum(size) FROM serp_cache"
+    ).fetchone()
+    assert (snapshot["hits"], snapshot["misses"]) == (1, 1)
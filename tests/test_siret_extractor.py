@@ -0,0 +1,109 @@
+import asyncio
+
+import httpx
+import pytest
+
+import mock_upstreams
+import runtime
+
+
+@pytest.fixture
+def server(load_server):
+    return load_server("siret-extractor")
+
+
+@pytest.fixture
+def fetch_site(mock_app):
+    def fetch(path: str) -> str:
+        async def get():
+            async with httpx.AsyncClient(transport=mock_app, base_url="http://mock") as client:
+                return (await client.get(path)).text
+        return asyncio.run(get())
+    return fetch
+
+
+@pytest.mark.parametrize("n", [3, 4, 6, 7])
+def test_extracts_mock_site_identifiers(server, fetch_site, n):
+    identifiers = server.extract_identifiers(fetch_site(f"/site/{n}/infos-legales"))
+    siren = mock_upstreams.fake_siren(n)
+    assert identifiers["siren"] == siren
+    assert identifiers["tva"] == server.tva_number(siren)
+    # Sites n % 3 == 0 publish a spaced SIRET, the others only RCS and VAT numbers
+    assert identifiers["siret"] == (mock_upstreams.fake_siret(n) if n % 3 == 0 else None)
+
+
+def test_ignores_pages_without_valid_identifiers(server, fetch_site):
+    # The homepage embeds a 14-digit id in a script, the contact page a phone number
+    assert server.extract_identifiers(fetch_site("/site/3/")) is None
+    assert server.extract_identifiers(fetch_site("/site/3/contact")) is None
+
+
+def test_siret_separators_and_checksums(server):
+    siret = mock_upstreams.fake_siret(1)
+    dotted = f"{siret[:3]}.{siret[3:6]}.{siret[6:9]}.{siret[9:]}"
+    assert server.valid_siret(siret)
+    assert server.extract_identifiers(f"<p>SIRET : {dotted}</p>")["siret"] == siret
+    assert server.extract_identifiers(f"<p>SIRET&nbsp;: {siret[:3]}&nbsp;{siret[3:6]} {siret[6:9]} {siret[9:]}</p>")["siret"] == siret
+
+    broken = siret[:-1] + str((int(siret[-1]) + 1) % 10)
+    assert not server.valid_siret(broken)
+    assert server.extract_identifiers(f"<p>SIRET : {broken}</p>") is None
+    assert not server.valid_siret("1234567890123") and not server.valid_siret("1234567890123a")
+    # La Poste establishments: digit sum multiple of 5 instead of Luhn
+    assert not server.luhn_valid("35600000000001") and server.valid_siret("35600000000001")
+
+
+def test_crawl_survives_invalid_links(server, monkeypatch, mock_app):
+    monkeypatch.setattr(server, "crawl_pool", mock_app)
+    before = set(runtime.breakers)
+
+    crawl = asyncio.run(server.local_extract("http://mock/site/3/"))
+
+    assert crawl["found"] and crawl["siren"] == mock_upstreams.fake_siren(3)
+    assert crawl["source_page"] == "http://mock/site/3/infos-legales"
+    assert set(runtime.breakers) == before
+    assert server.legal_links('<a href="http://[::1/mentions">Mentions</a><a href="cgv">CGV</a>', "http://mock/") == [
+        "http://mock/cgv"
+    ]
+
+
+def test_bare_numbers_rank_below_labelled_identifiers(server, monkeypatch):
+    order_id, siret = mock_upstreams.fake_siret(2), mock_upstreams.fake_siret(5)
+    assert server.extract_identifiers(f"<p>Commande n° {order_id}</p>")["contextual"] is False
+    assert server.extract_identifiers(f"<p>SIRET {siret}</p>")["contextual"] is True
+    # A bare number belonging to the labelled SIREN completes it
+    labelled = server.extract_identifiers(f"<p>RCS Paris {siret[:3]} {siret[3:6]} {siret[6:9]}</p><p>{siret}</p>")
+    assert (labelled["siren"], labelled["siret"], labelled["contextual"]) == (siret[:9], siret, True)
+
+    pages = {
+        "/": f'<p>Commande n° {order_id}</p><a href="/mentions">Mentions</a>',
+        "/mentions": f"<p>SIRET : {siret}</p>"
+    }
+    site = httpx.MockTransport(lambda request: httpx.Response(
+        200, text=pages[request.url.path], headers={"content-type": "text/html"}
+    ) if request.url.path in pages else httpx.Response(404))
+    monkeypatch.setattr(server, "crawl_pool", site)
+
+    crawl = asyncio.run(server.local_extract("http://shop.test/"))
+    assert (crawl["siret"], crawl["source_page"]) == (siret, "http://shop.test/mentions")
+
+    # With no labelled identifier anywhere, the bare number is still returned
+    pages["/mentions"] = "<p>Mentions légales</p>"
+    crawl = asyncio.run(server.local_extract("http://shop.test/"))
+    assert (crawl["siret"], crawl["source_page"]) == (order_id, "http://shop.test/")
+
+
+class ClosingPool(httpx.AsyncBaseTransport):
+    closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+def test_shutdown_closes_the_crawl_pool(server, monkeypatch):
+    assert server.crawl_pool in server.warmup.pools
+    upstream, crawl = ClosingPool(), ClosingPool()
+    monkeypatch.setattr(runtime, "upstream_pool", upstream)
+
+    asyncio.run(runtime.Warmup([], pools=[crawl]).stop())
+    assert upstream.closed and crawl.closed
@@ -0,0 +1,194 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+
+class FakeSupabase:
+    """SQL RPC over a 6-row table, and a Storage that fails (or hangs) on one part."""
+
+    def __init__(self, failing_part: str, hang: bool = False):
+        self.failing_part = failing_part
+        self.hang = hang
+        self.uploaded = []
+        self.deleted = []
+        self.pages = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        if request.url.path == "/rest/v1/rpc/execute_sql":
+            if "pg_attribute" in json.loads(request.content)["query"]:
+                return httpx.Response(200, json=[
+                    {"column_name": "id", "column_type": "integer", "key_position": 1, "reltuples": 6},
+                    {"column_name": "name", "column_type": "text", "key_position": 0, "reltuples": 6}
+                ])
+            self.pages += 1
+            rows = [i for i in (2 * self.pages - 1, 2 * self.pages) if i <= 6]
+            return httpx.Response(200, json=[{"id": i, "name": f"row {i}"} for i in rows])
+        if request.method == "DELETE":
+            self.deleted.extend(json.loads(request.content)["prefixes"])
+            return httpx.Response(200, json=[])
+        if request.url.path.endswith(self.failing_part):
+            if self.hang:
+                await asyncio.Event().wait()
+            return httpx.Response(403, text="denied")
+        self.uploaded.append(request.url.path)
+        return httpx.Response(200, json={})
+
+
+@pytest.fixture
+def server(load_server, monkeypatch):
+    server = load_server("supabase")
+    monkeypatch.setattr(server, "EXPORT_CHUNK_ROWS", 2)
+    return server
+
+
+def test_failed_export_deletes_its_parts(server, mock_upstream, call_tool, ctx):
+    storage = FakeSupabase("part-00002.ndjson.gz")
+    mock_upstream(server, storage)
+
+    result = asyncio.run(call_tool(server.export_table, "items", "exports", ctx))
+
+    assert not result["success"] and "Upload of" in result["error"]
+    assert "orphaned_parts" not in result
+    assert any(path.endswith("part-00001.ndjson.gz") for path in storage.uploaded)
+    # Part 2 failed while part 3 was being read: part 3 was never uploaded
+    assert [path.rsplit("/", 1)[-1] for path in storage.deleted] == [
+        "part-00001.ndjson.gz", "part-00002.ndjson.gz", "manifest.json"
+    ]
+
+
+def test_cancelled_export_stops_the_upload_and_deletes_its_parts(server, mock_upstream, call_tool, ctx):
+    storage = FakeSupabase("part-00003.ndjson.gz", hang=True)
+    mock_upstream(server, storage)
+
+    async def scenario():
+        export = asyncio.ensure_future(call_tool(server.export_table, "items", "exports", ctx))
+        while storage.pages < 4:
+            await asyncio.sleep(0.01)
+        export.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await export
+
+    asyncio.run(scenario())
+    assert len(storage.deleted) == 4 and storage.deleted[-1].endswith("manifest.json")
+
+
+class WatermarkedTable:
+    """SQL RPC over an (id, updated_at) table read in (updated_at, id) order, and an in-memory Storage."""
+
+    def __init__(self, rows, chunk_rows):
+        self.rows = rows
+        self.chunk_rows = chunk_rows
+        self.objects = {}
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if path == "/rest/v1/rpc/execute_sql":
+            body = json.loads(request.content)
+            if "pg_attribute" in body["query"]:
+                return httpx.Response(200, json=[
+                    {"column_name": "id", "column_type": "integer", "key_position": 1, "reltuples": len(self.rows)},
+                    {"column_name": "updated_at", "column_type": "integer", "key_position": 0, "reltuples": len(self.rows)}
+                ])
+            if "max(" in body["query"]:
+                return httpx.Response(200, json=[{"value": str(max(t for _, t in self.rows))}])
+            to, *after = [int(p) for p in body["params"]]
+            rows = sorted((t, i) for i, t in self.rows if t <= to and (t, i) > tuple(after))
+            return httpx.Response(200, json=[{"id": i, "updated_at": t} for t, i in rows[:self.chunk_rows]])
+        name = path.removeprefix("/storage/v1/object/exports/")
+        if request.method == "GET":
+            return httpx.Response(200, content=self.objects[name]) if name in self.objects else httpx.Response(404)
+        self.objects[name] = request.content
+        return httpx.Response(200, json={})
+
+
+def test_incremental_export_keeps_rows_tied_with_the_watermark(server, mock_upstream, call_tool, ctx):
+    table = WatermarkedTable([(1, 1), (2, 2), (3, 2)], server.EXPORT_CHUNK_ROWS)
+    mock_upstream(server, table)
+
+    def export():
+        return asyncio.run(call_tool(server.export_table, "items", "exports", ctx, watermark_column="updated_at"))
+
+    assert export()["rows"] == 3
+    assert json.loads(table.objects["exports/public.items/watermark.json"]) == {"value": 2, "key": {"id": 3}}
+
+    # Written after the first export, with the maximum it stored
+    table.rows.append((4, 2))
+    result = export()
+    assert result["rows"] == 1 and result["watermark"]["from"] == 2
+    assert json.loads(table.objects["exports/public.items/watermark.json"]) == {"value": 2, "key": {"id": 4}}
+
+    manifests = sum(name.endswith("manifest.json") for name in table.objects)
+    assert export() == {"success": True, "rows": 0, "parts": [], "watermark": {"column": "updated_at", "from": 2, "to": "2"}}
+    assert sum(name.endswith("manifest.json") for name in table.objects) == manifests
+
+
+def test_normalize_sql_keeps_quoted_text(server):
+    assert server.normalize_sql("SELECT  *\n  FROM Users\tWHERE name = 'Jean  DUPONT' AND \"Ville\" = 'x';;") == (
+        "select * from users where name = 'Jean  DUPONT' and \"Ville\" = 'x'"
+    )
+    # Dollar-quoted bodies are only trimmed
+    body = "DO $$ BEGIN  PERFORM 1; END $$;"
+    assert server.normalize_sql(f"  {body}  ") == body.rstrip(";")
+
+
+def test_query_cache_skips_volatile_queries(server):
+    cache = server.QueryCache(60, 1000)
+    for sql in ("select now()", "select * from events where at > current_date", "select gen_random_uuid()"):
+        cache.put(cache.key(sql, None), [], 10)
+    assert cache.entries == {}
+    cache.put(cache.key("select * from users where id = $1", [1]), [{"id": 1}], 10)
+    assert cache.get(cache.key("select * from users where id = $1", [1])) == [{"id": 1}]
+    assert cache.get(cache.key("select * from users where id = $1", [2])) is None
+
+
+def test_query_cache_invalidates_the_written_tables(server):
+    cache = server.QueryCache(60, 1000)
+    reads = {
+        "users": "select * from public.users",
+        "join": "select * from orders o join \"Users\" u on u.id = o.user_id",
+        "orders": "select count(*) from orders",
+    }
+    for sql in reads.values():
+        cache.put(cache.key(sql, None), [], 10)
+
+    cache.invalidate(server.normalize_sql("UPDATE public.Users SET name = 'x' WHERE id = 1"))
+    assert [key[0] for key in cache.entries] == [reads["orders"]]
+    # A write whose tables are unknown drops everything
+    cache.invalidate(server.normalize_sql("SELECT archive_everything()"))
+    assert cache.entries == {} and cache.snapshot()["invalidations"] == 3
+
+
+def test_query_cache_evicts_least_recently_used_within_its_byte_bound(server):
+    cache = server.QueryCache(60, 100)
+    first, second, third = (cache.key(f"select * from t{i}", None) for i in range(3))
+    cache.put(first, 1, 40)
+    cache.put(second, 2, 40)
+    assert cache.get(first) == 1
+    cache.put(third, 3, 40)
+
+    assert list(cache.entries) == [first, third] and cache.bytes == 80
+    cache.put(cache.key("select * from huge", None), [], 101)
+    assert cache.snapshot() == {"entries": 2, "bytes": 80, "hits": 1, "misses": 0, "evictions": 1, "invalidations": 0}
+
+
+def test_execute_sql_serves_reads_from_the_cache_until_a_write(server, monkeypatch, mock_upstream):
+    monkeypatch.setattr(server, "query_cache", server.QueryCache(60, 1000))
+    queries = []
+
+    def rpc(request: httpx.Request) -> httpx.Response:
+        queries.append(json.loads(request.content)["query"])
+        return httpx.Response(200, json=[{"n": len(queries)}])
+    mock_upstream(server, rpc)
+
+    async def scenario():
+        first = await server._execute_sql("SELECT n FROM counters")
+        cached = await server._execute_sql("select n\n from counters;")
+        await server._execute_sql("UPDATE counters SET n = n + 1", read_only=False)
+        fresh = await server._execute_sql("SELECT n FROM counters")
+        return first, cached, fresh
+
+    first, cached, fresh = asyncio.run(scenario())
+    assert cached == {"success": True, "data": first["data"], "cached": True}
+    assert fresh == {"success": True, "data": [{"n": 3}]} and len(queries) == 3
@@ -0,0 +1,83 @@
+import asyncio
+import collections
+
+import httpx
+
+import runtime
+
+
+class Origins(httpx.AsyncBaseTransport):
+    """Stands in for the upstream pool: counts the warm-up connections, refusing some hosts."""
+
+    def __init__(self, refused=()):
+        self.refused = refused
+        self.connections = collections.Counter()
+        self.closed = False
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.url.host in self.refused:
+            raise httpx.ConnectError("refused")
+        self.connections[str(request.url)] += 1
+        return httpx.Response(405)
+
+    async def aclose(self):
+        self.closed = True
+
+
+def ready(warmup: runtime.Warmup) -> httpx.Response:
+    async def probe():
+        app = runtime.BasicAuthMiddleware(None, warmup)
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app), base_url="http://mcp") as client:
+            return await client.get("/ready")
+    return asyncio.run(probe())
+
+
+def test_ready_answers_503_until_every_origin_is_warmed(monkeypatch):
+    pool = Origins(refused={"down.test"})
+    monkeypatch.setattr(runtime, "upstream_pool", pool)
+    monkeypatch.setattr(runtime, "WARMUP_INTERVAL", 0)
+    warmup = runtime.Warmup(["https://api.test/search?q=x", "https://api.test/other", "http://down.test", ""])
+    assert warmup.origins == ["http://down.test/", "https://api.test/"]
+
+    response = ready(warmup)
+    assert response.status_code == 503 and response.json()["status"] == "warming"
+
+    asyncio.run(warmup.run())
+
+    response = ready(warmup)
+    assert response.status_code == 200 and response.json()["status"] == "ready"
+    assert pool.connections == {"https://api.test/": runtime.WARMUP_CONNECTIONS}
+    upstreams = response.json()["upstreams"]
+    # A failed origin is reported, it does not hold readiness back
+    assert upstreams["https://api.test/"]["ok"] and not upstreams["http://down.test/"]["ok"]
+
+
+def test_lifespan_starts_the_warmup_and_closes_the_pools(monkeypatch):
+    pool, crawl = Origins(), Origins()
+    monkeypatch.setattr(runtime, "upstream_pool", pool)
+    monkeypatch.setattr(runtime, "WARMUP_INTERVAL", 60)
+    warmup = runtime.Warmup(["https://api.test"], pools=[crawl])
+
+    async def app(scope, receive, send):
+        for reply in ("lifespan.startup.complete", "lifespan.shutdown.complete"):
+            await receive()
+            if reply == "lifespan.startup.complete":
+                # Warm-up runs in the background: startup does not wait for it
+                assert warmup._task is not None and not warmup.ready
+                await asyncio.sleep(0.01)
+            await send({"type": reply})
+
+    async def lifespan():
+        messages = asyncio.Queue()
+        for message in ("lifespan.startup", "lifespan.shutdown"):
+            messages.put_nowait({"type": message})
+        sent = []
+
+        async def send(message):
+            sent.append(message["type"])
+        await runtime.LifespanMiddleware(app, warmup)({"type": "lifespan"}, messages.get, send)
+        return sent
+
+    assert asyncio.run(lifespan()) == ["lifespan.startup.complete", "lifespan.shutdown.complete"]
+    assert warmup.ready and warmup._task is None
+    assert pool.closed and crawl.closed